@@ -1,11 +1,13 @@
 """
 Edibes Leltár - Automata feltöltő leltárkezelő rendszer
 """
-from flask import Flask
+from flask import Flask, g, request
 from flask_login import LoginManager
 from app.database import init_db, get_db_session
 from app.config import Config
+from app import assets, metrics
 import os
+import time
 
 login_manager = LoginManager()
 
@@ -29,6 +31,37 @@ def create_app(config_class=Config):
     with app.app_context():
         init_db()
     
+    # Statikus fájlok: hash-es nevek a build manifestből (scripts/build_assets.py)
+    assets.init_app(app)
+    
+    # Metrikák: kérés késleltetés végpontonként
+    metrics.configure(app.config['METRICS_DIR'])
+    
+    @app.before_request
+    def _metrics_start_timer():
+        g.request_started = time.perf_counter()
+    
+    @app.after_request
+    def _metrics_record_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'
+            metrics.observe('edibes_http_request_duration_seconds',
+                            time.perf_counter() - started,
+                            {'endpoint': endpoint, 'method': request.method})
+            metrics.inc('edibes_http_requests_total',
+                        {'endpoint': endpoint, 'status': str(response.status_code)})
+            metrics.maybe_flush()
+        return response
+    
+    # Beágyazott feladat worker: az első kérésnél indul (CLI parancsoknál nem)
+    if app.config['JOBS_EMBEDDED_WORKER']:
+        from app import jobs
+        
+        @app.before_request
+        def _start_embedded_worker():
+            jobs.ensure_embedded_worker(app)
+    
     # Blueprint-ek regisztrálása
     from app.routes.auth import auth_bp
     from app.routes.products import products_bp
@@ -37,6 +70,11 @@ def create_app(config_class=Config):
     from app.routes.backup import backup_bp
     from app.routes.locations import locations_bp
     from app.routes.transfer import transfer_bp
+    from app.routes.metrics import metrics_bp
+    from app.routes.catalog import catalog_bp
+    from app.routes.jobs import jobs_bp
+    from app.routes.reports import reports_bp
+    from app.routes.documents import documents_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(products_bp)
@@ -45,5 +83,10 @@ def create_app(config_class=Config):
     app.register_blueprint(backup_bp)
     app.register_blueprint(locations_bp)
     app.register_blueprint(transfer_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(catalog_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(reports_bp)
+    app.register_blueprint(documents_bp)
     
     return app
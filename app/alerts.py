@@ -0,0 +1,235 @@
+"""
+Helyszínenkénti alacsony készlet riasztások (location_inventory.min_stock_level)
+
+A riasztások állapota a stock_alerts táblában van: pár (termék × helyszín)
+nyitott riasztása, amíg a készlet a küszöb alatt van; zárt riasztások az
+előzményhez. A küszöb a helyszín minimum szintje, előrejelzéssel rendelkező
+automata párnál legalább COVER_WARNING_DAYS napi várható fogyás (a készlet
+kevesebb mint ennyi napra elég) - a riasztás min_level oszlopa ez a küszöb. Kiértékelés csak a változott párokra: a
+location_inventory triggerei minden mennyiségváltozást a stock_events táblába
+írnak (SSE), a riasztás motor az alert_state vízjel óta érkezett események
+párjait értékeli újra - a költség a változások számával arányos, nem a
+termékek × helyszínek számával.
+
+Teljes kiértékelés csak az első futáskor, illetve ha a vízjel óta már törölt
+(lejárt) események is voltak. A minimum szint szerkesztése nem generál
+eseményt, ott a hívó közvetlenül értékeli a párt (evaluate); az előrejelzés
+frissítése után az előrejelzéses párokat a feladat értékeli újra
+(evaluate_forecasts).
+"""
+from app import forecast, stock_events
+
+# Ennyi nyitott riasztást adunk vissza legfeljebb (lista végpont, dashboard)
+MAX_LISTED_ALERTS = 200
+
+
+def init_schema(db):
+    """Riasztás táblák létrehozása (init_db hívja)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS stock_alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            quantity REAL NOT NULL,
+            min_level REAL NOT NULL,
+            daily_rate REAL,
+            opened_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES products(id),
+            FOREIGN KEY (location_id) REFERENCES locations(id)
+        )
+    ''')
+    # Páronként legfeljebb egy nyitott riasztás; a nyitottak listázása ebből az indexből
+    db.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_alerts_open
+        ON stock_alerts(location_id, product_id) WHERE closed_at IS NULL
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS alert_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_event_id INTEGER,
+            updated_at TIMESTAMP
+        )
+    ''')
+    db.execute('INSERT OR IGNORE INTO alert_state (id, last_event_id) VALUES (1, NULL)')
+
+    # Migráció: előrejelzett napi fogyás a korábbi (csak minimum szintes) riasztásokhoz
+    columns = {row[1] for row in db.execute('PRAGMA table_info(stock_alerts)')}
+    if 'daily_rate' not in columns:
+        db.execute('ALTER TABLE stock_alerts ADD COLUMN daily_rate REAL')
+
+
+def evaluate(db, pairs=None):
+    """
+    Riasztások kiértékelése a megadott (product_id, location_id) párokra, None = minden pár
+    A hívó tranzakciójában fut (nem commitol).
+    Visszatér: (megnyitott, lezárt) riasztások száma
+    """
+    _reset_pairs(db)
+    if pairs is None:
+        db.execute('''
+            INSERT OR IGNORE INTO temp.alert_pairs (product_id, location_id)
+            SELECT product_id, location_id FROM location_inventory
+            UNION
+            SELECT product_id, location_id FROM stock_alerts WHERE closed_at IS NULL
+        ''')
+    else:
+        db.executemany('''
+            INSERT OR IGNORE INTO temp.alert_pairs (product_id, location_id) VALUES (?, ?)
+        ''', pairs)
+    return _apply(db)
+
+
+def _reset_pairs(db):
+    """A kiértékelendő párok temp táblája (kapcsolatonként), üresen"""
+    db.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS alert_pairs (
+            product_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            PRIMARY KEY (location_id, product_id)
+        ) WITHOUT ROWID
+    ''')
+    db.execute('DELETE FROM temp.alert_pairs')
+
+
+def _apply(db):
+    """A temp.alert_pairs párok riasztásainak nyitása / frissítése / zárása"""
+    # Küszöb: minimum szint, illetve az előrejelzett fogyás COVER_WARNING_DAYS napra (a nagyobb)
+    low = '''
+        SELECT product_id, location_id, quantity, threshold AS min_stock_level, daily_rate
+        FROM (
+            SELECT li.product_id, li.location_id, li.quantity, f.daily_rate,
+                   MAX(COALESCE(li.min_stock_level, 0), COALESCE(f.daily_rate, 0) * :cover_days) AS threshold
+            FROM temp.alert_pairs ap
+            JOIN location_inventory li ON li.product_id = ap.product_id AND li.location_id = ap.location_id
+            LEFT JOIN demand_forecasts f ON f.location_id = li.location_id AND f.product_id = li.product_id
+        )
+        WHERE threshold > 0 AND quantity < threshold
+    '''
+    params = {'cover_days': forecast.COVER_WARNING_DAYS}
+
+    closed = db.execute(f'''
+        UPDATE stock_alerts SET closed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP,
+            quantity = COALESCE((
+                SELECT li.quantity FROM location_inventory li
+                WHERE li.product_id = stock_alerts.product_id AND li.location_id = stock_alerts.location_id
+            ), 0)
+        WHERE closed_at IS NULL
+          AND (location_id, product_id) IN (SELECT location_id, product_id FROM temp.alert_pairs)
+          AND (location_id, product_id) NOT IN (SELECT location_id, product_id FROM ({low}))
+    ''', params).rowcount
+
+    # Nyitva maradók: aktuális mennyiség, küszöb és napi fogyás
+    db.execute(f'''
+        UPDATE stock_alerts SET quantity = low.quantity, min_level = low.min_stock_level,
+            daily_rate = low.daily_rate, updated_at = CURRENT_TIMESTAMP
+        FROM ({low}) AS low
+        WHERE stock_alerts.closed_at IS NULL
+          AND stock_alerts.location_id = low.location_id AND stock_alerts.product_id = low.product_id
+          AND (stock_alerts.quantity != low.quantity OR stock_alerts.min_level != low.min_stock_level
+               OR stock_alerts.daily_rate IS NOT low.daily_rate)
+    ''', params)
+
+    opened = db.execute(f'''
+        INSERT INTO stock_alerts (product_id, location_id, quantity, min_level, daily_rate)
+        SELECT low.product_id, low.location_id, low.quantity, low.min_stock_level, low.daily_rate
+        FROM ({low}) AS low
+        WHERE NOT EXISTS (
+            SELECT 1 FROM stock_alerts sa
+            WHERE sa.closed_at IS NULL
+              AND sa.location_id = low.location_id AND sa.product_id = low.product_id
+        )
+    ''', params).rowcount
+    return opened, closed
+
+
+def refresh(db):
+    """
+    A vízjel óta változott párok újraértékelése (commit)
+    Ha nincs új esemény, írási zár nélkül tér vissza.
+    Visszatér: (megnyitott, lezárt) riasztások száma
+    """
+    row = db.execute('SELECT last_event_id FROM alert_state WHERE id = 1').fetchone()
+    if row and row[0] is not None and row[0] >= stock_events.current_event_id(db):
+        return 0, 0
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        last_event_id = db.execute('SELECT last_event_id FROM alert_state WHERE id = 1').fetchone()[0]
+        current_id = stock_events.current_event_id(db)
+        oldest = db.execute('SELECT MIN(id) FROM stock_events').fetchone()[0]
+
+        if last_event_id is None or (oldest is not None and oldest > last_event_id + 1):
+            # Első futás, vagy a köztes események már törlődtek: teljes kiértékelés
+            result = evaluate(db)
+        else:
+            _reset_pairs(db)
+            db.execute('''
+                INSERT OR IGNORE INTO temp.alert_pairs (product_id, location_id)
+                SELECT product_id, location_id FROM stock_events WHERE id > ? AND id <= ?
+            ''', (last_event_id, current_id))
+            result = _apply(db)
+
+        db.execute('''
+            UPDATE alert_state SET last_event_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = 1
+        ''', (current_id,))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+
+def evaluate_forecasts(db):
+    """
+    Az előrejelzéses párok (és a nyitott riasztások) újraértékelése az előrejelzés frissítése
+    után (commit) - a napi fogyás változása nem generál készlet eseményt
+    Visszatér: (megnyitott, lezárt) riasztások száma
+    """
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        _reset_pairs(db)
+        db.execute('''
+            INSERT OR IGNORE INTO temp.alert_pairs (product_id, location_id)
+            SELECT product_id, location_id FROM demand_forecasts
+            UNION
+            SELECT product_id, location_id FROM stock_alerts WHERE closed_at IS NULL
+        ''')
+        result = _apply(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+
+def active_alerts(db, location_id=None, limit=MAX_LISTED_ALERTS):
+    """Nyitott riasztások (törölt termékek / helyszínek nélkül), a legnagyobb hiány elöl"""
+    query = '''
+        SELECT sa.id, sa.product_id, sa.location_id, sa.quantity, sa.min_level, sa.daily_rate, sa.opened_at,
+               p.name AS product_name, p.barcode, u.abbreviation AS unit_abbr,
+               l.name AS location_name, l.location_type
+        FROM stock_alerts sa
+        JOIN products p ON p.id = sa.product_id AND p.is_deleted = 0
+        JOIN locations l ON l.id = sa.location_id AND l.is_deleted = 0
+        LEFT JOIN units u ON u.id = p.unit_id
+        WHERE sa.closed_at IS NULL
+    '''
+    params = []
+    if location_id:
+        query += ' AND sa.location_id = ?'
+        params.append(location_id)
+    query += ' ORDER BY sa.quantity / sa.min_level, l.name, p.name LIMIT ?'
+    params.append(limit)
+    return db.execute(query, params).fetchall()
+
+
+def active_count(db):
+    """Nyitott riasztások száma"""
+    return db.execute('''
+        SELECT COUNT(*) FROM stock_alerts sa
+        JOIN products p ON p.id = sa.product_id AND p.is_deleted = 0
+        JOIN locations l ON l.id = sa.location_id AND l.is_deleted = 0
+        WHERE sa.closed_at IS NULL
+    ''').fetchone()[0]
@@ -0,0 +1,123 @@
+"""
+Statikus fájlok: helyben tárolt külső csomagok, bundle-ök, tartalom hash-es nevek
+
+A scripts/build_assets.py (Docker build, telepítés) állítja elő:
+- static/vendor: a Bootstrap, ikonok és vonalkód olvasó fájljai a CDN helyett,
+- static/dist: a bundle-ök (BUNDLES) összefűzve és minifikálva, valamint minden
+  static/css és static/js fájl külön is, tartalom hash-es névvel
+  (pl. dist/base.3f9c1a2b7e4d.css), mellettük előtömörített .gz (és .br) változat,
+- static/dist/manifest.json: forrás / bundle név -> hash-es név.
+
+A név a tartalommal együtt változik, ezért a dist fájlok "immutable"-ként, egy
+évig cache-elhetők (nginx közvetlenül szolgálja ki, lásd nginx/nginx.conf).
+
+Futásidőben (init_app):
+- url_for('static', filename='js/stock-stream.js') a hash-es fájlra mutat,
+- a template-ek asset_urls('base.css') hívással kapják a bundle URL-jét.
+Build nélkül (fejlesztés) a forrásfájlok töltődnek, a le nem töltött külső
+csomagok pedig a CDN-ről.
+"""
+import json
+import os
+
+from flask import current_app, url_for
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# A dist fájlok cache ideje (másodperc), ha Flask szolgálja ki (nginx nélkül)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Külső csomagok: static-on belüli útvonal -> rögzített verziójú CDN cím
+# (az ikon CSS a fonts/ könyvtárra relatívan hivatkozik, ezért az útvonal megegyezik)
+VENDOR = {
+    'vendor/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css',
+    'vendor/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons.css': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/bootstrap-icons.css',
+    'vendor/fonts/bootstrap-icons.woff2': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/fonts/bootstrap-icons.woff2',
+    'vendor/fonts/bootstrap-icons.woff': 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.1/font/fonts/bootstrap-icons.woff',
+    'vendor/html5-qrcode.min.js': 'https://unpkg.com/html5-qrcode@2.3.8/html5-qrcode.min.js',
+}
+
+# Bundle név -> források sorrendben (static-on belüli útvonalak)
+BUNDLES = {
+    # A bejelentkezés oldal saját stílusokkal, a style.css nélkül
+    'vendor.css': ['vendor/bootstrap.min.css', 'vendor/bootstrap-icons.css'],
+    'vendor.js': ['vendor/bootstrap.bundle.min.js'],
+    'base.css': ['vendor/bootstrap.min.css', 'vendor/bootstrap-icons.css', 'css/style.css'],
+    'base.js': ['vendor/bootstrap.bundle.min.js', 'js/app.js'],
+    'scanner.js': ['vendor/html5-qrcode.min.js', 'js/barcode-scanner.js'],
+}
+
+# Service worker app shell (static/sw.js): telepítéskor előre cache-elt bundle-ök és fájlok
+SHELL_BUNDLES = ('base.css', 'base.js', 'scanner.js')
+SHELL_FILES = ('js/stock-stream.js', 'js/offline-queue.js', 'js/catalog-cache.js', 'js/barcode-worker.js',
+               'vendor/fonts/bootstrap-icons.woff2')
+
+
+def load_manifest(static_folder):
+    """A build manifest (files, bundles), vagy None, ha nem volt build"""
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def init_app(app):
+    manifest = load_manifest(app.static_folder)
+    app.extensions['assets'] = manifest
+
+    if manifest:
+        files = manifest['files']
+
+        @app.url_defaults
+        def _fingerprinted_static(endpoint, values):
+            if endpoint == 'static':
+                hashed = files.get(values.get('filename'))
+                if hashed:
+                    values['filename'] = hashed
+
+    # A dist fájlok neve a tartalommal változik - nginx nélkül is hosszú cache
+    default_max_age = app.get_send_file_max_age
+
+    def get_send_file_max_age(filename):
+        if filename and filename.startswith(DIST_DIR + '/'):
+            return IMMUTABLE_MAX_AGE
+        return default_max_age(filename)
+
+    app.get_send_file_max_age = get_send_file_max_age
+    app.jinja_env.globals['asset_urls'] = asset_urls
+
+
+def build_id():
+    """A statikus build azonosítója (üres, ha nincs build) - a HTML a hash-es nevekre hivatkozik"""
+    manifest = current_app.extensions.get('assets')
+    return manifest.get('build', '') if manifest else ''
+
+
+def asset_urls(bundle):
+    """
+    Egy bundle betöltendő URL-jei: build után egyetlen hash-es fájl,
+    build nélkül a források (a hiányzó külső csomagok CDN-ről)
+    """
+    manifest = current_app.extensions.get('assets')
+    if manifest and bundle in manifest['bundles']:
+        return [url_for('static', filename=manifest['bundles'][bundle])]
+
+    urls = []
+    for source in BUNDLES[bundle]:
+        if source in VENDOR and not os.path.exists(os.path.join(current_app.static_folder, source)):
+            urls.append(VENDOR[source])
+        else:
+            urls.append(url_for('static', filename=source))
+    return urls
+
+
+def shell_urls():
+    """Az app shell saját originű URL-jei (build nélkül a CDN-ről jövő fájlok kimaradnak)"""
+    urls = [url for bundle in SHELL_BUNDLES for url in asset_urls(bundle)]
+    urls += [url_for('static', filename=path) for path in SHELL_FILES
+             if os.path.exists(os.path.join(current_app.static_folder, path))]
+    return [url for url in urls if url.startswith('/')]
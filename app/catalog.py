@@ -0,0 +1,107 @@
+"""
+Törzsadat (katalógus) verziózás - delta szinkronhoz és ETag-ekhez
+
+A products, locations, categories és units táblák minden sora kap egy
+row_version oszlopot. Triggerek minden beszúrásnál és módosításnál a
+catalog_seq globális számlálót növelik, és az új értéket írják a sorba.
+Így egy kliens a "since=<verzió>" paraméterrel csak a megváltozott sorokat
+kéri le, a tábla aktuális verziója (MAX(row_version)) pedig ETag-ként
+szolgál. Törlés csak logikai (is_deleted), ezért az is delta változás.
+"""
+
+# Katalógus típusok: név -> (tábla, delta válaszban küldött oszlopok)
+CATALOGS = {
+    'products': ('products', (
+        'id', 'name', 'barcode', 'category_id', 'unit_id', 'package_size',
+        'min_stock_level', 'is_deleted', 'updated_at', 'row_version'
+    )),
+    'locations': ('locations', (
+        'id', 'name', 'location_type', 'is_active', 'is_deleted', 'updated_at', 'row_version'
+    )),
+    'categories': ('categories', (
+        'id', 'name', 'is_deleted', 'updated_at', 'row_version'
+    )),
+    'units': ('units', (
+        'id', 'name', 'abbreviation', 'is_deleted', 'updated_at', 'row_version'
+    )),
+}
+
+
+def init_schema(db):
+    """catalog_seq tábla, row_version oszlopok és triggerek (init_db hívja)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    db.execute('INSERT OR IGNORE INTO catalog_seq (id, version) VALUES (1, 0)')
+
+    for table, _ in CATALOGS.values():
+        columns = [row[1] for row in db.execute(f'PRAGMA table_info({table})').fetchall()]
+        if 'row_version' not in columns:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0')
+
+        db.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_row_version ON {table}(row_version)')
+
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_insert
+            AFTER INSERT ON {table}
+            BEGIN
+                UPDATE catalog_seq SET version = version + 1 WHERE id = 1;
+                UPDATE {table} SET row_version = (SELECT version FROM catalog_seq WHERE id = 1)
+                WHERE id = NEW.id;
+            END
+        ''')
+        # A trigger saját UPDATE-je nem indítja újra (row_version változik)
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_update
+            AFTER UPDATE ON {table}
+            WHEN NEW.row_version IS OLD.row_version
+            BEGIN
+                UPDATE catalog_seq SET version = version + 1 WHERE id = 1;
+                UPDATE {table} SET row_version = (SELECT version FROM catalog_seq WHERE id = 1)
+                WHERE id = NEW.id;
+            END
+        ''')
+
+
+def table_version(db, kind):
+    """A katalógus aktuális verziója (index alapján, teljes tábla olvasás nélkül)"""
+    table, _ = CATALOGS[kind]
+    return db.execute(f'SELECT COALESCE(MAX(row_version), 0) FROM {table}').fetchone()[0]
+
+
+def global_version(db):
+    """Bármely katalógus változásakor növekvő globális számláló"""
+    row = db.execute('SELECT version FROM catalog_seq WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def restamp(db, min_version):
+    """
+    Backup visszaállítás után: a számláló nem mehet vissza (a workerek refcache-e és a
+    kliensek ETag-jei a régi verziószámokhoz más tartalmat tárolnak), és minden sor új
+    verziót kap, így a "since" delta minden klienshez a teljes visszaállított állapotot viszi
+    """
+    db.execute('UPDATE catalog_seq SET version = MAX(version, ?) + 1 WHERE id = 1', (min_version,))
+    for table, _ in CATALOGS.values():
+        db.execute(f'UPDATE {table} SET row_version = (SELECT version FROM catalog_seq WHERE id = 1)')
+
+
+def rows_since(db, kind, since=None):
+    """
+    Katalógus sorok lekérdezése
+    since=None: teljes lista (törölt sorok nélkül)
+    since=N: csak az N. verzió óta változott sorok, a logikailag töröltekkel együtt
+    """
+    table, columns = CATALOGS[kind]
+    query = f'SELECT {", ".join(columns)} FROM {table}'
+    params = []
+    if since is None:
+        query += ' WHERE is_deleted = 0'
+    else:
+        query += ' WHERE row_version > ?'
+        params.append(since)
+    query += ' ORDER BY row_version'
+    return [dict(row) for row in db.execute(query, params).fetchall()]
@@ -2,6 +2,7 @@
 Konfiguráció a leltárkezelő alkalmazáshoz
 """
 import os
+import tempfile
 from datetime import datetime, timedelta, timezone
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -49,7 +50,7 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'edibles-leltar-secret-key-change-in-production'
     
     # Adatbázis
-    DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'leltar.db')
+    DATABASE_PATH = os.environ.get('DATABASE_PATH') or os.path.join(BASE_DIR, 'data', 'leltar.db')
     
     # Backup beállítások
     BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
@@ -57,6 +58,36 @@ class Config:
     BACKUP_INTERVAL_MINUTES = 30  # Automatikus backup időköz
     BACKUP_RETENTION_DAYS = 30    # Backup megőrzési idő
     
+    # Metrikák (Prometheus) - több worker esetén processzenkénti fájlok ebben a könyvtárban
+    METRICS_DIR = os.environ.get('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'edibes-metrics')
+    # A /metrics csak "Authorization: Bearer <token>" fejléccel érhető el; token nélkül zárva
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+    
+    # Élő készletfrissítés (SSE): polling gyakoriság, egy stream max. hossza, események megőrzése
+    SSE_POLL_INTERVAL = 0.5
+    SSE_STREAM_SECONDS = 55
+    # Egy nyitott stream egy gunicorn szálat foglal: workerenként legfeljebb ennyi stream
+    # (a gunicorn.conf.py szálszáma ennél több, hogy a normál kéréseknek is maradjon szál);
+    # fölötte a kliens SSE_BUSY_RETRY_SECONDS múlva próbálkozik újra
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS') or 4)
+    SSE_BUSY_RETRY_SECONDS = 20
+    STOCK_EVENTS_RETENTION_HOURS = 24
+    
+    # Tömeges import: az előnézet és a végrehajtás között itt őrizzük a feltöltött CSV-t
+    IMPORT_DIR = os.path.join(BASE_DIR, 'data', 'imports')
+    # Termék import: eddig a sorszámig a kérésben fut, fölötte háttér feladatként
+    PRODUCT_IMPORT_SYNC_ROWS = 500
+    
+    # Háttér feladatok: worker szál a webes processzben, ha nincs külön worker processz
+    # (docker compose alatt a worker szolgáltatás futtatja őket, ott kikapcsolva)
+    JOBS_EMBEDDED_WORKER = os.environ.get('JOBS_EMBEDDED_WORKER', 'true').lower() in ('1', 'true', 'yes')
+    
+    # Offline mobil sor: egy szinkron kérésben legfeljebb ennyi mozgás
+    SYNC_MAX_BATCH = 500
+    
+    # Renderelt oldalak processzenkénti LRU tára (bájt); 0 = csak ETag / 304, tár nélkül
+    HTTPCACHE_MAX_BYTES = int(os.environ.get('HTTPCACHE_MAX_BYTES') or 4 * 1024 * 1024)
+    
     # Session beállítások
     PERMANENT_SESSION_LIFETIME = timedelta(hours=8)
     
@@ -0,0 +1,79 @@
+"""
+CSV import segédfüggvények (készlet és termék import)
+
+A feltöltött fájlt soronként olvassuk (nem töltjük be egyben), az Excel
+által mentett változatokat is elfogadjuk: UTF-8 BOM, pontosvessző vagy
+vessző elválasztó, tizedesvessző.
+"""
+import csv
+import os
+import time
+import uuid
+
+# Ennyi ideig őrizzük meg az előnézethez feltöltött fájlokat
+UPLOAD_MAX_AGE_SECONDS = 24 * 3600
+
+
+def iter_csv_rows(text_stream):
+    """
+    CSV sorok olvasása (sorszám, mezők) párokként, az elválasztót az első sorból ismeri fel
+    Az üres sorokat kihagyja.
+    """
+    first_line = text_stream.readline()
+    delimiter = ';' if first_line.count(';') >= first_line.count(',') else ','
+
+    def lines():
+        yield first_line
+        yield from text_stream
+
+    for line_number, row in enumerate(csv.reader(lines(), delimiter=delimiter), start=1):
+        fields = [field.strip() for field in row]
+        if any(fields):
+            yield line_number, fields
+
+
+def parse_number(text):
+    """Szám értelmezése (tizedesvessző és ezres szóköz megengedett), hibás érték esetén None"""
+    if text is None:
+        return None
+    text = text.replace('\xa0', '').replace(' ', '').replace(',', '.')
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def save_upload(file_storage, upload_dir):
+    """
+    Feltöltött fájl mentése az előnézet és a végrehajtás közötti időre
+    Visszatér: token (a fájl azonosítója)
+    """
+    os.makedirs(upload_dir, exist_ok=True)
+    _cleanup_uploads(upload_dir)
+    token = uuid.uuid4().hex
+    file_storage.save(os.path.join(upload_dir, f'{token}.csv'))
+    return token
+
+
+def upload_path(upload_dir, token):
+    """Token -> fájl útvonal; érvénytelen vagy lejárt token esetén None"""
+    if not token or len(token) != 32 or not all(c in '0123456789abcdef' for c in token):
+        return None
+    path = os.path.join(upload_dir, f'{token}.csv')
+    return path if os.path.exists(path) else None
+
+
+def open_upload(path):
+    """Mentett CSV megnyitása szövegként (UTF-8, BOM-mal vagy anélkül)"""
+    return open(path, newline='', encoding='utf-8-sig', errors='replace')
+
+
+def _cleanup_uploads(upload_dir):
+    now = time.time()
+    for name in os.listdir(upload_dir):
+        path = os.path.join(upload_dir, name)
+        try:
+            if now - os.path.getmtime(path) > UPLOAD_MAX_AGE_SECONDS:
+                os.remove(path)
+        except OSError:
+            pass
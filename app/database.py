@@ -3,31 +3,82 @@ SQLite adatbázis kezelés
 """
 import sqlite3
 import os
+import time
 from flask import current_app, g
 from datetime import datetime
 from werkzeug.security import generate_password_hash
+from app import metrics
+
+
+_WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class TimedConnection(sqlite3.Connection):
+    """
+    sqlite3 kapcsolat, amely méri az utasítások, a COMMIT és az írási zár
+    megszerzésének idejét (Prometheus metrikák)
+    """
+
+    def execute(self, sql, parameters=()):
+        statement = sql.lstrip().upper()
+        is_write = statement.startswith(_WRITE_PREFIXES)
+        # Az első írás a tranzakcióban (vagy a BEGIN IMMEDIATE) szerzi meg az írási zárat
+        acquires_lock = ((is_write and not self.in_transaction)
+                         or statement.startswith('BEGIN IMMEDIATE'))
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                metrics.inc('edibes_db_locked_errors_total')
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe('edibes_db_query_duration_seconds', elapsed,
+                            {'kind': 'write' if is_write else 'read'})
+            if acquires_lock:
+                metrics.observe('edibes_db_lock_wait_seconds', elapsed)
+                if elapsed >= metrics.BUSY_THRESHOLD_SECONDS:
+                    metrics.inc('edibes_db_busy_total')
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metrics.observe('edibes_db_commit_duration_seconds', time.perf_counter() - start)
+
+
+def open_connection(db_path):
+    """
+    Új adatbázis kapcsolat a Raspberry Pi-hez hangolt beállításokkal
+    (a kérések a g-ben tárolt kapcsolatot használják, a háttér feladatok sajátot)
+    """
+    db = sqlite3.connect(
+        db_path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=30.0,  # Hosszabb timeout a konkurens hozzáféréshez
+        factory=TimedConnection
+    )
+    db.row_factory = sqlite3.Row
+    
+    # === KRITIKUS BEÁLLÍTÁSOK A RASPBERRY PI STABILITÁSÁHOZ ===
+    # WAL (Write-Ahead Logging) mód - biztonságosabb SD kártyán
+    db.execute("PRAGMA journal_mode = WAL")
+    # Szinkron mód - FULL a maximális adatbiztonsághoz
+    db.execute("PRAGMA synchronous = FULL")
+    # Foreign key támogatás engedélyezése
+    db.execute("PRAGMA foreign_keys = ON")
+    # Busy timeout - várakozás zárolásra
+    db.execute("PRAGMA busy_timeout = 30000")
+    
+    return db
 
 
 def get_db_connection():
     """Adatbázis kapcsolat létrehozása"""
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE_PATH'],
-            detect_types=sqlite3.PARSE_DECLTYPES,
-            timeout=30.0  # Hosszabb timeout a konkurens hozzáféréshez
-        )
-        g.db.row_factory = sqlite3.Row
-        
-        # === KRITIKUS BEÁLLÍTÁSOK A RASPBERRY PI STABILITÁSÁHOZ ===
-        # WAL (Write-Ahead Logging) mód - biztonságosabb SD kártyán
-        g.db.execute("PRAGMA journal_mode = WAL")
-        # Szinkron mód - FULL a maximális adatbiztonsághoz
-        g.db.execute("PRAGMA synchronous = FULL")
-        # Foreign key támogatás engedélyezése
-        g.db.execute("PRAGMA foreign_keys = ON")
-        # Busy timeout - várakozás zárolásra
-        g.db.execute("PRAGMA busy_timeout = 30000")
-        
+        g.db = open_connection(current_app.config['DATABASE_PATH'])
     return g.db
 
 
@@ -45,7 +96,14 @@ def get_db_session():
 
 def init_db():
     """Adatbázis inicializálása - táblák létrehozása"""
-    db = get_db_connection()
+    create_schema(get_db_connection())
+    
+    # Teardown regisztrálása
+    current_app.teardown_appcontext(close_db_connection)
+
+
+def create_schema(db):
+    """Táblák létrehozása / migrálása (idempotens - backup visszaállítás után is futtatható)"""
     
     # === HELYSZÍNEK TÁBLA (ÚJ - Multi-location támogatás) ===
     db.execute('''
@@ -135,6 +193,8 @@ def init_db():
             FOREIGN KEY (product_id) REFERENCES products(id)
         )
     ''')
+    # Összkészlet keresés termékre (tömeges frissítésnél soronként kellene)
+    db.execute('CREATE INDEX IF NOT EXISTS idx_inventory_product ON inventory(product_id)')
     
     # === ÚJ: Helyszín-specifikus készlet tábla ===
     # Ez a központi készletnyilvántartás: Product × Location = Quantity
@@ -178,6 +238,58 @@ def init_db():
     # Migráció: helyszín oszlopok hozzáadása a meglévő inventory_movements táblához
     _migrate_inventory_movements(db)
     
+    # Napi készlet checkpointok (készlet visszamenőleg) + mozgás időpont index
+    from app import snapshots
+    snapshots.init_schema(db)
+    
+    # Forgalmi összesítők (óra / nap / hónap) trend riportokhoz
+    from app import rollups
+    rollups.init_schema(db)
+    
+    # Fogyás előrejelzés (illesztett paraméterek és állapot automatánként)
+    from app import forecast
+    forecast.init_schema(db)
+    
+    # Élő készletváltozás események (SSE) - triggerek a location_inventory táblán
+    from app import stock_events
+    stock_events.init_schema(db)
+    
+    # Helyszínenkénti alacsony készlet riasztások (a stock_events eseményekből)
+    from app import alerts
+    alerts.init_schema(db)
+    
+    # Törzsadat verziózás (katalógus delta szinkron, ETag)
+    from app import catalog
+    catalog.init_schema(db)
+    
+    # Készlet változás számláló a feltételes GET (ETag / 304) oldalakhoz
+    from app import httpcache
+    httpcache.init_schema(db)
+    
+    # Leltár munkamenetek és számolt mennyiségek
+    from app import stocktake
+    stocktake.init_schema(db)
+    
+    # Mozgás bizonylatok (fej + tételek) - több tételes műveletek, bizonylat szintű visszavonás
+    from app import documents
+    documents.init_schema(db)
+    
+    # Háttér feladatok (import) állapota
+    from app import jobs
+    jobs.init_schema(db)
+    
+    # Offline szinkron nyugták - a mobil sor kliens azonosítói (duplikált beküldés szűrése)
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS sync_receipts (
+            client_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            movement_id INTEGER,
+            error TEXT,
+            client_ts TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     # Audit log tábla (minden változás követése) - BŐVÍTETT
     db.execute('''
         CREATE TABLE IF NOT EXISTS audit_log (
@@ -207,9 +319,6 @@ def init_db():
     _migrate_existing_inventory(db)
     
     db.commit()
-    
-    # Teardown regisztrálása
-    current_app.teardown_appcontext(close_db_connection)
 
 
 def _migrate_inventory_movements(db):
@@ -218,7 +327,8 @@ def _migrate_inventory_movements(db):
         ('location_id', 'INTEGER'),
         ('source_location_id', 'INTEGER'),
         ('target_location_id', 'INTEGER'),
-        ('reference_movement_id', 'INTEGER')
+        ('reference_movement_id', 'INTEGER'),
+        ('document_id', 'INTEGER')
     ]
     
     for column_name, column_type in columns_to_add:
@@ -385,16 +495,13 @@ def _insert_default_data(db):
     db.commit()
 
 
-def log_audit(table_name, record_id, action, old_values=None, new_values=None):
+def audit_context():
     """
-    Audit log bejegyzés létrehozása
-    Automatikusan rögzíti a user_id, IP cím és user agent adatokat
+    A bejelentkezett felhasználó, IP cím és user agent a kérésből (user_id, ip_address, user_agent)
+    Háttér feladatnál a kérés idején kell elkérni, utána már nincs kérés kontextus.
     """
     from flask import request, has_request_context
     from flask_login import current_user
-    import json
-    
-    db = get_db_connection()
     
     # Request kontextus adatok
     user_id = None
@@ -417,24 +524,49 @@ def log_audit(table_name, record_id, action, old_values=None, new_values=None):
         # User Agent
         user_agent = request.headers.get('User-Agent', '')[:500]  # Max 500 karakter
     
-    # Értékek JSON formátumban
-    old_json = None
-    new_json = None
+    return user_id, ip_address, user_agent
+
+
+def _audit_json(values):
+    import json
     
-    if old_values:
-        if isinstance(old_values, dict):
-            old_json = json.dumps(old_values, ensure_ascii=False, default=str)
-        else:
-            old_json = str(old_values)
+    if not values:
+        return None
+    if isinstance(values, dict):
+        return json.dumps(values, ensure_ascii=False, default=str)
+    return str(values)
+
+
+def log_audit(table_name, record_id, action, old_values=None, new_values=None):
+    """
+    Audit log bejegyzés létrehozása
+    Automatikusan rögzíti a user_id, IP cím és user agent adatokat
+    """
+    db = get_db_connection()
     
-    if new_values:
-        if isinstance(new_values, dict):
-            new_json = json.dumps(new_values, ensure_ascii=False, default=str)
-        else:
-            new_json = str(new_values)
+    user_id, ip_address, user_agent = audit_context()
+    
+    # Értékek JSON formátumban
+    old_json = _audit_json(old_values)
+    new_json = _audit_json(new_values)
     
     db.execute('''
         INSERT INTO audit_log (table_name, record_id, action, old_values, new_values, user_id, ip_address, user_agent)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
     ''', (table_name, record_id, action, old_json, new_json, user_id, ip_address, user_agent))
     db.commit()
+
+
+def log_audit_many(db, entries, context=(None, None, None)):
+    """
+    Sok audit bejegyzés egy utasítással, a hívó tranzakciójában (commit a hívó feladata)
+    entries: (table_name, record_id, action, old_values, new_values) elemek
+    context: audit_context() eredménye
+    """
+    user_id, ip_address, user_agent = context
+    db.executemany('''
+        INSERT INTO audit_log (table_name, record_id, action, old_values, new_values, user_id, ip_address, user_agent)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(table_name, record_id, action, _audit_json(old_values), _audit_json(new_values),
+           user_id, ip_address, user_agent)
+          for table_name, record_id, action, old_values, new_values in entries])
@@ -0,0 +1,278 @@
+"""
+Mozgás bizonylatok (szállítólevél): több tételes műveletek fej + tételek szerkezetben
+
+Egy autó rakodás, egy automata töltés, egy szállítói bevételezés vagy egy leltár
+korrekció egy bizonylat (movement_documents sor); a tételei a szokásos
+inventory_movements sorok a document_id hivatkozással. A fej tárolja a tételszámot és
+az összmennyiséget, így a bizonylat lista a fejeken lapoz, nem a tételsorokon.
+
+Könyvelés és visszavonás halmaz alapon (stock.py), egy tranzakcióban:
+- book_transfer: forrásból csökkentés, célba növelés minden tételre (TRANSFER_OUT / TRANSFER_IN)
+- reverse: a még vissza nem vont tételekre egy-egy REVERSAL mozgás (ugyanaz a termék
+  és helyszín, ellentétes mennyiség, hivatkozás az eredeti tételre) egy új REVERSAL
+  bizonylaton - így a főkönyv egyeztetés (ledger.py) tételenként ellenőrizni tudja
+
+A commit a hívó feladata (író szál parancs, vagy BEGIN IMMEDIATE a kérés kapcsolatán).
+"""
+from app.models import LocationType, MovementType
+from app.stock import StockChange
+from app import stock
+
+LOAD = 'LOAD'
+REFILL = 'REFILL'
+TRANSFER = 'TRANSFER'
+RECEIPT = 'RECEIPT'
+INITIAL = 'INITIAL'
+STOCKTAKE = 'STOCKTAKE'
+REVERSAL = 'REVERSAL'
+
+DOCUMENT_TYPES = {
+    LOAD: 'Autó rakodás',
+    REFILL: 'Automata töltés',
+    TRANSFER: 'Áthelyezés',
+    RECEIPT: 'Bevételezés',
+    INITIAL: 'Kezdőkészlet',
+    STOCKTAKE: 'Leltár korrekció',
+    REVERSAL: 'Sztornó'
+}
+
+# Import mozgás típus -> bizonylat típus
+IMPORT_DOCUMENT_TYPES = {
+    'STOCK_IN': RECEIPT,
+    'INITIAL': INITIAL
+}
+
+
+def init_schema(db):
+    """Bizonylat tábla és a tételek indexei (init_db hívja, az inventory_movements migráció után)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS movement_documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_type TEXT NOT NULL,
+            location_id INTEGER,
+            source_location_id INTEGER,
+            target_location_id INTEGER,
+            note TEXT,
+            line_count INTEGER NOT NULL DEFAULT 0,
+            total_quantity REAL NOT NULL DEFAULT 0,
+            reverses_document_id INTEGER,
+            reversed_by_document_id INTEGER,
+            created_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (location_id) REFERENCES locations(id),
+            FOREIGN KEY (source_location_id) REFERENCES locations(id),
+            FOREIGN KEY (target_location_id) REFERENCES locations(id)
+        )
+    ''')
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_movement_documents_type
+        ON movement_documents(document_type, id)
+    ''')
+    # Tételek bizonylatonként (a régi, bizonylat nélküli sorok nem kerülnek az indexbe)
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_inventory_movements_document
+        ON inventory_movements(document_id) WHERE document_id IS NOT NULL
+    ''')
+    # Visszavonás ellenőrzés (a tétel vissza lett-e már vonva) index nélkül a teljes naplót olvasná
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_inventory_movements_reference
+        ON inventory_movements(reference_movement_id) WHERE reference_movement_id IS NOT NULL
+    ''')
+
+
+def transfer_type(source, target):
+    """Áthelyezés bizonylat típusa a helyszínek típusából (locations sorok)"""
+    if source['location_type'] == LocationType.WAREHOUSE and target['location_type'] == LocationType.CAR:
+        return LOAD
+    if source['location_type'] == LocationType.CAR and target['location_type'] == LocationType.VENDING:
+        return REFILL
+    return TRANSFER
+
+
+def create(db, document_type, location_id=None, source_location_id=None, target_location_id=None,
+           note=None, created_by=None, reverses_document_id=None):
+    """Bizonylat fej beszúrása (a tételszámot és összmennyiséget a finish tölti ki); visszatér: id"""
+    cursor = db.execute('''
+        INSERT INTO movement_documents
+        (document_type, location_id, source_location_id, target_location_id, note, created_by,
+         reverses_document_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (document_type, location_id, source_location_id, target_location_id, note, created_by,
+          reverses_document_id))
+    return cursor.lastrowid
+
+
+def finish(db, document_id, line_count, total_quantity):
+    """Tételszám és összmennyiség a fejbe (a lista ezekből dolgozik, tétel olvasás nélkül)"""
+    db.execute('''
+        UPDATE movement_documents SET line_count = ?, total_quantity = ? WHERE id = ?
+    ''', (line_count, total_quantity, document_id))
+
+
+def get(db, document_id):
+    return db.execute('''
+        SELECT d.*, l.name as location_name, sl.name as source_location_name,
+               tl.name as target_location_name
+        FROM movement_documents d
+        LEFT JOIN locations l ON d.location_id = l.id
+        LEFT JOIN locations sl ON d.source_location_id = sl.id
+        LEFT JOIN locations tl ON d.target_location_id = tl.id
+        WHERE d.id = ?
+    ''', (document_id,)).fetchone()
+
+
+def lines(db, document_id):
+    """Bizonylat tételei; reversed_by: a tételt visszavonó mozgás id-je (ha van)"""
+    return db.execute('''
+        SELECT m.*, p.name as product_name, p.barcode, l.name as location_name,
+               (SELECT r.id FROM inventory_movements r
+                WHERE r.reference_movement_id = m.id AND r.movement_type = 'REVERSAL') as reversed_by
+        FROM inventory_movements m
+        JOIN products p ON m.product_id = p.id
+        LEFT JOIN locations l ON m.location_id = l.id
+        WHERE m.document_id = ?
+        ORDER BY m.id
+    ''', (document_id,)).fetchall()
+
+
+def _merge_lines(items):
+    """(product_id, mennyiség) párok termékenként összevonva, az első előfordulás sorrendjében"""
+    merged = {}
+    for product_id, quantity in items:
+        if quantity is None or quantity <= 0:
+            raise ValueError('A mennyiségnek pozitívnak kell lennie!')
+        merged[product_id] = merged.get(product_id, 0) + quantity
+    return merged
+
+
+def _product_names(db, product_ids):
+    product_ids = list(product_ids)
+    return dict(db.execute(f'''
+        SELECT id, name FROM products WHERE is_deleted = 0 AND id IN ({",".join("?" * len(product_ids))})
+    ''', product_ids).fetchall())
+
+
+def _total_quantity(document, movements):
+    """Fej összmennyiség: áthelyezésnél a mozgatott mennyiség (forrás oldal), egyébként a nettó változás"""
+    if document['source_location_id']:
+        return -sum(m.quantity_change for m in movements if m.location_id == document['source_location_id'])
+    return sum(m.quantity_change for m in movements)
+
+
+def book_transfer(db, items, source_location_id, target_location_id, document_type=TRANSFER,
+                  note=None, created_by=None):
+    """
+    Több tételes áthelyezés egy bizonylaton, halmaz alapon
+    items: (product_id, mennyiség) párok; ugyanaz a termék többször is szerepelhet (összevonjuk)
+    Visszatér: a bizonylat id; hiányzó termék vagy negatív készlet esetén ValueError (semmi nem íródik)
+    """
+    if source_location_id == target_location_id:
+        raise ValueError('A forrás és cél helyszín nem lehet ugyanaz!')
+
+    merged = _merge_lines(items)
+    if not merged:
+        raise ValueError('A bizonylaton nincs tétel!')
+
+    names = _product_names(db, merged)
+    missing = [product_id for product_id in merged if product_id not in names]
+    if missing:
+        raise ValueError(f'Termék nem található: #{missing[0]}')
+
+    # Előbb minden forrás csökkentés, utána minden cél növelés: a tervezett sorok első fele OUT
+    changes = [StockChange(product_id, source_location_id, -quantity, note) for product_id, quantity in merged.items()]
+    changes += [StockChange(product_id, target_location_id, quantity, note) for product_id, quantity in merged.items()]
+    planned, errors = stock.plan_stock_changes(db, changes)
+    if errors:
+        index, message = errors[0]
+        raise ValueError(f'{names[changes[index].product_id]}: {message}')
+
+    document_id = create(db, document_type, source_location_id=source_location_id,
+                         target_location_id=target_location_id, note=note, created_by=created_by)
+
+    count = len(merged)
+    out_rows, in_rows = planned[:count], planned[count:]
+
+    db.executemany('''
+        INSERT INTO inventory_movements
+        (product_id, movement_type, quantity_change, quantity_before, quantity_after,
+         location_id, source_location_id, target_location_id, note, document_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(m.product_id, MovementType.TRANSFER_OUT, m.quantity_change, m.quantity_before, m.quantity_after,
+           source_location_id, source_location_id, target_location_id, note, document_id) for m in out_rows])
+
+    # A TRANSFER_IN sor a párja TRANSFER_OUT sorára hivatkozik (mint az egy tételes áthelyezésnél)
+    out_ids = dict(db.execute('''
+        SELECT product_id, id FROM inventory_movements WHERE document_id = ?
+    ''', (document_id,)).fetchall())
+
+    db.executemany('''
+        INSERT INTO inventory_movements
+        (product_id, movement_type, quantity_change, quantity_before, quantity_after,
+         location_id, source_location_id, target_location_id, reference_movement_id, note, document_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(m.product_id, MovementType.TRANSFER_IN, m.quantity_change, m.quantity_before, m.quantity_after,
+           target_location_id, source_location_id, target_location_id, out_ids[m.product_id], note, document_id)
+          for m in in_rows])
+
+    # Aktív helyszínek között az összkészlet nem változik, az inventory táblához nem kell nyúlni
+    stock.store_quantities(db, planned)
+    finish(db, document_id, count * 2, sum(merged.values()))
+
+    return document_id
+
+
+def reverse(db, document_id, created_by=None):
+    """
+    Bizonylat visszavonása egy REVERSAL bizonylattal, halmaz alapon
+    A tételenként már visszavont sorokat kihagyjuk; negatív készlet esetén ValueError (semmi nem íródik)
+    Visszatér: a visszavonó bizonylat id
+    """
+    document = get(db, document_id)
+    if not document:
+        raise ValueError('Bizonylat nem található!')
+    if document['document_type'] == REVERSAL:
+        raise ValueError('Sztornó bizonylat nem vonható vissza!')
+    if document['reversed_by_document_id']:
+        raise ValueError(f'A bizonylat már vissza lett vonva (#{document["reversed_by_document_id"]})!')
+
+    rows = db.execute('''
+        SELECT m.id, m.product_id, m.location_id, m.quantity_change, p.name as product_name
+        FROM inventory_movements m
+        JOIN products p ON m.product_id = p.id
+        WHERE m.document_id = ? AND m.location_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM inventory_movements r
+                          WHERE r.reference_movement_id = m.id AND r.movement_type = 'REVERSAL')
+        ORDER BY m.id
+    ''', (document_id,)).fetchall()
+    if not rows:
+        raise ValueError('A bizonylat minden tétele vissza lett már vonva!')
+
+    note = f'Visszavonás: bizonylat #{document_id}'
+    changes = [StockChange(row['product_id'], row['location_id'], -row['quantity_change'], note) for row in rows]
+    planned, errors = stock.plan_stock_changes(db, changes)
+    if errors:
+        index, message = errors[0]
+        raise ValueError(f'{rows[index]["product_name"]} ({index + 1}. tétel): {message}')
+
+    reversal_id = create(db, REVERSAL, location_id=document['location_id'],
+                         source_location_id=document['source_location_id'],
+                         target_location_id=document['target_location_id'],
+                         note=note, created_by=created_by, reverses_document_id=document_id)
+
+    db.executemany('''
+        INSERT INTO inventory_movements
+        (product_id, movement_type, quantity_change, quantity_before, quantity_after,
+         location_id, reference_movement_id, note, document_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(m.product_id, MovementType.REVERSAL, m.quantity_change, m.quantity_before, m.quantity_after,
+           m.location_id, row['id'], note, reversal_id) for m, row in zip(planned, rows)])
+
+    stock.store_quantities(db, planned)
+    stock.refresh_inventory_totals(db, {m.product_id for m in planned})
+
+    finish(db, reversal_id, len(planned), _total_quantity(document, planned))
+    db.execute('''
+        UPDATE movement_documents SET reversed_by_document_id = ? WHERE id = ?
+    ''', (reversal_id, document_id))
+
+    return reversal_id
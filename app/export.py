@@ -0,0 +1,178 @@
+"""
+Szerver oldali export (CSV / XLSX) - folyamatos (streaming) válasz
+
+A sorokat saját, csak olvasható kapcsolat kurzorából olvassuk
+FETCH_SIZE méretű adagokban, és azonnal a kliensnek küldjük. A memória-
+használat így a sorok számától független: egy év mozgása is letölthető
+a Raspberry Pi-n. Az XLSX fájlt a zipfile modul nem kereshető (unseekable)
+kimenetre írja, inline string cellákkal (nincs shared strings tábla, amihez
+minden szöveget memóriában kellene tartani).
+"""
+import csv
+import io
+import re
+import sqlite3
+import urllib.parse
+import zipfile
+from xml.sax.saxutils import escape
+
+from flask import Response, current_app
+
+# Egyszerre ennyi sort olvasunk a kurzorból
+FETCH_SIZE = 1000
+
+# A magyar Excel pontosvesszőt vár (a kliens oldali exportTableToCSV is ezt használja)
+CSV_DELIMITER = ';'
+
+_XML_ILLEGAL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# Munkalap névben nem engedélyezett karakterek (Excel)
+_SHEET_NAME_ILLEGAL_CHARS = re.compile(r'[\[\]:*?/\\]')
+
+_XLSX_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+</Types>'''
+
+_XLSX_ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+_XLSX_WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+_XLSX_WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>'''
+
+_XLSX_SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                     '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                     '<sheetData>')
+
+_XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+def iter_rows(db_path, query, params=()):
+    """
+    Sorok olvasása adagonként saját kapcsolaton
+    (a kérés kapcsolata a válasz streamelésekor már le van zárva)
+    """
+    uri = f'file:{urllib.parse.quote(db_path)}?mode=ro'
+    db = sqlite3.connect(uri, uri=True, timeout=30.0)
+    try:
+        cursor = db.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            yield rows
+    finally:
+        db.close()
+
+
+def _csv_value(value):
+    if isinstance(value, float):
+        if value.is_integer():
+            return int(value)
+        return str(value).replace('.', ',')
+    # Képlet injekció elleni védelem (Excel a =, +, -, @ kezdetű cellát képletnek venné)
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        return "'" + value
+    return value
+
+
+def generate_csv(headers, row_batches):
+    """CSV generátor (UTF-8 BOM, hogy az Excel helyesen nyissa meg)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=CSV_DELIMITER)
+    writer.writerow(headers)
+    yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+
+    for rows in row_batches:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _StreamBuffer:
+    """Nem kereshető kimenet a zipfile számára; a megírt bájtokat adagonként adja tovább"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_XML_ILLEGAL_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def generate_xlsx(sheet_name, headers, row_batches):
+    """XLSX generátor - a munkalap XML-t adagonként tömörítjük és küldjük"""
+    sheet_name = _SHEET_NAME_ILLEGAL_CHARS.sub('', sheet_name)[:31] or 'Export'
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', _XLSX_CONTENT_TYPES)
+        zf.writestr('_rels/.rels', _XLSX_ROOT_RELS)
+        zf.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(name=escape(sheet_name, {'"': '&quot;'})))
+        zf.writestr('xl/_rels/workbook.xml.rels', _XLSX_WORKBOOK_RELS)
+
+        with zf.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((_XLSX_SHEET_START + _xlsx_row(headers)).encode('utf-8'))
+            for rows in row_batches:
+                sheet.write(''.join(_xlsx_row(row) for row in rows).encode('utf-8'))
+                yield buffer.drain()
+            sheet.write(_XLSX_SHEET_END.encode('utf-8'))
+
+    yield buffer.drain()
+
+
+def export_response(query, params, headers, filename, export_format='csv', sheet_name='Export'):
+    """
+    Streaming letöltés válasz
+    query: a headers sorrendjében adja vissza az oszlopokat; a rendezés lehetőleg
+    indexet (pl. id) kövessen, különben az SQLite-nak a teljes eredményt rendeznie kell
+    """
+    row_batches = iter_rows(current_app.config['DATABASE_PATH'], query, params)
+
+    if export_format == 'xlsx':
+        body = generate_xlsx(sheet_name, headers, row_batches)
+        content_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        export_format = 'csv'
+        body = generate_csv(headers, row_batches)
+        content_type = 'text/csv; charset=utf-8'
+
+    # Teljes Content-Type (a mimetype= paraméterhez a Werkzeug még egy charset-et fűzne)
+    response = Response(body, content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    # nginx ne pufferelje a teljes fájlt a továbbítás előtt
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,329 @@
+"""
+Fogyás előrejelzés automatánként - exponenciális simítás heti szezonalitással
+
+Idősor: termék × automata napi fogyása (kivételezés + fogyasztás) a napi
+rollup sorokból. Ahol az automatán nincs rögzített eladás, a feltöltések
+(TRANSFER_IN) napi összege a kereslet közelítése.
+
+Modell (additív Holt-Winters trend nélkül, m = 7):
+    előrejelzés = szint + szezon[hét napja]
+    szint  += alpha * (y - előrejelzés)
+    szezon[hét napja] += gamma * (y - új szint - szezon[hét napja])
+
+Az összes idősort egyszerre számoljuk NumPy mátrixokkal: az időben haladó
+ciklus napokon megy végig (HISTORY_DAYS lépés), az idősorok és a paraméter
+rács (ALPHAS × GAMMAS) egy-egy tömb dimenzió - nincs idősoronkénti Python
+ciklus. Az illesztett paraméterek és az állapot (szint, szezon) a
+demand_forecasts táblába kerülnek; a lezárt új napokat a tárolt állapotból
+léptetjük tovább, teljes újraillesztés REFIT_DAYS naponta (vagy új idősornál).
+
+A napok UTC napok, mint a rollup sorok; a mai (még nem lezárt) nap nem számít.
+"""
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import rollups
+
+# Illesztéshez használt előzmény (napok)
+HISTORY_DAYS = 84
+
+# Szezon hossza (hét napjai)
+SEASON = 7
+
+# Kezdő állapot becslése ennyi napból (a hiba csak utána számít)
+INIT_DAYS = 14
+
+# Teljes újraillesztés gyakorisága (napok)
+REFIT_DAYS = 7
+
+# Paraméter rács
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+GAMMAS = (0.0, 0.05, 0.15, 0.3)
+
+# Ennél kevesebb napra elegendő készlet figyelmeztetés (helyszín készlet oldal)
+COVER_WARNING_DAYS = 3
+
+# Keresletnek számító mozgások: eladás (kimenő, negatív) és feltöltés (bejövő)
+SALES_TYPES = ('STOCK_OUT', 'CONSUMPTION')
+REFILL_TYPES = ('TRANSFER_IN',)
+
+
+def init_schema(db):
+    """demand_forecasts tábla létrehozása (init_db hívja)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS demand_forecasts (
+            location_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            alpha REAL NOT NULL,
+            gamma REAL NOT NULL,
+            level REAL NOT NULL,
+            season TEXT NOT NULL,
+            daily_rate REAL NOT NULL,
+            mae REAL,
+            last_day TEXT NOT NULL,
+            fitted_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (location_id, product_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _weekdays(first_day, last_day):
+    """A first_day..last_day napok hét napja indexei (0 = hétfő)"""
+    count = (last_day - first_day).days + 1
+    return np.array([(first_day + timedelta(days=i)).weekday() for i in range(count)])
+
+
+def _load_series(db, first_day, last_day, pairs=None):
+    """
+    Napi eladás és feltöltés mátrix a rollup sorokból
+    pairs: csak ezek a (location_id, product_id) párok (None = minden automata minden párja)
+    Visszatér: (párok listája, eladás [pár, nap], feltöltés [pár, nap])
+    """
+    types = SALES_TYPES + REFILL_TYPES
+    # Sima tuple sorok (sqlite3.Row nélkül) - illesztéskor több százezer sor
+    cursor = db.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(f'''
+        SELECT location_id, product_id, bucket, movement_type, quantity
+        FROM movement_rollups
+        WHERE period = 'day' AND bucket BETWEEN ? AND ?
+          AND movement_type IN ({",".join("?" * len(types))})
+          AND location_id IN (
+              SELECT id FROM locations WHERE location_type = 'VENDING' AND is_deleted = 0
+          )
+    ''', [first_day.isoformat(), last_day.isoformat()] + list(types)).fetchall()
+
+    if pairs is None:
+        pairs = sorted({(row[0], row[1]) for row in rows})
+    pair_index = {pair: i for i, pair in enumerate(pairs)}
+    day_count = (last_day - first_day).days + 1
+    sales = np.zeros((len(pairs), day_count))
+    refills = np.zeros((len(pairs), day_count))
+
+    rows = [row for row in rows if (row[0], row[1]) in pair_index]
+    if rows:
+        index = np.array([pair_index[(row[0], row[1])] for row in rows])
+        day_offsets = {(first_day + timedelta(days=i)).isoformat(): i for i in range(day_count)}
+        offset = np.array([day_offsets[row[2]] for row in rows])
+        quantity = np.array([row[4] for row in rows], dtype=float)
+        is_sale = np.array([row[3] in SALES_TYPES for row in rows])
+        np.add.at(sales, (index[is_sale], offset[is_sale]), -quantity[is_sale])
+        np.add.at(refills, (index[~is_sale], offset[~is_sale]), quantity[~is_sale])
+    return pairs, sales, refills
+
+
+def _demand(sources, sales, refills):
+    """Kereslet mátrix a forrás szerint (visszavonások miatt egy nap lehet negatív - levágjuk)"""
+    y = np.where(np.asarray(sources)[:, None] == 'refill', refills, sales)
+    return np.clip(y, 0, None)
+
+
+def _smooth(y, weekdays, alpha, gamma, level, season, skip=0):
+    """
+    Simítás az összes idősoron egyszerre
+    y: [..., nap]; alpha, gamma, level: [...] alakú; season: [..., 7]
+    (a ... a paraméter rács és/vagy az idősorok dimenziója, broadcasttal)
+    Visszatér: (szint, szezon, abszolút hiba összeg a skip utáni napokon) - a bemenetet nem módosítja
+    """
+    level = np.array(level, dtype=float)
+    season = np.array(season, dtype=float)
+    errors = np.zeros(level.shape)
+    for t, weekday in enumerate(weekdays):
+        observed = y[..., t]
+        error = observed - (level + season[..., weekday])
+        if t >= skip:
+            errors += np.abs(error)
+        level = level + alpha * error
+        season[..., weekday] += gamma * (observed - level - season[..., weekday])
+    return level, season, errors
+
+
+def _initial_state(y, weekdays):
+    """Kezdő szint és szezon az első INIT_DAYS napból"""
+    head = y[:, :INIT_DAYS]
+    level = head.mean(axis=1)
+    season = np.zeros((y.shape[0], SEASON))
+    for weekday in range(SEASON):
+        columns = np.nonzero(weekdays[:INIT_DAYS] == weekday)[0]
+        if len(columns):
+            season[:, weekday] = head[:, columns].mean(axis=1) - level
+    return level, season
+
+
+def _daily_rate(level, season):
+    """Várható átlagos napi fogyás a következő héten (nem negatív)"""
+    return np.clip(level[:, None] + season, 0, None).mean(axis=1)
+
+
+def fit(y, weekdays):
+    """
+    Paraméter illesztés rács kereséssel, minden idősorra egyszerre
+    Visszatér: (alpha, gamma, szint, szezon, átlagos abszolút hiba) - idősoronként
+    """
+    grid_alpha, grid_gamma = np.meshgrid(ALPHAS, GAMMAS, indexing='ij')
+    grid_alpha = grid_alpha.reshape(-1, 1)
+    grid_gamma = grid_gamma.reshape(-1, 1)
+    level0, season0 = _initial_state(y, weekdays)
+    grid_size = grid_alpha.shape[0]
+
+    # [rács, idősor, nap] - az y-t nem másoljuk, csak broadcastoljuk
+    level, season, errors = _smooth(
+        np.broadcast_to(y, (grid_size,) + y.shape), weekdays,
+        grid_alpha, grid_gamma,
+        np.broadcast_to(level0, (grid_size, y.shape[0])),
+        np.broadcast_to(season0, (grid_size,) + season0.shape),
+        skip=INIT_DAYS)
+
+    best = errors.argmin(axis=0)
+    series = np.arange(y.shape[0])
+    scored_days = max(len(weekdays) - INIT_DAYS, 1)
+    return (grid_alpha[best, 0], grid_gamma[best, 0], level[best, series],
+            season[best, series], errors[best, series] / scored_days)
+
+
+def _yesterday():
+    return datetime.utcnow().date() - timedelta(days=1)
+
+
+def _store(db, pairs, sources, alpha, gamma, level, season, mae, last_day):
+    """Illesztett paraméterek és állapot mentése (a hívó tranzakciójában)"""
+    rates = _daily_rate(level, season)
+    db.executemany('''
+        INSERT INTO demand_forecasts
+            (location_id, product_id, source, alpha, gamma, level, season, daily_rate, mae, last_day, fitted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', [
+        (pair[0], pair[1], str(sources[i]), float(alpha[i]), float(gamma[i]), float(level[i]),
+         _season_json(season[i]), float(rates[i]), float(mae[i]), last_day.isoformat())
+        for i, pair in enumerate(pairs)
+    ])
+
+
+def _season_json(values):
+    return json.dumps([round(float(value), 6) for value in values])
+
+
+def refit(db):
+    """
+    Teljes újraillesztés az utolsó HISTORY_DAYS lezárt napra (commit)
+    Az előzményben már nem szereplő párok előrejelzése törlődik.
+    Visszatér: az illesztett idősorok száma
+    """
+    last_day = _yesterday()
+    first_day = last_day - timedelta(days=HISTORY_DAYS - 1)
+    weekdays = _weekdays(first_day, last_day)
+    pairs, sales, refills = _load_series(db, first_day, last_day)
+
+    if pairs:
+        # Ahol nincs rögzített eladás, a feltöltés a kereslet közelítése
+        sources = np.where(sales.sum(axis=1) > 0, 'sales', 'refill')
+        alpha, gamma, level, season, mae = fit(_demand(sources, sales, refills), weekdays)
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        db.execute('DELETE FROM demand_forecasts')
+        if pairs:
+            _store(db, pairs, sources, alpha, gamma, level, season, mae, last_day)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(pairs)
+
+
+def advance(db):
+    """
+    A tárolt állapot léptetése a legutóbbi lezárt napig, újraillesztés nélkül (commit)
+    Visszatér: a léptetett idősorok száma
+    """
+    last_day = _yesterday()
+
+    # Olvasás is az írási zár alatt: két worker nem léptetheti ugyanazt a napot kétszer
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        cached = db.execute('''
+            SELECT location_id, product_id, source, alpha, gamma, level, season, last_day
+            FROM demand_forecasts WHERE last_day < ?
+        ''', (last_day.isoformat(),)).fetchall()
+
+        # Azonos utolsó napú idősorok együtt léptethetők (általában egy csoport)
+        groups = {}
+        for row in cached:
+            groups.setdefault(row['last_day'], []).append(row)
+
+        for cached_day, rows in groups.items():
+            first_day = datetime.strptime(cached_day, '%Y-%m-%d').date() + timedelta(days=1)
+            weekdays = _weekdays(first_day, last_day)
+            pairs = [(row['location_id'], row['product_id']) for row in rows]
+            _, sales, refills = _load_series(db, first_day, last_day, pairs)
+            level, season, _ = _smooth(
+                _demand([row['source'] for row in rows], sales, refills), weekdays,
+                np.array([row['alpha'] for row in rows]),
+                np.array([row['gamma'] for row in rows]),
+                np.array([row['level'] for row in rows]),
+                np.array([json.loads(row['season']) for row in rows]))
+            rates = _daily_rate(level, season)
+            db.executemany('''
+                UPDATE demand_forecasts SET level = ?, season = ?, daily_rate = ?, last_day = ?
+                WHERE location_id = ? AND product_id = ?
+            ''', [
+                (float(level[i]), _season_json(season[i]), float(rates[i]), last_day.isoformat(),
+                 pair[0], pair[1])
+                for i, pair in enumerate(pairs)
+            ])
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return len(cached)
+
+
+def due(db):
+    """
+    Esedékes frissítés a tárolt előrejelzéseken (olvasás, zár nélkül)
+    Visszatér: 'refit' (nincs még vagy REFIT_DAYS napnál régebbi), 'advance' (van új lezárt nap) vagy None
+    """
+    last_day = _yesterday()
+    count, stale, behind = db.execute('''
+        SELECT COUNT(*), MIN(fitted_at) < datetime('now', ?), MIN(last_day) < ? FROM demand_forecasts
+    ''', (f'-{REFIT_DAYS} days', last_day.isoformat())).fetchone()
+    if stale:
+        return 'refit'
+    if count:
+        return 'advance' if behind else None
+
+    # Üres tábla: csak akkor illesztünk, ha van automata előzmény (különben minden kérés új feladat lenne)
+    types = SALES_TYPES + REFILL_TYPES
+    history = db.execute(f'''
+        SELECT 1 FROM movement_rollups
+        WHERE period = 'day' AND bucket BETWEEN ? AND ?
+          AND movement_type IN ({",".join("?" * len(types))})
+          AND location_id IN (
+              SELECT id FROM locations WHERE location_type = 'VENDING' AND is_deleted = 0
+          )
+        LIMIT 1
+    ''', [(last_day - timedelta(days=HISTORY_DAYS - 1)).isoformat(), last_day.isoformat()] + list(types)).fetchone()
+    return 'refit' if history else None
+
+
+def update(db):
+    """
+    Előrejelzések naprakészre hozása: újraillesztés, ha nincs még vagy REFIT_DAYS napnál
+    régebbi, egyébként a lezárt új napok léptetése
+    Visszatér: ('refit' / 'advance', idősorok száma)
+    """
+    rollups.refresh(db)
+    count, stale = db.execute('''
+        SELECT COUNT(*), MIN(fitted_at) < datetime('now', ?) FROM demand_forecasts
+    ''', (f'-{REFIT_DAYS} days',)).fetchone()
+    if not count or stale:
+        return 'refit', refit(db)
+    return 'advance', advance(db)
+
+
+def forecast(level, season, first_day, days):
+    """Napi előrejelzés days napra first_day-től (egy idősor állapotából)"""
+    return [max(level + season[(first_day + timedelta(days=i)).weekday()], 0.0) for i in range(days)]
@@ -0,0 +1,165 @@
+"""
+Feltételes GET (ETag / 304) a csak olvasó oldalakhoz
+
+A telefonok folyamatosan újratöltik a készlet és áthelyezés oldalakat, amelyek
+többnyire nem változtak. Az ETag a következőkből képződik:
+- data_seq: triggerek növelik a készlet táblák (TRACKED_TABLES) minden
+  változásánál, bármelyik processzből,
+- catalog_seq: törzsadat változás (catalog.py),
+- végpont, URL paraméterek, felhasználó, alkalmazás verzió és statikus build
+  (az oldal a hash-es fájlnevekre hivatkozik, lásd assets.py).
+
+Egyező If-None-Match esetén 304 megy vissza a view futtatása (lekérdezések,
+Jinja renderelés) nélkül - az ETag egyetlen egysoros lekérdezésbe kerül.
+A PRAGMA data_version kapcsolatonként relatív érték, ezért ETag-nek nem jó.
+
+Opcionálisan (HTTPCACHE_MAX_BYTES > 0) a renderelt oldalak processzenként
+LRU tárban maradnak, így egy másik kliens (vagy kiürített böngésző cache) első
+kérése is renderelés nélkül kapja meg ugyanazt az oldalt.
+
+Flash üzenetet tartalmazó válasz nem kap ETag-et és nem kerül a tárba.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request, session, make_response, get_flashed_messages
+from flask_login import current_user
+from app import assets, metrics
+from app.database import get_db_connection
+
+# Ezek a táblák határozzák meg a készlet oldalak tartalmát (a törzsadat a catalog_seq-ben);
+# demand_forecasts: a helyszín készlet oldal fedezeti napjai
+TRACKED_TABLES = ('location_inventory', 'inventory', 'inventory_movements', 'demand_forecasts')
+
+
+def init_schema(db):
+    """data_seq számláló és triggerek (init_db hívja)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS data_seq (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    db.execute('INSERT OR IGNORE INTO data_seq (id, version) VALUES (1, 0)')
+
+    for table in TRACKED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_data_seq_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_seq SET version = version + 1 WHERE id = 1;
+                END
+            ''')
+
+
+def restamp(db, min_version):
+    """Backup visszaállítás után: a számláló nem mehet vissza (régi ETag-ek nem egyezhetnek)"""
+    db.execute('UPDATE data_seq SET version = MAX(version, ?) + 1 WHERE id = 1', (min_version,))
+
+
+def data_version(db):
+    row = db.execute('SELECT version FROM data_seq WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def page_etag(db):
+    """Az aktuális kérés oldalának ETag-je"""
+    versions = db.execute('''
+        SELECT (SELECT version FROM data_seq WHERE id = 1),
+               (SELECT version FROM catalog_seq WHERE id = 1)
+    ''').fetchone()
+    key = '|'.join(str(part) for part in (
+        current_app.config['APP_VERSION'], assets.build_id(), request.endpoint, request.full_path,
+        current_user.get_id(), versions[0], versions[1]
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()[:24]
+
+
+class _PageStore:
+    """Renderelt oldalak LRU tára (ETag -> törzs), bájt korláttal"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()
+        self._size = 0
+
+    def get(self, etag):
+        with self._lock:
+            page = self._pages.get(etag)
+            if page is not None:
+                self._pages.move_to_end(etag)
+            return page
+
+    def put(self, etag, body, mimetype, max_bytes):
+        if len(body) > max_bytes:
+            return
+        with self._lock:
+            if etag in self._pages:
+                return
+            self._pages[etag] = (body, mimetype)
+            self._size += len(body)
+            while self._size > max_bytes:
+                _, (old_body, _) = self._pages.popitem(last=False)
+                self._size -= len(old_body)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self._size = 0
+
+
+_store = _PageStore()
+
+
+def _finish(response, etag):
+    response.set_etag(etag)
+    # A böngésző tárolhatja, de minden használat előtt újraellenőriz
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional(view):
+    """
+    View dekorátor (a @login_required alá): GET kérésre ETag, egyezésnél 304,
+    opcionálisan a renderelt oldal kiszolgálása a tárból
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # POST, illetve függő flash üzenet (pl. átirányítás után) esetén nincs gyorsítótár
+        if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+            return view(*args, **kwargs)
+
+        etag = page_etag(get_db_connection())
+
+        if request.if_none_match.contains(etag):
+            metrics.inc('edibes_httpcache_requests_total', {'result': 'not_modified'})
+            return _finish(current_app.response_class(status=304), etag)
+
+        max_bytes = current_app.config['HTTPCACHE_MAX_BYTES']
+        if max_bytes:
+            page = _store.get(etag)
+            if page is not None:
+                metrics.inc('edibes_httpcache_requests_total', {'result': 'hit'})
+                body, mimetype = page
+                return _finish(current_app.response_class(body, mimetype=mimetype), etag)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.direct_passthrough or get_flashed_messages():
+            return response
+
+        metrics.inc('edibes_httpcache_requests_total', {'result': 'miss'})
+        if max_bytes:
+            _store.put(etag, response.get_data(), response.mimetype, max_bytes)
+        return _finish(response, etag)
+
+    return wrapper
+
+
+def reset_after_fork():
+    """Fork után üres tár és új zár a workerben"""
+    global _store
+    _store = _PageStore()
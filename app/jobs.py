@@ -0,0 +1,441 @@
+"""
+Háttér feladatok - tartós feladat sor a jobs táblában
+
+A route-ok csak rögzítik a feladatot (enqueue) és azonnal visszatérnek; a
+feladatokat külön worker processz futtatja (flask --app wsgi jobs worker),
+így a gunicorn kérés szálak szabadok maradnak. Sorrend: prioritás, azon belül
+beérkezés. A feladat kiosztása egyetlen UPDATE ... RETURNING utasítás, így
+több worker (vagy beágyazott worker szál) sem kapja meg kétszer ugyanazt.
+
+Az állapot, haladás és eredmény az adatbázisban van, bármelyik gunicorn
+worker kiszolgálhatja a lekérdezést. Futó feladat leállítása kérésre: a
+feladat a következő haladás jelentésnél áll meg (JobCancelled). A futó
+feladatok szívverést írnak; ha a worker elhal, a beragadt feladatot a
+következő worker hibásnak jelöli.
+"""
+import json
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+from app import metrics
+from app.database import open_connection
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+STATUS_LABELS = {
+    STATUS_QUEUED: 'Várakozik',
+    STATUS_RUNNING: 'Fut',
+    STATUS_DONE: 'Kész',
+    STATUS_FAILED: 'Hiba',
+    STATUS_CANCELLED: 'Leállítva',
+}
+
+# Prioritás: nagyobb érték előbb fut
+PRIORITY_LOW = -10
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 10
+
+# Befejezett feladatok megőrzése (napok)
+RETENTION_DAYS = 7
+
+# Szívverés gyakorisága; ennél régebbi szívverésű futó feladat workere halottnak számít
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = 60
+
+# Üres sor esetén ennyit vár a worker a következő lekérdezésig
+POLL_SECONDS = 1.0
+
+# Feladat típusok: kind -> (függvény, megnevezés); a route modulok regisztrálják
+_handlers = {}
+
+
+class JobCancelled(Exception):
+    """A feladat leállítását kérték"""
+
+
+def handler(kind, label):
+    """
+    Feladat típus regisztrálása (dekorátor)
+    A függvény hívása: func(job, **params), visszatérési értéke (JSON-ozható) az eredmény.
+    Az app kontextus a futás alatt elérhető (current_app.config).
+    """
+    def decorator(func):
+        _handlers[kind] = (func, label)
+        return func
+    return decorator
+
+
+def kind_label(kind):
+    """Feladat típus megnevezése a felülethez"""
+    return _handlers[kind][1] if kind in _handlers else kind
+
+
+def init_schema(db):
+    """jobs és job_workers táblák létrehozása / migrálása"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            params TEXT,
+            progress INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+
+    # Migráció: feladat sor oszlopok a korábbi (csak állapot) jobs táblához
+    columns = {row[1] for row in db.execute('PRAGMA table_info(jobs)')}
+    for column, definition in (('priority', 'INTEGER NOT NULL DEFAULT 0'),
+                               ('cancel_requested', 'INTEGER NOT NULL DEFAULT 0'),
+                               ('worker', 'TEXT'),
+                               ('heartbeat_at', 'TIMESTAMP')):
+        if column not in columns:
+            db.execute(f'ALTER TABLE jobs ADD COLUMN {column} {definition}')
+
+    # A következő feladat kiválasztása ebből az indexből
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority DESC, id)
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS job_workers (
+            name TEXT PRIMARY KEY,
+            pid INTEGER,
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+class Job:
+    """Futó feladat: saját kapcsolat + haladás jelentése"""
+
+    def __init__(self, db, job_id):
+        self.db = db
+        self.id = job_id
+
+    def progress(self, done, total=None, message=None):
+        """
+        Haladás rögzítése (külön rövid tranzakció - a hívó előtte commitoljon)
+        Ha közben leállítást kértek, JobCancelled kivételt dob.
+        """
+        row = self.db.execute('''
+            UPDATE jobs SET progress = ?, total = COALESCE(?, total), message = COALESCE(?, message),
+                heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            RETURNING cancel_requested
+        ''', (done, total, message, self.id)).fetchone()
+        self.db.commit()
+        if row and row[0]:
+            raise JobCancelled()
+
+    def check_cancelled(self):
+        """JobCancelled, ha a feladat leállítását kérték (haladás jelentése nélkül)"""
+        row = self.db.execute('SELECT cancel_requested FROM jobs WHERE id = ?', (self.id,)).fetchone()
+        if row and row[0]:
+            raise JobCancelled()
+
+
+def purge(db):
+    """A megőrzési időnél régebben befejezett feladatok törlése (commit)"""
+    db.execute('''
+        DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < datetime('now', ?)
+    ''', (f'-{RETENTION_DAYS} days',))
+    db.commit()
+
+
+def enqueue(db, kind, params=None, priority=PRIORITY_NORMAL, total=None):
+    """Új feladat a sorba (commit), a régi befejezett feladatok törlésével"""
+    if kind not in _handlers:
+        raise ValueError(f'Ismeretlen feladat típus: {kind}')
+    purge(db)
+    cursor = db.execute('''
+        INSERT INTO jobs (kind, params, priority, total) VALUES (?, ?, ?, ?)
+    ''', (kind, json.dumps(params, ensure_ascii=False) if params else None, priority, total))
+    db.commit()
+    return cursor.lastrowid
+
+
+def enqueue_once(db, kind, params=None, priority=PRIORITY_NORMAL):
+    """
+    Új feladat a sorba, ha nincs már várakozó vagy futó azonos típusú (commit)
+    Egyetlen INSERT ... WHERE NOT EXISTS, így párhuzamos kérésekből sem kerül be kétszer.
+    Visszatér: az új feladat id, vagy None ha már van ilyen
+    """
+    if kind not in _handlers:
+        raise ValueError(f'Ismeretlen feladat típus: {kind}')
+    cursor = db.execute('''
+        INSERT INTO jobs (kind, params, priority)
+        SELECT ?, ?, ?
+        WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE kind = ? AND status IN (?, ?))
+    ''', (kind, json.dumps(params, ensure_ascii=False) if params else None, priority,
+          kind, STATUS_QUEUED, STATUS_RUNNING))
+    db.commit()
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def cancel(db, job_id):
+    """
+    Feladat leállítása: várakozó azonnal leáll, futónál leállítási kérés (commit)
+    Visszatér: a feladat új állapota, vagy None ha már befejeződött / nem létezik
+    """
+    row = db.execute('''
+        UPDATE jobs SET
+            status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+            finished_at = CASE WHEN status = 'queued' THEN CURRENT_TIMESTAMP ELSE finished_at END,
+            cancel_requested = 1
+        WHERE id = ? AND status IN ('queued', 'running')
+        RETURNING status
+    ''', (job_id,)).fetchone()
+    db.commit()
+    return row[0] if row else None
+
+
+def _decode(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params']) if job['params'] else None
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    job['percent'] = round(100 * job['progress'] / job['total']) if job['total'] else None
+    job['finished'] = job['status'] in FINISHED_STATUSES
+    job['label'] = kind_label(job['kind'])
+    job['status_label'] = STATUS_LABELS.get(job['status'], job['status'])
+    return job
+
+
+def get(db, job_id):
+    """Feladat állapota szótárként (JSON API-hoz), vagy None"""
+    row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return _decode(row) if row else None
+
+
+def recent(db, limit=50, status=None):
+    """Legutóbbi feladatok (a várakozók és futók elöl)"""
+    query = 'SELECT * FROM jobs'
+    params = []
+    if status:
+        query += ' WHERE status = ?'
+        params.append(status)
+    query += '''
+        ORDER BY CASE status WHEN 'running' THEN 0 WHEN 'queued' THEN 1 ELSE 2 END,
+                 CASE WHEN status = 'queued' THEN -priority ELSE 0 END, id DESC
+        LIMIT ?
+    '''
+    params.append(limit)
+    return [_decode(row) for row in db.execute(query, params)]
+
+
+def active_workers(db):
+    """Élő workerek (STALE_SECONDS-on belüli szívveréssel)"""
+    return db.execute('''
+        SELECT * FROM job_workers WHERE heartbeat_at >= datetime('now', ?) ORDER BY name
+    ''', (f'-{STALE_SECONDS} seconds',)).fetchall()
+
+
+def recover_stale(db):
+    """Elhalt worker futó feladatainak lezárása hibával (commit); visszatér: darabszám"""
+    count = db.execute('''
+        UPDATE jobs SET status = 'failed', error = 'A feladatot futtató worker leállt', finished_at = CURRENT_TIMESTAMP
+        WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < datetime('now', ?)
+    ''', (f'-{STALE_SECONDS} seconds',)).rowcount
+    db.execute('DELETE FROM job_workers WHERE heartbeat_at < datetime(\'now\', \'-1 day\')')
+    db.commit()
+    return count
+
+
+def _claim(db, worker, job_id=None):
+    """Következő (vagy a megadott) várakozó feladat lefoglalása; visszatér: (id, kind, params) vagy None"""
+    if job_id is None:
+        condition = '''id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1)'''
+        params = (worker,)
+    else:
+        condition = "id = ? AND status = 'queued'"
+        params = (worker, job_id)
+    row = db.execute(f'''
+        UPDATE jobs SET status = 'running', worker = ?, started_at = CURRENT_TIMESTAMP,
+            heartbeat_at = CURRENT_TIMESTAMP
+        WHERE {condition}
+        RETURNING id, kind, params
+    ''', params).fetchone()
+    db.commit()
+    return tuple(row) if row else None
+
+
+def _heartbeat(db_path, job_id, worker, stop):
+    """
+    Szívverés a futó feladatra és a workerre, amíg a stop esemény be nem áll
+    Ha a feladat a busy_timeout-nál tovább tartja az írási zárat (pl. napló javítás), a szívverés
+    "database is locked" hibát kap - ez nem állíthatja le a szálat, különben STALE_SECONDS után
+    egy másik worker a még futó feladatot hibásnak jelölné.
+    """
+    db = open_connection(db_path)
+    try:
+        while not stop.wait(HEARTBEAT_SECONDS):
+            try:
+                db.execute('UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?', (job_id,))
+                db.execute('UPDATE job_workers SET heartbeat_at = CURRENT_TIMESTAMP WHERE name = ?', (worker,))
+                db.commit()
+            except sqlite3.OperationalError as e:
+                if db.in_transaction:
+                    db.rollback()
+                print(f'Feladat #{job_id} szívverés hiba (újrapróbálkozás): {e}')
+    finally:
+        db.close()
+
+
+def run(db_path, job_id=None, worker=None):
+    """
+    Egy feladat futtatása az aktuális szálon, saját kapcsolattal
+    job_id nélkül a sor következő feladata. App kontextusban kell hívni.
+    Visszatér: a lefuttatott feladat azonosítója, vagy None ha nem volt mit futtatni
+    """
+    worker = worker or _worker_name()
+    db = open_connection(db_path)
+    try:
+        claimed = _claim(db, worker, job_id)
+        if not claimed:
+            return None
+        job_id, kind, params = claimed
+
+        stop = threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(db_path, job_id, worker, stop),
+                                name=f'job-{job_id}-heartbeat', daemon=True)
+        beat.start()
+        try:
+            if kind not in _handlers:
+                raise ValueError(f'Ismeretlen feladat típus: {kind}')
+            result = _handlers[kind][0](Job(db, job_id), **(json.loads(params) if params else {}))
+        except JobCancelled:
+            db.rollback()
+            db.execute('''
+                UPDATE jobs SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            ''', (job_id,))
+        except Exception as e:
+            db.rollback()
+            traceback.print_exc()
+            db.execute('''
+                UPDATE jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            ''', (str(e), job_id))
+        else:
+            db.execute('''
+                UPDATE jobs SET status = 'done', result = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'running'
+            ''', (json.dumps(result, ensure_ascii=False, default=str), job_id))
+        finally:
+            stop.set()
+        # A feltételes UPDATE nem írja felül, ha közben (pl. elakadt szívverés miatt) lezárták
+        db.commit()
+        return job_id
+    finally:
+        db.close()
+        # A külön worker processz nem szolgál ki kérést (after_request): a feladat metrikái
+        # (backup idő, DB időzítések) csak így jutnak el a /metrics végpontig
+        metrics.flush()
+
+
+def _worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def work(app, burst=False, stop=None):
+    """
+    Worker ciklus: a sor feladatainak futtatása egymás után
+    burst: üres sornál kilép (cron / teszt); stop: threading.Event a leállításhoz
+    """
+    stop = stop or threading.Event()
+    name = _worker_name()
+    db_path = app.config['DATABASE_PATH']
+
+    with app.app_context():
+        db = open_connection(db_path)
+        try:
+            db.execute('''
+                INSERT OR REPLACE INTO job_workers (name, pid, started_at, heartbeat_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ''', (name, os.getpid()))
+            db.commit()
+
+            last_maintenance = 0
+            while not stop.is_set():
+                # Beragadt feladatok és lejárt eredmények takarítása (percenként)
+                if time.monotonic() - last_maintenance > 60:
+                    recover_stale(db)
+                    purge(db)
+                    last_maintenance = time.monotonic()
+
+                # Minden feladat friss app kontextusban (g-ben tárolt kapcsolat feladatonként)
+                with app.app_context():
+                    job_id = run(db_path, worker=name)
+                if job_id is None:
+                    if burst:
+                        break
+                    db.execute('UPDATE job_workers SET heartbeat_at = CURRENT_TIMESTAMP WHERE name = ?', (name,))
+                    db.commit()
+                    stop.wait(POLL_SECONDS)
+        finally:
+            db.execute('DELETE FROM job_workers WHERE name = ?', (name,))
+            db.commit()
+            db.close()
+            metrics.flush()
+
+
+def install_signal_handlers(stop):
+    """SIGTERM / SIGINT: a futó feladat befejezése után kilépés"""
+    def _stop(signum, frame):
+        stop.set()
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+
+_embedded_lock = threading.Lock()
+_embedded_worker = None
+_embedded_stop = threading.Event()
+
+
+def ensure_embedded_worker(app):
+    """Worker szál a webes processzben (külön worker processz nélküli telepítéshez), processzenként egy"""
+    global _embedded_worker
+    if _embedded_worker is not None and _embedded_worker.is_alive():
+        return _embedded_worker
+    with _embedded_lock:
+        if (_embedded_worker is None or not _embedded_worker.is_alive()) and not _embedded_stop.is_set():
+            _embedded_worker = threading.Thread(target=work, args=(app,), kwargs={'stop': _embedded_stop},
+                                                name='job-worker', daemon=True)
+            _embedded_worker.start()
+    return _embedded_worker
+
+
+def stop_embedded_worker(timeout=None):
+    """Beágyazott worker leállítása a futó feladat befejezése után (gunicorn worker kilépéskor)"""
+    _embedded_stop.set()
+    if _embedded_worker is not None:
+        _embedded_worker.join(timeout)
+
+
+def reset_after_fork():
+    """Fork után (gunicorn preload) a szülő worker szála nem létezik a gyerekben"""
+    global _embedded_lock, _embedded_worker, _embedded_stop
+    _embedded_lock = threading.Lock()
+    _embedded_worker = None
+    _embedded_stop = threading.Event()
@@ -0,0 +1,268 @@
+"""
+Főkönyv (mozgásnapló) egyeztetés - location_inventory újraszámolása a mozgásokból
+
+A helyszínhez kötött mozgásokat (location_id) egyetlen menetben, id sorrendben
+olvassuk. Termék × helyszín páronként egy "rekesz" (slot) tartozik, az
+egyenleg, az utolsó quantity_after és a mozgásszám tömör array tömbökben
+van - így milliós naplónál is csak a párok számával arányos a memória.
+
+Ellenőrzések:
+- eltérés: a mozgások összege (nyitó egyenleg + változások) != location_inventory
+- lánc szakadás: quantity_before != az előző mozgás quantity_after értéke,
+  vagy quantity_after != quantity_before + quantity_change
+- árva visszavonás: REVERSAL hivatkozás nélkül, nem létező / más termékre
+  vagy helyszínre mutató hivatkozással, nem ellentétes mennyiséggel, vagy
+  ugyanaz a mozgás többször visszavonva
+
+Javításkor a mozgásnapló a mérvadó: a location_inventory a napló egyenlegét
+kapja, a szakadt láncok előtte/utána értékei a futó egyenlegből íródnak újra.
+A mozgás nélküli (a napló előtti, pl. régi felületen rögzített) készlet sorokat
+és a negatív egyenlegű párokat a javítás nem módosítja.
+"""
+import re
+import time
+from array import array
+
+# Egyszerre ennyi sort olvasunk a kurzorból
+FETCH_SIZE = 5000
+
+# Tételes listában legfeljebb ennyi hibát adunk vissza típusonként (a számláló mindet számolja)
+MAX_LISTED_ISSUES = 500
+
+# Lebegőpontos összehasonlítás tűrése
+EPSILON = 1e-6
+
+# Csak számok: a szöveges oszlopok (típus, megjegyzés) Python objektummá alakítása
+# milliós naplónál az olvasási idő negyede - a visszavonásokat külön olvassuk
+LEDGER_QUERY = '''
+    SELECT id, product_id, location_id, quantity_change, quantity_before, quantity_after
+    FROM inventory_movements
+    WHERE location_id IS NOT NULL
+    ORDER BY id
+'''
+
+REVERSALS_QUERY = '''
+    SELECT id, reference_movement_id, note, product_id, location_id, quantity_change
+    FROM inventory_movements
+    WHERE movement_type = 'REVERSAL' AND location_id IS NOT NULL
+    ORDER BY id
+'''
+
+# Régi visszavonások (inventory.undo_movement) csak a megjegyzésben hivatkoztak
+_NOTE_REFERENCE = re.compile(r'Visszavonás: #(\d+)')
+
+
+def _ledger_batches(db):
+    """A napló sorai adagonként, sima tuple-ként (sqlite3.Row nélkül - milliós naplónál ez számít)"""
+    cursor = db.cursor()
+    cursor.row_factory = None
+    cursor.execute(LEDGER_QUERY)
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        yield rows
+
+
+def _add_issue(report, kind, issue):
+    report[kind + '_count'] += 1
+    if len(report[kind]) < MAX_LISTED_ISSUES:
+        report[kind].append(issue)
+
+
+def scan(db, row_batches):
+    """
+    Egyeztetés a megadott mozgás adagokon (LEDGER_QUERY oszlopai, id sorrendben)
+    db: a location_inventory és a hivatkozott mozgások lekérdezéséhez (ugyanabban a tranzakcióban)
+    Visszatér: riport szótár; a javításhoz szükséges adatok a '_' kezdetű kulcsokban
+    """
+    started = time.perf_counter()
+
+    slots = {}
+    balances = array('d')
+    last_after = array('d')
+    counts = array('l')
+
+    report = {
+        'movements': 0,
+        'mismatches': [], 'mismatches_count': 0,
+        'chain_breaks': [], 'chain_breaks_count': 0,
+        'orphan_reversals': [], 'orphan_reversals_count': 0,
+    }
+    # Javításhoz: (helyes előtte, helyes utána, mozgás id)
+    chain_fixes = []
+
+    for rows in row_batches:
+        report['movements'] += len(rows)
+        for movement_id, product_id, location_id, change, before, after in rows:
+            key = (product_id, location_id)
+            slot = slots.get(key)
+            if slot is None:
+                # Első mozgás: a quantity_before a nyitó egyenleg (a napló előtti készlet)
+                slot = slots[key] = len(balances)
+                balances.append(before)
+                last_after.append(before)
+                counts.append(0)
+
+            expected_before = balances[slot]
+            expected_after = expected_before + change
+            if abs(before - last_after[slot]) > EPSILON or abs(after - (before + change)) > EPSILON:
+                _add_issue(report, 'chain_breaks', {
+                    'movement_id': movement_id, 'product_id': product_id, 'location_id': location_id,
+                    'quantity_change': change,
+                    'previous_after': last_after[slot], 'quantity_before': before, 'quantity_after': after
+                })
+            if abs(before - expected_before) > EPSILON or abs(after - expected_after) > EPSILON:
+                chain_fixes.append((expected_before, expected_after, movement_id))
+
+            balances[slot] = expected_after
+            last_after[slot] = after
+            counts[slot] += 1
+
+    if report['chain_breaks']:
+        listed = [issue['movement_id'] for issue in report['chain_breaks']]
+        types = dict(db.execute(f'''
+            SELECT id, movement_type FROM inventory_movements WHERE id IN ({",".join("?" * len(listed))})
+        ''', listed).fetchall())
+        for issue in report['chain_breaks']:
+            issue['movement_type'] = types.get(issue['movement_id'])
+
+    _check_reversals(db, report)
+
+    # Napló egyenleg vs location_inventory (a napló nélküli, nem nulla sorok is eltérések)
+    seen = set()
+    for product_id, location_id, quantity in db.execute(
+            'SELECT product_id, location_id, quantity FROM location_inventory'):
+        key = (product_id, location_id)
+        slot = slots.get(key)
+        ledger = balances[slot] if slot is not None else 0.0
+        seen.add(key)
+        if abs(ledger - quantity) > EPSILON:
+            _add_issue(report, 'mismatches', {
+                'product_id': product_id, 'location_id': location_id,
+                'ledger_quantity': ledger, 'stored_quantity': quantity,
+                'movement_count': counts[slot] if slot is not None else 0
+            })
+    for key, slot in slots.items():
+        if key not in seen and abs(balances[slot]) > EPSILON:
+            _add_issue(report, 'mismatches', {
+                'product_id': key[0], 'location_id': key[1],
+                'ledger_quantity': balances[slot], 'stored_quantity': None,
+                'movement_count': counts[slot]
+            })
+
+    report['pairs'] = len(slots)
+    report['elapsed'] = round(time.perf_counter() - started, 3)
+    report['_chain_fixes'] = chain_fixes
+    report['_balances'] = {key: balances[slot] for key, slot in slots.items()}
+    return report
+
+
+def _check_reversals(db, report):
+    """Visszavonások ellenőrzése - a hivatkozott mozgásokat adagonként egy lekérdezéssel olvassuk"""
+    reversals = []
+    for movement_id, reference_id, note, product_id, location_id, change in db.execute(REVERSALS_QUERY):
+        if reference_id is None and note:
+            match = _NOTE_REFERENCE.search(note)
+            reference_id = int(match.group(1)) if match else None
+        reversals.append((movement_id, reference_id, product_id, location_id, change))
+
+    referenced_ids = sorted({reference_id for _, reference_id, _, _, _ in reversals if reference_id})
+    originals = {}
+    for start in range(0, len(referenced_ids), 500):
+        chunk = referenced_ids[start:start + 500]
+        for row in db.execute(f'''
+            SELECT id, product_id, location_id, movement_type, quantity_change
+            FROM inventory_movements WHERE id IN ({",".join("?" * len(chunk))})
+        ''', chunk):
+            originals[row[0]] = row
+
+    reversed_once = set()
+    for movement_id, reference_id, product_id, location_id, change in reversals:
+        problem = None
+        original = originals.get(reference_id) if reference_id else None
+        if not reference_id:
+            problem = 'Nincs hivatkozott mozgás'
+        elif original is None:
+            problem = f'A hivatkozott mozgás (#{reference_id}) nem létezik'
+        elif original[3] == 'REVERSAL':
+            problem = f'Visszavonás visszavonása (#{reference_id})'
+        elif (original[1], original[2]) != (product_id, location_id):
+            problem = f'Más termékre / helyszínre mutat (#{reference_id})'
+        elif abs(original[4] + change) > EPSILON:
+            problem = f'Nem ellentétes mennyiség (#{reference_id}: {original[4]})'
+        elif reference_id in reversed_once:
+            problem = f'Többszörös visszavonás (#{reference_id})'
+        if reference_id:
+            reversed_once.add(reference_id)
+        if problem:
+            _add_issue(report, 'orphan_reversals', {
+                'movement_id': movement_id, 'reference_movement_id': reference_id,
+                'product_id': product_id, 'location_id': location_id,
+                'quantity_change': change, 'problem': problem
+            })
+
+
+def verify(db):
+    """
+    Csak ellenőrzés, egy olvasási tranzakcióban: a napló és a location_inventory
+    ugyanabból a pillanatképből jön (WAL mellett írási zár nélkül)
+    """
+    db.execute('BEGIN')
+    try:
+        report = scan(db, _ledger_batches(db))
+    finally:
+        db.rollback()
+    return {key: value for key, value in report.items() if not key.startswith('_')}
+
+
+def repair(db):
+    """
+    Egyeztetés és javítás egy tranzakcióban, írási zár alatt (commit)
+    A negatív napló egyenlegű és a mozgás nélküli párokat nem írjuk át (csak jelentjük):
+    utóbbiaknál nincs miből újraszámolni, a készlet a napló előtti állapotból származhat.
+    Visszatér: (riport, javított készlet sorok, javított mozgások)
+    """
+    from app import stock
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        report = scan(db, _ledger_batches(db))
+
+        db.executemany('''
+            UPDATE inventory_movements SET quantity_before = ?, quantity_after = ? WHERE id = ?
+        ''', report['_chain_fixes'])
+
+        stored = {(row[0], row[1]): row[2] for row in db.execute(
+            'SELECT product_id, location_id, quantity FROM location_inventory')}
+        fixes = []
+        for key, ledger in report['_balances'].items():
+            if ledger < -EPSILON:
+                continue
+            if key not in stored and abs(ledger) <= EPSILON:
+                continue
+            if key not in stored or abs(stored[key] - ledger) > EPSILON:
+                fixes.append((key[0], key[1], max(ledger, 0.0)))
+
+        db.executemany('''
+            INSERT INTO location_inventory (product_id, location_id, quantity, last_updated)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(product_id, location_id) DO UPDATE SET
+                quantity = excluded.quantity,
+                last_updated = excluded.last_updated
+        ''', fixes)
+        stock.refresh_inventory_totals(db, {product_id for product_id, _, _ in fixes})
+
+        if fixes:
+            # A checkpointok a javítás előtti készletet rögzítették - a visszamenőleges
+            # riport ezután az élő (javított) készletből számol, amíg új checkpoint nem készül
+            db.execute('DELETE FROM stock_snapshots')
+            db.execute('DELETE FROM stock_checkpoints')
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return ({key: value for key, value in report.items() if not key.startswith('_')},
+            len(fixes), len(report['_chain_fixes']))
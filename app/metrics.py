@@ -0,0 +1,311 @@
+"""
+Prometheus-kompatibilis metrikák gyűjtése
+
+Több gunicorn worker esetén minden processz a saját memóriájában számol,
+és időnként a METRICS_DIR/metrics_<pid>.json fájlba írja az állapotát
+(atomikus csere). A /metrics végpont az összes fájlt összesíti, a leállt
+workerek fájljait pedig az archív fájlba olvasztja, így a számlálók
+worker újraindítás után sem esnek vissza.
+"""
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+
+# Késleltetés hisztogram határok (másodperc)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Ennyi másodpercenként írjuk ki a processz állapotát a fájlba
+FLUSH_INTERVAL = 5.0
+
+ARCHIVE_FILENAME = 'metrics_archive.json'
+
+# Metrika leírások: név -> (típus, súgó)
+METRICS = {
+    'edibes_http_requests_total': ('counter', 'HTTP kérések száma végpont és státusz szerint'),
+    'edibes_http_request_duration_seconds': ('histogram', 'HTTP kérések kiszolgálási ideje végpontonként'),
+    'edibes_db_query_duration_seconds': ('histogram', 'SQL utasítások futási ideje (read/write)'),
+    'edibes_db_commit_duration_seconds': ('histogram', 'COMMIT ideje (fsync)'),
+    'edibes_db_lock_wait_seconds': ('histogram', 'Írási zár megszerzésének ideje (tranzakció első írása)'),
+    'edibes_db_busy_total': ('counter', 'Írási zárra várakozások száma (busy handler újrapróbálkozás)'),
+    'edibes_db_locked_errors_total': ('counter', '"database is locked" hibák száma'),
+    'edibes_db_wal_size_bytes': ('gauge', 'A WAL fájl aktuális mérete'),
+    'edibes_db_size_bytes': ('gauge', 'Az adatbázis fájl mérete'),
+    'edibes_backup_duration_seconds': ('gauge', 'Az utolsó backup készítésének ideje'),
+    'edibes_backup_last_timestamp_seconds': ('gauge', 'A legfrissebb helyi backup időbélyege (unix)'),
+    'edibes_backup_age_seconds': ('gauge', 'A legfrissebb helyi backup kora'),
+    'edibes_transfers_total': ('counter', 'Végrehajtott áthelyezések száma forrás és cél helyszínenként'),
+    'edibes_transfer_quantity_total': ('counter', 'Áthelyezett mennyiség forrás és cél helyszínenként'),
+    'edibes_consumptions_total': ('counter', 'Autó kiadások (fogyasztás) száma autónként'),
+    'edibes_consumption_quantity_total': ('counter', 'Kiadott mennyiség autónként'),
+    'edibes_sync_items_total': ('counter', 'Offline szinkron tételek száma eredmény szerint'),
+    'edibes_httpcache_requests_total': ('counter', 'Feltételes GET oldalak: not_modified (304), hit (tárból), miss (renderelve)'),
+    'edibes_writer_batch_size': ('histogram', 'Író szál: egy tranzakcióban (egy COMMIT-tal) végrehajtott parancsok száma'),
+}
+
+# Ennél hosszabb zárszerzés esetén a busy handler biztosan várakozott
+BUSY_THRESHOLD_SECONDS = 0.05
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_state = {
+    'dir': None,
+    'last_flush': 0.0,
+    'pid': os.getpid(),
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def configure(metrics_dir):
+    """Metrika könyvtár beállítása (create_app hívja)"""
+    os.makedirs(metrics_dir, exist_ok=True)
+    _state['dir'] = metrics_dir
+    # Riasztásokhoz a hibaszámlálóknak nulláról is létezniük kell
+    inc('edibes_db_busy_total', value=0)
+    inc('edibes_db_locked_errors_total', value=0)
+
+
+def reset_after_fork():
+    """
+    Fork után (gunicorn preload) a szülő processz számlálóit eldobjuk,
+    különben a szülő fájlja és a gyerek kétszer számolná ugyanazt
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+        _state['pid'] = os.getpid()
+        _state['last_flush'] = 0.0
+
+
+def inc(name, labels=None, value=1.0):
+    """Számláló növelése"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def observe(name, value, labels=None, buckets=DEFAULT_BUCKETS):
+    """Érték rögzítése hisztogramban"""
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            _histograms[key] = hist
+        for i, bound in enumerate(hist['buckets']):
+            if value <= bound:
+                hist['counts'][i] += 1
+                break
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+def set_gauge(name, value, labels=None):
+    """Gauge beállítása - összesítéskor a legfrissebb érték nyer"""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = (float(value), time.time())
+
+
+def maybe_flush():
+    """Kiírás, ha letelt a FLUSH_INTERVAL (after_request hívja)"""
+    if time.time() - _state['last_flush'] >= FLUSH_INTERVAL:
+        flush()
+
+
+def flush():
+    """A processz állapotának kiírása a saját fájljába"""
+    metrics_dir = _state['dir']
+    if not metrics_dir:
+        return
+
+    with _lock:
+        data = _snapshot()
+        _state['last_flush'] = time.time()
+        pid = _state['pid']
+
+    path = os.path.join(metrics_dir, f'metrics_{pid}.json')
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Metrika kiírási hiba: {e}")
+
+
+def _snapshot():
+    return _to_json(_counters, _histograms, _gauges)
+
+
+def _to_json(counters, histograms, gauges):
+    """Belső dict-ek JSON-barát listákká alakítása"""
+    return {
+        'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, dict(labels), h['buckets'], h['counts'], h['sum'], h['count']]
+                       for (name, labels), h in histograms.items()],
+        'gauges': [[name, dict(labels), value, ts] for (name, labels), (value, ts) in gauges.items()],
+    }
+
+
+def _merge(target, data):
+    """Egy fájl tartalmának hozzáadása az összesítéshez"""
+    counters, histograms, gauges = target
+
+    for name, labels, value in data.get('counters', []):
+        key = _key(name, labels)
+        counters[key] = counters.get(key, 0.0) + value
+
+    for name, labels, buckets, counts, total, count in data.get('histograms', []):
+        key = _key(name, labels)
+        hist = histograms.get(key)
+        if hist is None or hist['buckets'] != buckets:
+            hist = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            histograms[key] = hist
+        for i, c in enumerate(counts):
+            hist['counts'][i] += c
+        hist['sum'] += total
+        hist['count'] += count
+
+    for name, labels, value, ts in data.get('gauges', []):
+        key = _key(name, labels)
+        if key not in gauges or gauges[key][1] <= ts:
+            gauges[key] = (value, ts)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collect():
+    """
+    Összes processz metrikájának összesítése
+    A leállt processzek fájljait az archívumba olvasztja (fájlzár alatt)
+    """
+    flush()
+    metrics_dir = _state['dir']
+    aggregate = ({}, {}, {})
+    if not metrics_dir:
+        return aggregate
+
+    lock_path = os.path.join(metrics_dir, 'metrics.lock')
+    archive_path = os.path.join(metrics_dir, ARCHIVE_FILENAME)
+
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            archive = ({}, {}, {})
+            archive_data = _read_json(archive_path)
+            if archive_data:
+                _merge(archive, archive_data)
+
+            dead_files = []
+            for path in glob.glob(os.path.join(metrics_dir, 'metrics_*.json')):
+                name = os.path.basename(path)
+                if name == ARCHIVE_FILENAME:
+                    continue
+                try:
+                    pid = int(name[len('metrics_'):-len('.json')])
+                except ValueError:
+                    continue
+                data = _read_json(path)
+                if data is None:
+                    continue
+                if _pid_alive(pid):
+                    _merge(aggregate, data)
+                else:
+                    _merge(archive, data)
+                    dead_files.append(path)
+
+            archive_json = _to_json(*archive)
+            if dead_files:
+                tmp_path = f'{archive_path}.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump(archive_json, f)
+                os.replace(tmp_path, archive_path)
+                for path in dead_files:
+                    os.remove(path)
+
+            # Archívum hozzáadása az élő processzekhez
+            _merge(aggregate, archive_json)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return aggregate
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + list(extra or [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def _format_value(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render(extra_gauges=None):
+    """
+    Prometheus text exposition formátum előállítása
+    extra_gauges: scrape időben számolt értékek [(név, labels, érték)]
+    """
+    counters, histograms, gauges = collect()
+
+    for name, labels, value in extra_gauges or []:
+        gauges[_key(name, labels)] = (float(value), time.time())
+
+    by_name = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append(('counter', labels, value))
+    for (name, labels), hist in histograms.items():
+        by_name.setdefault(name, []).append(('histogram', labels, hist))
+    for (name, labels), (value, _ts) in gauges.items():
+        by_name.setdefault(name, []).append(('gauge', labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        metric_type, help_text = METRICS.get(name, (by_name[name][0][0], ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for kind, labels, value in sorted(by_name[name], key=lambda item: item[1]):
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(value['buckets'], value['counts']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", repr(float(bound)))])} {cumulative}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value["count"]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {repr(float(value["sum"]))}')
+                lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
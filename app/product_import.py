@@ -0,0 +1,268 @@
+"""
+Termék katalógus import (pl. új nagyker terméklistája) - upsert vonalkód alapján
+
+A fájlt soronként olvassuk, BATCH_SIZE soronként egy tranzakcióban írunk:
+- a hiányzó kategóriákat és mértékegységeket létrehozzuk,
+- a meglévő termékeket egy lekérdezéssel beolvassuk (besorolás: új / módosult / változatlan),
+- az új és módosult sorokat INSERT ... ON CONFLICT(barcode) upserttel írjuk,
+- az audit bejegyzéseket is egy utasítással rögzítjük.
+A kötegenkénti commit miatt hiba esetén a már beírt kötegek megmaradnak;
+az import megismételhető, a második futás a kész sorokat változatlannak látja.
+"""
+from app import stock
+from app.csv_import import iter_csv_rows, parse_number
+from app.database import log_audit_many
+
+# Fejléc nevek (kisbetűvel) -> mező
+HEADER_ALIASES = {
+    'vonalkód': 'barcode', 'vonalkod': 'barcode', 'ean': 'barcode', 'barcode': 'barcode',
+    'név': 'name', 'nev': 'name', 'megnevezés': 'name', 'termék': 'name', 'name': 'name',
+    'kategória': 'category', 'kategoria': 'category', 'category': 'category',
+    'mértékegység': 'unit', 'mertekegyseg': 'unit', 'egység': 'unit', 'unit': 'unit',
+    'kiszerelés': 'package_size', 'kiszereles': 'package_size', 'package_size': 'package_size',
+    'minimum készlet': 'min_stock_level', 'min. készlet': 'min_stock_level',
+    'min_stock_level': 'min_stock_level',
+    'leírás': 'description', 'leiras': 'description', 'description': 'description',
+}
+
+# products oszlop -> fájl mező (a kategória és mértékegység névből id lesz)
+PRODUCT_FIELDS = (
+    ('name', 'name'),
+    ('category_id', 'category'),
+    ('unit_id', 'unit'),
+    ('package_size', 'package_size'),
+    ('min_stock_level', 'min_stock_level'),
+    ('description', 'description'),
+)
+
+# Egy tranzakcióban írt sorok száma (egyben a haladás jelentés lépésköze)
+BATCH_SIZE = 500
+
+# Az eredményben legfeljebb ennyi hibás sort őrzünk meg
+MAX_LISTED_ERRORS = 200
+
+
+def read_header(fields):
+    """Fejléc sor -> {mező: oszlop index}; vonalkód és név oszlop nélkül ValueError"""
+    columns = {}
+    for index, title in enumerate(fields):
+        field = HEADER_ALIASES.get(title.strip().lower())
+        if field and field not in columns:
+            columns[field] = index
+    if 'barcode' not in columns or 'name' not in columns:
+        raise ValueError('A fejlécben kötelező a "Vonalkód" és a "Név" oszlop!')
+    return columns
+
+
+def _parse_row(fields, columns):
+    """Egy adatsor -> (értékek, hiba)"""
+    def value(field):
+        index = columns.get(field)
+        if index is None or index >= len(fields):
+            return None
+        return fields[index] or None
+
+    item = {field: value(field) for field in columns}
+    if not item['barcode']:
+        return None, 'Hiányzó vonalkód'
+    if not item['name']:
+        return None, 'Hiányzó terméknév'
+    if 'min_stock_level' in item:
+        if item['min_stock_level'] is None:
+            item['min_stock_level'] = 0
+        else:
+            item['min_stock_level'] = parse_number(item['min_stock_level'])
+            if item['min_stock_level'] is None or item['min_stock_level'] < 0:
+                return None, 'Hibás minimum készlet'
+    return item, None
+
+
+def _ensure_categories(db, names, stats):
+    """Kategória nevek -> id (kis-nagybetű független), hiányzók létrehozása"""
+    existing = {row['name'].lower(): row for row in db.execute(
+        'SELECT id, name, is_deleted FROM categories'
+    )}
+    ids = {}
+    for name in names:
+        row = existing.get(name.lower())
+        if row is None:
+            ids[name] = db.execute('INSERT INTO categories (name) VALUES (?)', (name,)).lastrowid
+            existing[name.lower()] = {'id': ids[name], 'is_deleted': 0}
+            stats['categories_created'] += 1
+            continue
+        if row['is_deleted']:
+            db.execute('''
+                UPDATE categories SET is_deleted = 0, deleted_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (row['id'],))
+            stats['categories_created'] += 1
+        ids[name] = row['id']
+    return ids
+
+
+def _ensure_units(db, names, stats):
+    """Mértékegység (név vagy rövidítés) -> id, hiányzók létrehozása"""
+    existing = {}
+    for row in db.execute('SELECT id, name, abbreviation, is_deleted FROM units ORDER BY is_deleted'):
+        existing.setdefault(row['abbreviation'].lower(), row)
+        existing.setdefault(row['name'].lower(), row)
+    ids = {}
+    for name in names:
+        row = existing.get(name.lower())
+        if row is None:
+            ids[name] = db.execute('''
+                INSERT INTO units (name, abbreviation) VALUES (?, ?)
+            ''', (name, name)).lastrowid
+            existing[name.lower()] = {'id': ids[name], 'is_deleted': 0}
+            stats['units_created'] += 1
+            continue
+        if row['is_deleted']:
+            db.execute('''
+                UPDATE units SET is_deleted = 0, deleted_at = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (row['id'],))
+            stats['units_created'] += 1
+        ids[name] = row['id']
+    return ids
+
+
+def _apply_batch(db, batch, fields, stats, audit_context):
+    """Egy köteg upsertje egy tranzakcióban"""
+    # Ugyanaz a vonalkód többször a kötegben: az utolsó sor érvényes
+    by_barcode = {}
+    for item in batch:
+        by_barcode[item['barcode']] = item
+    barcodes = list(by_barcode)
+    placeholders = ','.join('?' * len(barcodes))
+
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        category_ids = {}
+        if 'category_id' in fields:
+            category_ids = _ensure_categories(
+                db, {item['category'] for item in by_barcode.values() if item['category']}, stats)
+        unit_ids = {}
+        if 'unit_id' in fields:
+            unit_ids = _ensure_units(
+                db, {item['unit'] for item in by_barcode.values() if item['unit']}, stats)
+
+        existing = {row['barcode']: row for row in db.execute(f'''
+            SELECT id, barcode, is_deleted, {", ".join(fields)}
+            FROM products WHERE barcode IN ({placeholders})
+        ''', barcodes)}
+
+        upserts = []
+        changes = []
+        for barcode, item in by_barcode.items():
+            values = {}
+            for column, field in PRODUCT_FIELDS:
+                if column not in fields:
+                    continue
+                if column == 'category_id':
+                    values[column] = category_ids.get(item['category'])
+                elif column == 'unit_id':
+                    values[column] = unit_ids.get(item['unit'])
+                else:
+                    values[column] = item[field]
+
+            old = existing.get(barcode)
+            if old is None:
+                stats['inserted'] += 1
+                changes.append((barcode, 'INSERT', None, dict(values, barcode=barcode)))
+            else:
+                changed = [column for column in fields if old[column] != values[column]]
+                if not changed and not old['is_deleted']:
+                    stats['unchanged'] += 1
+                    continue
+                stats['updated'] += 1
+                action = 'RESTORE' if old['is_deleted'] else 'UPDATE'
+                changes.append((barcode, action,
+                                {column: old[column] for column in changed},
+                                {column: values[column] for column in changed}))
+            upserts.append([barcode] + [values[column] for column in fields])
+
+        if upserts:
+            db.executemany(f'''
+                INSERT INTO products (barcode, {", ".join(fields)})
+                VALUES (?, {", ".join("?" * len(fields))})
+                ON CONFLICT(barcode) DO UPDATE SET
+                    {", ".join(f"{column} = excluded.{column}" for column in fields)},
+                    is_deleted = 0,
+                    deleted_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', upserts)
+
+            ids = {row['barcode']: row['id'] for row in db.execute(f'''
+                SELECT id, barcode FROM products WHERE barcode IN ({placeholders})
+            ''', barcodes)}
+
+            # Új termékek készlet sora (mint add_product-nál, 0 mennyiséggel)
+            stock.refresh_inventory_totals(
+                db, [ids[barcode] for barcode, action, _, _ in changes if action == 'INSERT'])
+
+            log_audit_many(db, [
+                ('products', ids[barcode], action, old_values, new_values)
+                for barcode, action, old_values, new_values in changes
+            ], audit_context)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def count_rows(text_stream):
+    """Fejléc ellenőrzése és az adatsorok megszámolása (a haladás kijelzéséhez)"""
+    rows = iter_csv_rows(text_stream)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('Üres fájl!')
+    read_header(header[1])
+    return sum(1 for _ in rows)
+
+
+def import_products(db, text_stream, audit_context=(None, None, None), progress=None):
+    """
+    Termék lista importja (első sor: fejléc)
+    progress(feldolgozott sorok) kötegenként hívódik
+    Visszatér: statisztika szótár (inserted, updated, unchanged, ..., errors)
+    """
+    rows = iter_csv_rows(text_stream)
+    header = next(rows, None)
+    if header is None:
+        raise ValueError('Üres fájl!')
+    columns = read_header(header[1])
+    fields = [column for column, field in PRODUCT_FIELDS if field in columns]
+
+    stats = {
+        'inserted': 0, 'updated': 0, 'unchanged': 0,
+        'categories_created': 0, 'units_created': 0,
+        'error_count': 0, 'errors': []
+    }
+
+    processed = 0
+    batch = []
+    for line_number, fields_in_row in rows:
+        processed += 1
+        item, error = _parse_row(fields_in_row, columns)
+        if error:
+            stats['error_count'] += 1
+            if len(stats['errors']) < MAX_LISTED_ERRORS:
+                barcode = fields_in_row[columns['barcode']] if columns['barcode'] < len(fields_in_row) else ''
+                stats['errors'].append((line_number, barcode, error))
+            continue
+
+        batch.append(item)
+        if len(batch) >= BATCH_SIZE:
+            _apply_batch(db, batch, fields, stats, audit_context)
+            batch = []
+            if progress:
+                progress(processed)
+
+    if batch:
+        _apply_batch(db, batch, fields, stats, audit_context)
+    if progress:
+        progress(processed)
+
+    stats['processed'] = processed
+    return stats
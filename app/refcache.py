@@ -0,0 +1,110 @@
+"""
+Törzsadat gyorsítótár (processzenként): helyszínek, kategóriák, mértékegységek
+
+Ezek a kis táblák szinte minden oldalon kellenek (űrlapok, szűrők, helyszín
+választók), de ritkán változnak. A gyorsítótár a catalog_seq verzióhoz kötött
+(lásd catalog.py): a locations / categories / units tábla minden beszúrása és
+módosítása - bármelyik route-ból, importból vagy másik gunicorn workerből -
+trigger által növeli a számlálót, így a következő kérés új verziót lát és
+újratölti a listát. Egy kérés költsége így egyetlen egysoros lekérdezés.
+
+A visszaadott sorok dict-ek, több szál osztozik rajtuk - nem szabad módosítani.
+"""
+import threading
+
+from flask import current_app, g
+from app import catalog
+
+_lock = threading.Lock()
+
+# (adatbázis, név) -> (catalog verzió, sorok)
+_entries = {}
+
+# név -> betöltő függvény(db)
+_loaders = {}
+
+
+def loader(name):
+    """Gyorsítótárazott törzsadat lista regisztrálása"""
+    def decorator(func):
+        _loaders[name] = func
+        return func
+    return decorator
+
+
+@loader('locations')
+def _load_locations(db):
+    # Minden nem törölt helyszín (az inaktívak a mozgás előzmény szűrőhöz kellenek)
+    return tuple(dict(row) for row in db.execute('''
+        SELECT * FROM locations
+        WHERE is_deleted = 0
+        ORDER BY
+            CASE location_type
+                WHEN 'WAREHOUSE' THEN 1
+                WHEN 'CAR' THEN 2
+                WHEN 'VENDING' THEN 3
+            END, name
+    '''))
+
+
+@loader('categories')
+def _load_categories(db):
+    return tuple(dict(row) for row in db.execute('''
+        SELECT id, name FROM categories WHERE is_deleted = 0 ORDER BY name
+    '''))
+
+
+@loader('units')
+def _load_units(db):
+    return tuple(dict(row) for row in db.execute('''
+        SELECT id, name, abbreviation FROM units WHERE is_deleted = 0 ORDER BY name
+    '''))
+
+
+def _version(db):
+    """Katalógus verzió, kérésenként egyszer lekérdezve"""
+    if 'catalog_version' not in g:
+        g.catalog_version = catalog.global_version(db)
+    return g.catalog_version
+
+
+def get(db, name):
+    """Törzsadat lista a gyorsítótárból (új catalog verziónál újratöltve)"""
+    version = _version(db)
+    key = (current_app.config['DATABASE_PATH'], name)
+    entry = _entries.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    rows = _loaders[name](db)
+    with _lock:
+        # Lassabb szál ne írja felül egy újabb verzió listáját
+        current = _entries.get(key)
+        if current is None or current[0] <= version:
+            _entries[key] = (version, rows)
+    return rows
+
+
+def locations(db):
+    """Nem törölt helyszínek (aktív és inaktív), típus majd név szerint"""
+    return get(db, 'locations')
+
+
+def active_locations(db, location_type=None):
+    """Aktív helyszínek típus, majd név szerint; location_type megadásakor csak az adott típus"""
+    return [row for row in get(db, 'locations')
+            if row['is_active'] and (location_type is None or row['location_type'] == location_type)]
+
+
+def categories(db):
+    return get(db, 'categories')
+
+
+def units(db):
+    return get(db, 'units')
+
+
+def reset_after_fork():
+    """Fork után új zár (a master listái a verzió ellenőrzés miatt érvényesek maradhatnak)"""
+    global _lock
+    _lock = threading.Lock()
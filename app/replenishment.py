@@ -0,0 +1,140 @@
+"""
+Automata feltöltés tervezés - mit vigyen az autó az útvonal automatáiba
+
+Egy lekérdezés számol minden termék × automata párra (halmaz alapon, nem
+páronkénti lekérdezésekkel):
+- napi fogyás: az előrejelzés (forecast modul) várható napi fogyása; ahol
+  nincs előrejelzés, az automata kivételezéseinek / fogyasztásainak átlaga
+  az elmúlt LOOKBACK napban, a napi rollup sorokból - ha a páron nincs
+  rögzített eladás, a feltöltések (TRANSFER_IN) átlaga, mint az
+  előrejelzésnél,
+- cél készlet: helyszín minimum készlet + napi fogyás × napok a következő
+  látogatásig,
+- igény: a cél és a jelenlegi készlet különbsége (felfelé kerekítve),
+- autóból: az autó készlete az útvonal sorrendjében elosztva (futó összeg
+  ablakfüggvénnyel), a maradék a raktárból felrakandó mennyiség.
+"""
+import json
+from datetime import datetime, timedelta
+
+from app import forecast
+
+# Alapértelmezések: napok a következő látogatásig, fogyás átlagolási időszaka
+DEFAULT_HORIZON_DAYS = 7
+DEFAULT_LOOKBACK_DAYS = 28
+
+PLAN_QUERY = '''
+    WITH route AS (
+        SELECT CAST(value AS INTEGER) AS location_id, CAST(key AS INTEGER) AS stop
+        FROM json_each(:locations)
+    ),
+    stock AS (
+        SELECT li.location_id, li.product_id, li.quantity, COALESCE(li.min_stock_level, 0) AS min_level
+        FROM location_inventory li
+        WHERE li.location_id IN (SELECT location_id FROM route)
+    ),
+    history AS (
+        SELECT mr.location_id, mr.product_id,
+               -SUM(CASE WHEN mr.movement_type IN (SELECT value FROM json_each(:sales_types))
+                         THEN mr.quantity ELSE 0 END) AS sold,
+               SUM(CASE WHEN mr.movement_type IN (SELECT value FROM json_each(:refill_types))
+                        THEN mr.quantity ELSE 0 END) AS refilled
+        FROM movement_rollups mr
+        WHERE mr.period = 'day' AND mr.bucket >= :since
+          AND mr.location_id IN (SELECT location_id FROM route)
+          AND (mr.movement_type IN (SELECT value FROM json_each(:sales_types))
+               OR mr.movement_type IN (SELECT value FROM json_each(:refill_types)))
+        GROUP BY mr.location_id, mr.product_id
+    ),
+    rates AS (
+        -- Eladás nélküli automatán (csak feltöltés érkezik) a feltöltések átlaga a fogyás
+        SELECT location_id, product_id,
+               CASE WHEN sold > 0 THEN sold ELSE refilled END / :lookback AS daily_rate
+        FROM history
+    ),
+    forecasts AS (
+        SELECT location_id, product_id, daily_rate
+        FROM demand_forecasts
+        WHERE location_id IN (SELECT location_id FROM route)
+    ),
+    pairs AS (
+        SELECT location_id, product_id FROM stock WHERE min_level > 0
+        UNION
+        SELECT location_id, product_id FROM rates WHERE daily_rate > 0
+        UNION
+        SELECT location_id, product_id FROM forecasts WHERE daily_rate > 0
+    ),
+    needs AS (
+        SELECT pr.location_id, pr.product_id,
+               COALESCE(s.quantity, 0) AS quantity,
+               COALESCE(s.min_level, 0) AS min_level,
+               MAX(COALESCE(f.daily_rate, r.daily_rate, 0), 0) AS daily_rate,
+               f.daily_rate IS NOT NULL AS forecasted,
+               COALESCE(s.min_level, 0) + MAX(COALESCE(f.daily_rate, r.daily_rate, 0), 0) * :horizon
+                   - MAX(COALESCE(s.quantity, 0), 0) AS gap
+        FROM pairs pr
+        JOIN products p ON p.id = pr.product_id AND p.is_deleted = 0
+        LEFT JOIN stock s ON s.location_id = pr.location_id AND s.product_id = pr.product_id
+        LEFT JOIN rates r ON r.location_id = pr.location_id AND r.product_id = pr.product_id
+        LEFT JOIN forecasts f ON f.location_id = pr.location_id AND f.product_id = pr.product_id
+    ),
+    rounded AS (
+        SELECT n.*, rt.stop,
+               CASE WHEN gap <= 1e-9 THEN 0
+                    ELSE CAST(gap AS INTEGER) + (gap - CAST(gap AS INTEGER) > 1e-9) END AS need
+        FROM needs n
+        JOIN route rt ON rt.location_id = n.location_id
+    ),
+    allocated AS (
+        SELECT rd.*,
+               MAX(COALESCE(car.quantity, 0), 0) AS car_quantity,
+               SUM(need) OVER (PARTITION BY rd.product_id ORDER BY stop
+                               ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) - need AS need_before
+        FROM rounded rd
+        LEFT JOIN location_inventory car ON car.location_id = :car AND car.product_id = rd.product_id
+        WHERE need > 0
+    )
+    SELECT location_id, stop, product_id, quantity, min_level, daily_rate, forecasted, need, car_quantity,
+           MIN(need, MAX(car_quantity - need_before, 0)) AS from_car
+    FROM allocated
+    ORDER BY stop, product_id
+'''
+
+
+def plan(db, car_id, location_ids, horizon_days=DEFAULT_HORIZON_DAYS, lookback_days=DEFAULT_LOOKBACK_DAYS):
+    """
+    Feltöltési terv egy autóra és automata útvonalra (location_ids: látogatási sorrend)
+    Visszatér: sorok (location_id, stop, product_id, quantity, min_level, daily_rate,
+    forecasted, need, car_quantity, from_car) - csak a pozitív igényű párok
+    A hívó előtte frissítse a rollup sorokat; az előrejelzés a tárolt demand_forecasts sorokból jön.
+    """
+    since = (datetime.utcnow().date() - timedelta(days=lookback_days)).isoformat()
+    return db.execute(PLAN_QUERY, {
+        'locations': json.dumps(list(location_ids)),
+        'sales_types': json.dumps(forecast.SALES_TYPES),
+        'refill_types': json.dumps(forecast.REFILL_TYPES),
+        'lookback': float(lookback_days),
+        'since': since,
+        'horizon': float(horizon_days),
+        'car': car_id,
+    }).fetchall()
+
+
+def summarize(rows):
+    """
+    Terv sorok összesítése
+    Visszatér: (automatánként {location_id: [sorok]}, termékenként {product_id: összesítő})
+    Termék összesítő: need (összes igény), car_quantity, from_car, to_load (raktárból felrakandó)
+    """
+    by_location = {}
+    by_product = {}
+    for row in rows:
+        by_location.setdefault(row['location_id'], []).append(row)
+        total = by_product.setdefault(row['product_id'], {
+            'need': 0, 'car_quantity': row['car_quantity'], 'from_car': 0
+        })
+        total['need'] += row['need']
+        total['from_car'] += row['from_car']
+    for total in by_product.values():
+        total['to_load'] = total['need'] - total['from_car']
+    return by_location, by_product
@@ -0,0 +1,253 @@
+"""
+Mozgás összesítők (rollup) - óránkénti, napi és havi forgalom riportokhoz
+
+A movement_rollups tábla termék × helyszín × mozgástípus bontásban tárolja a
+mozgások összegét és darabszámát óra, nap és hónap szinten. A feldolgozás
+növekményes: a rollup_state vízjel az utolsó feldolgozott mozgás azonosítója,
+frissítéskor csak az utána rögzített mozgásokat olvassuk (CHUNK_SIZE
+mozgásonként egy rövid írási tranzakció). Az új mozgásokat egyszer
+összesítjük órára, a napi és havi sorok ebből az óránkénti deltából
+készülnek. Egy trend riport így néhány száz előre összesített sort olvas a
+teljes mozgásnapló helyett.
+
+A visszavonás (REVERSAL) az eredeti mozgás típusához számít, így a
+visszavont kivételezés nem növeli a fogyasztást. A helyszín nélküli (régi)
+mozgások a 0 helyszínnél szerepelnek. Az időszakok UTC-ben értendők, mint a
+created_at oszlop.
+"""
+from datetime import datetime, timedelta
+
+PERIOD_HOUR = 'hour'
+PERIOD_DAY = 'day'
+PERIOD_WEEK = 'week'
+PERIOD_MONTH = 'month'
+
+# Lekérdezhető időszakok; a heti bontás a napi sorokból készül
+PERIODS = (PERIOD_HOUR, PERIOD_DAY, PERIOD_WEEK, PERIOD_MONTH)
+
+# Tárolt szintek: (szint, időszak kifejezés az óránkénti delta bucket oszlopán)
+STORED_LEVELS = (
+    (PERIOD_HOUR, 'bucket'),
+    (PERIOD_DAY, 'substr(bucket, 1, 10)'),
+    (PERIOD_MONTH, 'substr(bucket, 1, 7)'),
+)
+
+# Ennyi mozgást dolgozunk fel egy tranzakcióban (rövid írási zár)
+CHUNK_SIZE = 50000
+
+# Ekkora lemaradásig (mozgás) a riport oldal a kérésben frissít; fölötte a rollup háttér feladat
+INLINE_REFRESH_LIMIT = 5000
+
+# Óránkénti sorok megőrzése (napok); a napi és havi sorok megmaradnak
+HOURLY_RETENTION_DAYS = 92
+
+# Helyszín nélküli (régi) mozgások helyszín azonosítója a rollupban
+NO_LOCATION = 0
+
+# Csoportosítható dimenziók -> oszlop
+GROUP_COLUMNS = {
+    'location': 'location_id',
+    'product': 'product_id',
+    'type': 'movement_type',
+}
+
+
+def init_schema(db):
+    """Rollup táblák létrehozása (init_db hívja)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS movement_rollups (
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            location_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            movement_type TEXT NOT NULL,
+            quantity REAL NOT NULL DEFAULT 0,
+            movement_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, bucket, location_id, product_id, movement_type)
+        ) WITHOUT ROWID
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_movement_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP
+        )
+    ''')
+    db.execute('INSERT OR IGNORE INTO rollup_state (id, last_movement_id) VALUES (1, 0)')
+
+
+def watermark(db):
+    """Az utolsó összesített mozgás azonosítója"""
+    row = db.execute('SELECT last_movement_id FROM rollup_state WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def lag(db):
+    """
+    Lemaradás a mozgásnaplóhoz képest (olvasás, zár nélkül)
+    Visszatér: szótár (pending: a vízjel utáni mozgások azonosító tartománya, updated_at: az utolsó
+    frissítés UTC ideje vagy None, age_minutes: azóta eltelt percek vagy None)
+    """
+    row = db.execute('''
+        SELECT (SELECT COALESCE(MAX(id), 0) FROM inventory_movements) - last_movement_id,
+               updated_at,
+               CAST((julianday('now') - julianday(updated_at)) * 1440 AS INTEGER)
+        FROM rollup_state WHERE id = 1
+    ''').fetchone()
+    return {'pending': max(row[0], 0), 'updated_at': row[1], 'age_minutes': row[2]}
+
+
+def catch_up(db, limit=INLINE_REFRESH_LIMIT):
+    """
+    Frissítés olvasó oldal előtt: csak kis lemaradás (legfeljebb limit mozgás) összesül a kérésben
+    Visszatér: None ha az összesítők naprakészek, egyébként a lemaradás (lag) - ekkor a hívó a
+    'rollup' háttér feladatra bízza a feldolgozást, az oldal a vízjel szerinti adatot mutatja
+    """
+    state = lag(db)
+    if not state['pending']:
+        return None
+    if state['pending'] > limit:
+        return state
+    refresh(db)
+    return None
+
+
+def _apply_chunk(db, after_id, until_id):
+    """Az (after_id, until_id] mozgások hozzáadása az összesítőkhöz (a hívó tranzakciójában)"""
+    db.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS rollup_delta (
+            bucket TEXT, location_id INTEGER, product_id INTEGER, movement_type TEXT,
+            quantity REAL, movement_count INTEGER
+        )
+    ''')
+    db.execute('DELETE FROM temp.rollup_delta')
+    db.execute(f'''
+        INSERT INTO temp.rollup_delta
+        SELECT strftime('%Y-%m-%d %H:00', m.created_at),
+               COALESCE(m.location_id, {NO_LOCATION}),
+               m.product_id,
+               COALESCE(o.movement_type, m.movement_type),
+               SUM(m.quantity_change),
+               COUNT(*)
+        FROM inventory_movements m
+        LEFT JOIN inventory_movements o
+               ON m.movement_type = 'REVERSAL' AND o.id = m.reference_movement_id
+        WHERE m.id > ? AND m.id <= ?
+        GROUP BY 1, 2, 3, 4
+    ''', (after_id, until_id))
+
+    for period, bucket in STORED_LEVELS:
+        db.execute(f'''
+            INSERT INTO movement_rollups
+                (period, bucket, location_id, product_id, movement_type, quantity, movement_count)
+            SELECT ?, {bucket}, location_id, product_id, movement_type,
+                   SUM(quantity), SUM(movement_count)
+            FROM temp.rollup_delta
+            GROUP BY 2, 3, 4, 5
+            ON CONFLICT (period, bucket, location_id, product_id, movement_type) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                movement_count = movement_count + excluded.movement_count
+        ''', (period,))
+
+    db.execute('''
+        UPDATE rollup_state SET last_movement_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = 1
+    ''', (until_id,))
+
+
+def refresh(db):
+    """
+    Új mozgások összesítése a vízjeltől (CHUNK_SIZE mozgásonként commit)
+    Visszatér: a feldolgozott mozgások azonosító tartományának mérete (0 = naprakész)
+    """
+    processed = 0
+    while True:
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            after_id = watermark(db)
+            last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM inventory_movements').fetchone()[0]
+            if last_id <= after_id:
+                db.rollback()
+                break
+            until_id = min(last_id, after_id + CHUNK_SIZE)
+            _apply_chunk(db, after_id, until_id)
+            if until_id == last_id:
+                _prune_hourly(db)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        processed += until_id - after_id
+        if until_id == last_id:
+            break
+    return processed
+
+
+def rebuild(db):
+    """Összesítők újraépítése a teljes mozgásnaplóból"""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        db.execute('DELETE FROM movement_rollups')
+        db.execute('UPDATE rollup_state SET last_movement_id = 0, updated_at = CURRENT_TIMESTAMP WHERE id = 1')
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return refresh(db)
+
+
+def _prune_hourly(db):
+    """A megőrzési időn túli óránkénti sorok törlése"""
+    cutoff = (datetime.utcnow() - timedelta(days=HOURLY_RETENTION_DAYS)).strftime('%Y-%m-%d 00:00')
+    db.execute("DELETE FROM movement_rollups WHERE period = 'hour' AND bucket < ?", (cutoff,))
+
+
+def series_query(period, start, end, location_id=None, product_id=None, movement_types=None,
+                 group_by=(), by_bucket=True):
+    """
+    Idősor lekérdezés az összesítőkből
+    period: hour / day / week / month; start, end: date (zárt intervallum, havi
+    bontásnál a teljes hónapok számítanak)
+    group_by: a GROUP_COLUMNS kulcsai közül (pl. ('location',))
+    by_bucket=False: a teljes intervallum összesen (bucket oszlop nélkül)
+    Visszatér: (sql, params) - oszlopok: [bucket], [location_id], [product_id],
+    [movement_type], quantity, movement_count
+    """
+    if period not in PERIODS:
+        raise ValueError(f'Ismeretlen időszak: {period}')
+
+    if period == PERIOD_HOUR:
+        level, bucket = PERIOD_HOUR, 'bucket'
+        range_params = [start.isoformat(), (end + timedelta(days=1)).isoformat()]
+        range_filter = 'bucket >= ? AND bucket < ?'
+    elif period == PERIOD_MONTH:
+        level, bucket = PERIOD_MONTH, 'bucket'
+        range_params = [start.strftime('%Y-%m'), end.strftime('%Y-%m')]
+        range_filter = 'bucket BETWEEN ? AND ?'
+    else:
+        level = PERIOD_DAY
+        # Hét: a nap előtti (vagy azonos) hétfő
+        bucket = "date(bucket, '-6 days', 'weekday 1')" if period == PERIOD_WEEK else 'bucket'
+        range_params = [start.isoformat(), end.isoformat()]
+        range_filter = 'bucket BETWEEN ? AND ?'
+
+    filters = ['period = ?', range_filter]
+    params = [level] + range_params
+    if location_id is not None:
+        filters.append('location_id = ?')
+        params.append(location_id)
+    if product_id is not None:
+        filters.append('product_id = ?')
+        params.append(product_id)
+    if movement_types:
+        filters.append(f'movement_type IN ({",".join("?" * len(movement_types))})')
+        params.extend(movement_types)
+
+    columns = ([f'{bucket} AS bucket'] if by_bucket else []) + [GROUP_COLUMNS[key] for key in group_by]
+    positions = ', '.join(str(i) for i in range(1, len(columns) + 1))
+    sql = f'''
+        SELECT {', '.join(columns + ['SUM(quantity) AS quantity', 'SUM(movement_count) AS movement_count'])}
+        FROM movement_rollups
+        WHERE {' AND '.join(filters)}
+        {f'GROUP BY {positions} ORDER BY {positions}' if columns else ''}
+    '''
+    return sql, params
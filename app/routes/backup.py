@@ -3,17 +3,23 @@ Backup kezelési route-ok
 """
 from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, current_app
 from flask_login import login_required
-from app.database import get_db_connection
+from app.database import get_db_connection, create_schema, log_audit_many, audit_context
+from app import catalog, httpcache, jobs, metrics
 from datetime import datetime
 import os
 import shutil
 import glob
+import sqlite3
+import time
 
 backup_bp = Blueprint('backup', __name__, url_prefix='/backup')
 
 
-def create_backup(backup_dir=None, network_backup=False):
-    """Backup létrehozása"""
+def create_backup(backup_dir=None, network_backup=False, db=None):
+    """
+    Backup létrehozása az SQLite online backup API-val (konzisztens WAL módban is)
+    db: a forrás kapcsolat (alapértelmezés: a kérés kapcsolata)
+    """
     if backup_dir is None:
         backup_dir = current_app.config['BACKUP_DIR']
     
@@ -23,11 +29,24 @@ def create_backup(backup_dir=None, network_backup=False):
     backup_filename = f'leltar_backup_{timestamp}.db'
     backup_path = os.path.join(backup_dir, backup_filename)
     
-    # Adatbázis másolása
+    # Ugyanabban a másodpercben készült mentés (pl. visszaállítás előtti mentés) nem írható felül
+    counter = 1
+    while os.path.exists(backup_path):
+        backup_filename = f'leltar_backup_{timestamp}_{counter}.db'
+        backup_path = os.path.join(backup_dir, backup_filename)
+        counter += 1
+    
     source_db = current_app.config['DATABASE_PATH']
     
     if os.path.exists(source_db):
-        shutil.copy2(source_db, backup_path)
+        started = time.perf_counter()
+        # Egy lépésben: a másolás alatti írások (WAL) nem indítják újra a mentést
+        target = sqlite3.connect(backup_path)
+        try:
+            (db or get_db_connection()).backup(target)
+        finally:
+            target.close()
+        metrics.set_gauge('edibes_backup_duration_seconds', time.perf_counter() - started)
         
         # Hálózati mentés ha engedélyezett
         if network_backup and current_app.config.get('NETWORK_BACKUP_PATH'):
@@ -35,7 +54,7 @@ def create_backup(backup_dir=None, network_backup=False):
             try:
                 os.makedirs(network_path, exist_ok=True)
                 network_backup_path = os.path.join(network_path, backup_filename)
-                shutil.copy2(source_db, network_backup_path)
+                shutil.copy2(backup_path, network_backup_path)
             except Exception as e:
                 print(f"Hálózati mentés sikertelen: {e}")
         
@@ -62,6 +81,77 @@ def cleanup_old_backups(backup_dir=None, retention_days=None):
             print(f"Backup törlési hiba: {e}")
 
 
+# ============ Háttér feladatok ============
+
+@jobs.handler('backup', 'Backup készítés')
+def _run_backup(job, network_backup=False):
+    """Háttér feladat: backup készítése (és hálózati másolat)"""
+    job.progress(0, 1, 'Adatbázis mentése...')
+    backup_path = create_backup(network_backup=network_backup, db=job.db)
+    if not backup_path:
+        raise RuntimeError('Backup létrehozása sikertelen - adatbázis nem található!')
+    job.progress(1, 1, 'Kész')
+    return {'filename': os.path.basename(backup_path), 'size': os.path.getsize(backup_path)}
+
+
+@jobs.handler('backup_cleanup', 'Régi backup-ok törlése')
+def _run_backup_cleanup(job):
+    """Háttér feladat: megőrzési időnél régebbi backup-ok törlése"""
+    backup_dir = current_app.config['BACKUP_DIR']
+    before = len(glob.glob(os.path.join(backup_dir, 'leltar_backup_*.db')))
+    cleanup_old_backups()
+    after = len(glob.glob(os.path.join(backup_dir, 'leltar_backup_*.db')))
+    return {'deleted': before - after, 'remaining': after}
+
+
+@jobs.handler('backup_restore', 'Backup visszaállítás')
+def _run_backup_restore(job, filename, audit_context=(None, None, None)):
+    """
+    Háttér feladat: backup visszaállítása (előtte a jelenlegi állapot mentése)
+    A visszaállítás a backup API-val az élő adatbázisba ír, így a többi
+    processz kapcsolatai is az új tartalmat látják. Leállítani csak a
+    visszaállítás megkezdése előtt lehet.
+    """
+    backup_path = os.path.join(current_app.config['BACKUP_DIR'], filename)
+    if not (os.path.exists(backup_path) and filename.startswith('leltar_backup_')):
+        raise FileNotFoundError('Backup fájl nem található!')
+    
+    job.progress(0, 3, 'Jelenlegi állapot mentése...')
+    pre_restore_backup = create_backup(db=job.db)
+    job.progress(1, 3, 'Visszaállítás...')
+    
+    # A futó feladat sora a visszaállított adatbázisban nem létezik (vagy régi) - megőrizzük
+    job_row = dict(job.db.execute('SELECT * FROM jobs WHERE id = ?', (job.id,)).fetchone())
+    catalog_version = catalog.global_version(job.db)
+    data_version = httpcache.data_version(job.db)
+    
+    source = sqlite3.connect(backup_path)
+    try:
+        source.backup(job.db)
+    finally:
+        source.close()
+    
+    # Régebbi backup: séma migráció; a mentés idején várakozó / futó feladatok nem futnak újra
+    create_schema(job.db)
+    catalog.restamp(job.db, catalog_version)
+    httpcache.restamp(job.db, data_version)
+    job.db.execute('DELETE FROM jobs WHERE id = ?', (job.id,))
+    job.db.execute(f'''
+        INSERT INTO jobs ({", ".join(job_row)}) VALUES ({", ".join("?" * len(job_row))})
+    ''', tuple(job_row.values()))
+    job.db.execute('''
+        UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = CURRENT_TIMESTAMP
+        WHERE status IN ('queued', 'running') AND id != ?
+    ''', (job.id,))
+    log_audit_many(job.db, [('backup', None, 'RESTORE', None, {
+        'filename': filename, 'pre_restore_backup': os.path.basename(pre_restore_backup)
+    })], tuple(audit_context))
+    job.db.commit()
+    
+    job.progress(3, 3, 'Kész')
+    return {'filename': filename, 'pre_restore_backup': os.path.basename(pre_restore_backup)}
+
+
 @backup_bp.route('/')
 @login_required
 def backup_page():
@@ -115,19 +205,13 @@ def backup_page():
 @backup_bp.route('/create', methods=['POST'])
 @login_required
 def create_backup_now():
-    """Backup létrehozása most"""
+    """Backup létrehozása - háttér feladatként"""
     network_backup = request.form.get('network_backup', 'false') == 'true'
     
-    try:
-        backup_path = create_backup(network_backup=network_backup)
-        if backup_path:
-            flash(f'Backup sikeresen létrehozva: {os.path.basename(backup_path)}', 'success')
-        else:
-            flash('Backup létrehozása sikertelen - adatbázis nem található!', 'danger')
-    except Exception as e:
-        flash(f'Hiba történt: {str(e)}', 'danger')
-    
-    return redirect(url_for('backup.backup_page'))
+    job_id = jobs.enqueue(get_db_connection(), 'backup', {'network_backup': network_backup},
+                          priority=jobs.PRIORITY_HIGH)
+    flash('Backup készítés elindítva.', 'info')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
 
 
 @backup_bp.route('/download/<path:filename>')
@@ -166,39 +250,28 @@ def delete_backup(filename):
 @backup_bp.route('/restore/<path:filename>', methods=['POST'])
 @login_required
 def restore_backup(filename):
-    """Backup visszaállítása"""
+    """Backup visszaállítása - háttér feladatként (előtte a jelenlegi állapot mentése)"""
     backup_dir = current_app.config['BACKUP_DIR']
     backup_path = os.path.join(backup_dir, filename)
-    db_path = current_app.config['DATABASE_PATH']
     
-    if os.path.exists(backup_path) and filename.startswith('leltar_backup_'):
-        try:
-            # Jelenlegi adatbázisról backup készítése először
-            pre_restore_backup = create_backup()
-            
-            # Visszaállítás
-            shutil.copy2(backup_path, db_path)
-            
-            flash(f'Backup visszaállítva: {filename}. Előző állapot mentve: {os.path.basename(pre_restore_backup)}', 'success')
-        except Exception as e:
-            flash(f'Hiba történt: {str(e)}', 'danger')
-    else:
+    if not (os.path.exists(backup_path) and filename.startswith('leltar_backup_')):
         flash('Backup fájl nem található!', 'danger')
+        return redirect(url_for('backup.backup_page'))
     
-    return redirect(url_for('backup.backup_page'))
+    job_id = jobs.enqueue(get_db_connection(), 'backup_restore',
+                          {'filename': filename, 'audit_context': audit_context()},
+                          priority=jobs.PRIORITY_HIGH)
+    flash(f'Visszaállítás elindítva: {filename}', 'info')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
 
 
 @backup_bp.route('/cleanup', methods=['POST'])
 @login_required
 def cleanup_backups():
-    """Régi backup-ok törlése"""
-    try:
-        cleanup_old_backups()
-        flash('Régi backup-ok törölve!', 'success')
-    except Exception as e:
-        flash(f'Hiba történt: {str(e)}', 'danger')
-    
-    return redirect(url_for('backup.backup_page'))
+    """Régi backup-ok törlése - háttér feladatként"""
+    job_id = jobs.enqueue(get_db_connection(), 'backup_cleanup', priority=jobs.PRIORITY_LOW)
+    flash('Régi backup-ok törlése elindítva.', 'info')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
 
 
 @backup_bp.route('/upload', methods=['POST'])
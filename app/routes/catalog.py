@@ -0,0 +1,55 @@
+"""
+Katalógus (törzsadat) API - delta szinkron és ETag alapú feltételes letöltés
+A mobil kliensek helyben tárolják a katalógust, és csak a változásokat kérik le.
+"""
+from flask import Blueprint, request, jsonify
+from flask_login import login_required
+from app.database import get_db_connection
+from app import catalog
+
+catalog_bp = Blueprint('catalog', __name__, url_prefix='/api/catalog')
+
+
+def conditional_json(payload, etag):
+    """
+    JSON válasz ETag-gel; egyező If-None-Match esetén 304 (üres törzs)
+    A kliens minden alkalommal újraellenőriz (no-cache), de csak változáskor tölt le
+    """
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+@catalog_bp.route('/<kind>')
+@login_required
+def api_catalog(kind):
+    """
+    API: Katalógus lekérdezése
+    URL: /api/catalog/products            - teljes lista
+         /api/catalog/products?since=123  - csak a 123. verzió óta változott sorok
+    Válasz: {"version": aktuális verzió, "full": teljes lista-e, "items": [...]}
+    """
+    if kind not in catalog.CATALOGS:
+        return jsonify({'success': False, 'error': 'Ismeretlen katalógus!'}), 404
+
+    db = get_db_connection()
+
+    since = request.args.get('since', type=int)
+    version = catalog.table_version(db, kind)
+
+    # A kliens verziója újabb, mint a szerveré (pl. backup visszaállítás után): teljes lista
+    if since is not None and since > version:
+        since = None
+
+    etag = f'{kind}-{version}' if since is None else f'{kind}-{version}-{since}'
+    if request.if_none_match.contains(etag):
+        return conditional_json({}, etag)
+
+    return conditional_json({
+        'success': True,
+        'kind': kind,
+        'version': version,
+        'full': since is None,
+        'items': catalog.rows_since(db, kind, since)
+    }, etag)
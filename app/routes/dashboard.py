@@ -5,10 +5,34 @@ from flask import Blueprint, render_template, request
 from flask_login import login_required
 from app.database import get_db_connection
 from app.models import LocationType
+from app.export import export_response
+from app import alerts
+from datetime import datetime
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
 
+def build_audit_filters(args):
+    """
+    Audit napló szűrők (action, table) WHERE feltétellé alakítása - a lista és az export közös
+    Visszatér: (where_sql, params)
+    """
+    conditions = ['1=1']
+    params = []
+    
+    action_filter = args.get('action', '')
+    if action_filter:
+        conditions.append('action = ?')
+        params.append(action_filter)
+    
+    table_filter = args.get('table', '')
+    if table_filter:
+        conditions.append('table_name = ?')
+        params.append(table_filter)
+    
+    return ' AND '.join(conditions), params
+
+
 @dashboard_bp.route('/')
 @login_required
 def index():
@@ -112,6 +136,11 @@ def index():
         LIMIT 10
     ''').fetchall()
     
+    # Helyszínenkénti riasztások (helyszín minimum szint alatt) - csak a változott párok újraértékelése
+    alerts.refresh(db)
+    location_alerts = alerts.active_alerts(db, limit=10)
+    stats['location_alert_count'] = alerts.active_count(db)
+    
     # Utolsó 10 készletmozgás helyszín információval
     recent_movements = db.execute('''
         SELECT 
@@ -141,6 +170,7 @@ def index():
                          location_stats=location_stats,
                          category_stats=category_stats,
                          low_stock_products=low_stock_products,
+                         location_alerts=location_alerts,
                          recent_movements=recent_movements,
                          LocationType=LocationType)
 
@@ -157,20 +187,13 @@ def audit_log():
     page = request.args.get('page', 1, type=int)
     per_page = 50
     
+    filters, params = build_audit_filters(request.args)
+    
     # Alap lekérdezés
-    query = '''
+    query = f'''
         SELECT * FROM audit_log
-        WHERE 1=1
+        WHERE {filters}
     '''
-    params = []
-    
-    if action_filter:
-        query += ' AND action = ?'
-        params.append(action_filter)
-    
-    if table_filter:
-        query += ' AND table_name = ?'
-        params.append(table_filter)
     
     # Összesítés
     count_query = query.replace('SELECT *', 'SELECT COUNT(*) as cnt')
@@ -196,3 +219,26 @@ def audit_log():
                          per_page=per_page,
                          total=total,
                          total_pages=(total + per_page - 1) // per_page)
+
+
+@dashboard_bp.route('/audit-log/export')
+@login_required
+def export_audit_log():
+    """Audit napló exportálása (CSV / XLSX) - a lista szűrőivel, lapozás nélkül"""
+    filters, params = build_audit_filters(request.args)
+    
+    query = f'''
+        SELECT id, created_at, action, table_name, record_id,
+               old_values, new_values, user_id, ip_address, user_agent
+        FROM audit_log
+        WHERE {filters}
+        ORDER BY id
+    '''
+    
+    headers = ['ID', 'Időpont (UTC)', 'Művelet', 'Tábla', 'Rekord ID',
+               'Régi értékek', 'Új értékek', 'Felhasználó', 'IP cím', 'Böngésző']
+    
+    return export_response(query, params, headers,
+                           filename=f'audit_naplo_{datetime.now().strftime("%Y%m%d")}',
+                           export_format=request.args.get('format', 'csv'),
+                           sheet_name='Audit napló')
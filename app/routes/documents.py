@@ -0,0 +1,238 @@
+"""
+Mozgás bizonylatok: lista (fejeken lapozva), részletek, több tételes áthelyezés, visszavonás
+"""
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required
+from app.database import get_db_connection, log_audit, audit_context
+from app import documents, refcache, writer
+from app.routes.transfer import count_transfers
+
+documents_bp = Blueprint('documents', __name__, url_prefix='/documents')
+
+# Bizonylat lista lapozás (JSON módban per_page állítható)
+DOCUMENTS_PAGE_SIZE = 50
+DOCUMENTS_MAX_PAGE_SIZE = 200
+
+DOCUMENT_FIELDS = ('id', 'document_type', 'location_id', 'source_location_id', 'target_location_id',
+                   'note', 'line_count', 'total_quantity', 'reverses_document_id',
+                   'reversed_by_document_id', 'created_by', 'created_at')
+
+LINE_FIELDS = ('id', 'product_id', 'product_name', 'movement_type', 'location_id', 'quantity_change',
+               'quantity_before', 'quantity_after', 'reference_movement_id', 'reversed_by')
+
+
+@writer.command('document_transfer')
+def book_transfer_document(db, items, source_location_id, target_location_id, document_type, note=None,
+                           created_by=None):
+    """Több tételes áthelyezés az író szálon, egy tranzakcióban; visszatér: a bizonylat id"""
+    return documents.book_transfer(db, items, source_location_id, target_location_id,
+                                   document_type, note, created_by)
+
+
+@writer.command('document_reverse')
+def reverse_document(db, document_id, created_by=None):
+    """Bizonylat visszavonása az író szálon; visszatér: a sztornó bizonylat id"""
+    return documents.reverse(db, document_id, created_by)
+
+
+@documents_bp.route('/')
+@login_required
+def list_documents():
+    """
+    Bizonylatok listája - a fejeken lapozva (a tételszám és összmennyiség a fejben van)
+    ?format=json esetén JSON
+    """
+    db = get_db_connection()
+    
+    document_type = request.args.get('type', '')
+    if document_type not in documents.DOCUMENT_TYPES:
+        document_type = ''
+    location_id = request.args.get('location', type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = DOCUMENTS_PAGE_SIZE
+    if request.args.get('format') == 'json':
+        per_page = min(max(request.args.get('per_page', DOCUMENTS_PAGE_SIZE, type=int), 1), DOCUMENTS_MAX_PAGE_SIZE)
+    
+    query = '''
+        SELECT d.*, l.name as location_name, sl.name as source_location_name,
+               tl.name as target_location_name,
+               COUNT(*) OVER () as total_count
+        FROM movement_documents d
+        LEFT JOIN locations l ON d.location_id = l.id
+        LEFT JOIN locations sl ON d.source_location_id = sl.id
+        LEFT JOIN locations tl ON d.target_location_id = tl.id
+        WHERE 1 = 1
+    '''
+    params = []
+    
+    if document_type:
+        query += ' AND d.document_type = ?'
+        params.append(document_type)
+    
+    if location_id:
+        query += ' AND ? IN (d.location_id, d.source_location_id, d.target_location_id)'
+        params.append(location_id)
+    
+    page_query = query + ' ORDER BY d.id DESC LIMIT ? OFFSET ?'
+    rows = db.execute(page_query, params + [per_page, (page - 1) * per_page]).fetchall()
+    
+    if rows:
+        total = rows[0]['total_count']
+    elif page > 1:
+        # Az utolsó oldalon túl nincs sor, ami a darabszámot hordozná
+        total = db.execute(f'SELECT COUNT(*) FROM ({query})', params).fetchone()[0]
+    else:
+        total = 0
+    total_pages = max((total + per_page - 1) // per_page, 1)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'has_more': page < total_pages,
+            'documents': [{key: row[key] for key in DOCUMENT_FIELDS} for row in rows]
+        })
+    
+    # Szűrők a lapozó linkekhez (üres értékek nélkül)
+    filter_args = {key: value for key, value in (('type', document_type), ('location', location_id)) if value}
+    
+    return render_template('documents/list.html',
+                         documents=rows,
+                         locations=sorted(refcache.locations(db), key=lambda row: row['name']),
+                         type_labels=documents.DOCUMENT_TYPES,
+                         selected_type=document_type,
+                         selected_location=location_id,
+                         page=page,
+                         total=total,
+                         total_pages=total_pages,
+                         filter_args=filter_args)
+
+
+@documents_bp.route('/<int:document_id>')
+@login_required
+def document_detail(document_id):
+    """Bizonylat fej és tételek; ?format=json esetén JSON"""
+    db = get_db_connection()
+    document = documents.get(db, document_id)
+    
+    if not document:
+        if request.args.get('format') == 'json':
+            return jsonify({'success': False, 'error': 'Bizonylat nem található!'}), 404
+        flash('Bizonylat nem található!', 'danger')
+        return redirect(url_for('documents.list_documents'))
+    
+    lines = documents.lines(db, document_id)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'document': {key: document[key] for key in DOCUMENT_FIELDS},
+            'lines': [{key: line[key] for key in LINE_FIELDS} for line in lines]
+        })
+    
+    return render_template('documents/detail.html',
+                         document=document,
+                         lines=lines,
+                         type_labels=documents.DOCUMENT_TYPES,
+                         reversible=(document['document_type'] != documents.REVERSAL
+                                     and not document['reversed_by_document_id']
+                                     and any(not line['reversed_by'] for line in lines)))
+
+
+def _transfer_request():
+    """Áthelyezés bizonylat adatai JSON törzsből vagy űrlapból (product_id[] / quantity[] listák)"""
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        try:
+            items = [(int(line['product_id']), float(line['quantity'])) for line in data.get('lines') or []]
+            source_id = int(data.get('source_location_id') or 0)
+            target_id = int(data.get('target_location_id') or 0)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Hibás tétel a bizonylaton!')
+        return source_id, target_id, data.get('document_type'), (data.get('note') or '').strip() or None, items
+    
+    product_ids = request.form.getlist('product_id', type=int)
+    quantities = request.form.getlist('quantity', type=float)
+    if len(product_ids) != len(quantities):
+        raise ValueError('Hibás tétel a bizonylaton!')
+    # Az űrlapon a 0 mennyiségű sorok kimaradnak (a tervből nem kell minden tétel)
+    items = [(product_id, quantity) for product_id, quantity in zip(product_ids, quantities) if quantity]
+    return (request.form.get('source_location_id', type=int), request.form.get('target_location_id', type=int),
+            request.form.get('document_type') or None, request.form.get('note', '').strip() or None, items)
+
+
+@documents_bp.route('/transfer', methods=['POST'])
+@login_required
+def create_transfer_document():
+    """
+    Több tételes áthelyezés egy bizonylaton (autó rakodás, automata töltés)
+    JSON: {source_location_id, target_location_id, document_type?, note?, lines: [{product_id, quantity}]}
+    Űrlap: ugyanezek, a tételek product_id / quantity listákban
+    """
+    db = get_db_connection()
+    is_json = request.is_json
+    
+    try:
+        source_id, target_id, document_type, note, items = _transfer_request()
+    
+        locations = {loc['id']: loc for loc in refcache.active_locations(db)}
+        source = locations.get(source_id)
+        target = locations.get(target_id)
+        if not source or not target:
+            raise ValueError('Forrás és cél helyszín kiválasztása kötelező!')
+        if document_type is None:
+            document_type = documents.transfer_type(source, target)
+        elif document_type not in (documents.LOAD, documents.REFILL, documents.TRANSFER):
+            raise ValueError('Érvénytelen bizonylat típus!')
+    
+        document_id = writer.execute('document_transfer', items=items, source_location_id=source_id,
+                                     target_location_id=target_id, document_type=document_type, note=note,
+                                     created_by=audit_context()[0])
+        count_transfers(source_id, target_id, sum(quantity for _, quantity in items), count=len(items))
+    except ValueError as e:
+        if is_json:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        flash(str(e), 'danger')
+        return redirect(request.referrer or url_for('documents.list_documents'))
+    except Exception as e:
+        if is_json:
+            return jsonify({'success': False, 'error': str(e)}), 500
+        flash(f'Hiba történt: {str(e)}', 'danger')
+        return redirect(request.referrer or url_for('documents.list_documents'))
+    
+    log_audit('movement_documents', document_id, 'CREATE', new_values={
+        'document_type': document_type,
+        'source_location_id': source_id,
+        'target_location_id': target_id,
+        'lines': len(items),
+        'note': note
+    })
+    
+    message = f'{documents.DOCUMENT_TYPES[document_type]} könyvelve: #{document_id} ({source["name"]} → {target["name"]})'
+    if is_json:
+        return jsonify({'success': True, 'document_id': document_id, 'message': message})
+    flash(message, 'success')
+    return redirect(url_for('documents.document_detail', document_id=document_id))
+
+
+@documents_bp.route('/<int:document_id>/reverse', methods=['POST'])
+@login_required
+def reverse(document_id):
+    """
+    A teljes bizonylat visszavonása egy sztornó bizonylattal, egy tranzakcióban
+    Nem töröljük az eredeti tételeket, hanem ellentétes mozgásokat hozunk létre!
+    """
+    try:
+        reversal_id = writer.execute('document_reverse', document_id=document_id, created_by=audit_context()[0])
+    except ValueError as e:
+        flash(f'Visszavonás sikertelen: {str(e)}', 'danger')
+        return redirect(url_for('documents.document_detail', document_id=document_id))
+    except Exception as e:
+        flash(f'Hiba történt: {str(e)}', 'danger')
+        return redirect(url_for('documents.document_detail', document_id=document_id))
+    
+    log_audit('movement_documents', document_id, 'REVERSE', new_values={'reversal_document_id': reversal_id})
+    flash(f'Bizonylat visszavonva (sztornó: #{reversal_id})', 'success')
+    return redirect(url_for('documents.document_detail', document_id=reversal_id))
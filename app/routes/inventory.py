@@ -1,15 +1,59 @@
 """
 Készletkezelési route-ok
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, get_template_attribute
 from flask_login import login_required
-from app.database import get_db_connection, log_audit
+from app.database import get_db_connection, log_audit, log_audit_many, audit_context
 from app.models import MovementType, LocationType
+from app.export import export_response
+from app.stock import StockChange
+from app.csv_import import iter_csv_rows, parse_number
+from app.routes.transfer import find_reversal
+from app import csv_import, documents, httpcache, jobs, ledger, refcache, stock, stocktake, writer
 from datetime import datetime, timedelta
+import os
 
 inventory_bp = Blueprint('inventory', __name__, url_prefix='/inventory')
 
 
+def build_movement_filters(args):
+    """
+    Mozgás szűrők (product, type, location, date_from, date_to) WHERE feltétellé alakítása
+    A történet oldal és az export ugyanezt használja, így pontosan ugyanazokat a sorokat adják.
+    Visszatér: (where_sql, params) - az "im" alias az inventory_movements táblára mutat
+    """
+    conditions = ['1=1']
+    params = []
+    
+    product_id = args.get('product', type=int)
+    if product_id:
+        conditions.append('im.product_id = ?')
+        params.append(product_id)
+    
+    movement_type = args.get('type', '')
+    if movement_type:
+        conditions.append('im.movement_type = ?')
+        params.append(movement_type)
+    
+    location_id = args.get('location', type=int)
+    if location_id:
+        conditions.append('(im.location_id = ? OR im.source_location_id = ? OR im.target_location_id = ?)')
+        params.extend([location_id, location_id, location_id])
+    
+    # Tartomány feltétel DATE() függvény nélkül, hogy a created_at index használható legyen
+    date_from = args.get('date_from', '')
+    if date_from:
+        conditions.append('im.created_at >= ?')
+        params.append(date_from)
+    
+    date_to = args.get('date_to', '')
+    if date_to:
+        conditions.append("im.created_at < DATE(?, '+1 day')")
+        params.append(date_to)
+    
+    return ' AND '.join(conditions), params
+
+
 @inventory_bp.route('/debug-stock')
 @login_required
 def debug_stock():
@@ -52,14 +96,13 @@ def debug_stock():
     return jsonify(result)
 
 
-@inventory_bp.route('/fix-duplicates')
-@login_required
-def fix_duplicates():
+@jobs.handler('fix_duplicates', 'Raktár duplikáció javítás')
+def _run_fix_duplicates(job):
     """
-    FIX: Központi Raktár készlet nullázása, Autó #1 marad.
+    Háttér feladat - FIX: Központi Raktár készlet nullázása, Autó #1 marad.
     Egyúttal megjelöli hogy a migráció kész, hogy ne fusson újra.
     """
-    db = get_db_connection()
+    db = job.db
     
     # Raktár helyszín ID
     warehouse = db.execute('''
@@ -67,7 +110,7 @@ def fix_duplicates():
     ''').fetchone()
     
     if not warehouse:
-        return jsonify({'success': False, 'message': 'Nincs raktár helyszín!'})
+        raise ValueError('Nincs raktár helyszín!')
     
     warehouse_id = warehouse['id']
     
@@ -85,11 +128,82 @@ def fix_duplicates():
     
     db.commit()
     
-    return jsonify({
-        'success': True,
+    return {
         'fixed_count': fixed_count,
         'message': f'Központi Raktár készlete nullázva ({fixed_count} termék). Migráció kikapcsolva.'
-    })
+    }
+
+
+@inventory_bp.route('/fix-duplicates')
+@login_required
+def fix_duplicates():
+    """FIX: Központi Raktár készlet nullázása - háttér feladatként, az állapot a feladat API-n"""
+    job_id = jobs.enqueue(get_db_connection(), 'fix_duplicates', priority=jobs.PRIORITY_HIGH)
+    
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'status_url': url_for('jobs.api_job', job_id=job_id),
+        'message': 'Javítás elindítva háttér feladatként.'
+    }), 202
+
+
+def _ledger_issue_names(db, report):
+    """Termék és helyszín nevek a riport tételeihez"""
+    products = {row['id']: row['name'] for row in db.execute('SELECT id, name FROM products')}
+    locations = {row['id']: row['name'] for row in db.execute('SELECT id, name FROM locations')}
+    for kind in ('mismatches', 'chain_breaks', 'orphan_reversals'):
+        for issue in report[kind]:
+            issue['product_name'] = products.get(issue['product_id'], f'#{issue["product_id"]}')
+            issue['location_name'] = locations.get(issue['location_id'], f'#{issue["location_id"]}')
+    return report
+
+
+@inventory_bp.route('/ledger-check')
+@login_required
+def ledger_check():
+    """
+    Főkönyv egyeztetés: location_inventory vs mozgásnapló (csak olvasás)
+    ?format=json esetén JSON riport (pl. monitorozáshoz)
+    """
+    db = get_db_connection()
+    report = ledger.verify(db)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, **report})
+    
+    return render_template('inventory/ledger_check.html',
+                         report=_ledger_issue_names(db, report),
+                         max_listed=ledger.MAX_LISTED_ISSUES)
+
+
+@jobs.handler('ledger_repair', 'Főkönyv javítás')
+def _run_ledger_repair(job, audit_context=(None, None, None)):
+    """Háttér feladat: location_inventory a napló egyenlegére, láncok újraszámolása (egy tranzakció)"""
+    job.progress(0, 1, 'Egyeztetés és javítás...')
+    report, stock_fixes, chain_fixes = ledger.repair(job.db)
+    
+    log_audit_many(job.db, [('location_inventory', None, 'LEDGER_REPAIR', None, {
+        'stock_rows': stock_fixes,
+        'movements': chain_fixes,
+        'mismatches': report['mismatches_count'],
+        'chain_breaks': report['chain_breaks_count'],
+        'orphan_reversals': report['orphan_reversals_count']
+    })], tuple(audit_context))
+    job.db.commit()
+    
+    job.progress(1, 1, f'{stock_fixes} készlet sor és {chain_fixes} mozgás előtte/utána értéke javítva')
+    return {'stock_rows': stock_fixes, 'movements': chain_fixes}
+
+
+@inventory_bp.route('/ledger-check/repair', methods=['POST'])
+@login_required
+def ledger_repair():
+    """Főkönyv javítása - háttér feladatként (írási zár alatt, egy tranzakció)"""
+    job_id = jobs.enqueue(get_db_connection(), 'ledger_repair', {'audit_context': audit_context()},
+                          priority=jobs.PRIORITY_HIGH)
+    flash('Főkönyv javítás elindítva.', 'info')
+    return redirect(url_for('jobs.job_detail', job_id=job_id))
 
 
 @inventory_bp.route('/reset-all-stock')
@@ -119,10 +233,58 @@ def reset_all_stock():
     })
 
 
+# Készlet lista lapozás: alapértelmezett és legnagyobb oldalméret (JSON módban per_page állítható)
+INVENTORY_PAGE_SIZE = 50
+INVENTORY_MAX_PAGE_SIZE = 200
+
+# Rendezés: paraméter -> ORDER BY (p.id a végén, hogy a lapozás stabil legyen)
+INVENTORY_SORTS = {
+    'name': 'p.name, p.id',
+    'quantity': 'current_quantity, p.name, p.id',
+    'quantity_desc': 'current_quantity DESC, p.name, p.id',
+    'category': 'c.name IS NULL, c.name, p.name, p.id',
+    'updated': 'last_updated IS NULL, last_updated DESC, p.id',
+}
+
+
+def page_location_quantities(db, product_ids):
+    """
+    Helyszínenkénti készlet csak a megadott termékekre (a lista aktuális oldala)
+    Visszatér: {product_id: [{location_id, location_name, location_type, quantity}, ...]}, helyszín sorrendben
+    """
+    if not product_ids:
+        return {}
+    
+    quantities = {}
+    for row in db.execute(f'''
+        SELECT product_id, location_id, quantity FROM location_inventory
+        WHERE product_id IN ({",".join("?" * len(product_ids))}) AND quantity > 0
+    ''', product_ids):
+        quantities[(row['product_id'], row['location_id'])] = row['quantity']
+    
+    result = {}
+    for location in refcache.active_locations(db):
+        for product_id in product_ids:
+            quantity = quantities.get((product_id, location['id']))
+            if quantity is not None:
+                result.setdefault(product_id, []).append({
+                    'location_id': location['id'],
+                    'location_name': location['name'],
+                    'location_type': location['location_type'],
+                    'quantity': quantity
+                })
+    return result
+
+
 @inventory_bp.route('/')
 @login_required
+@httpcache.conditional
 def list_inventory():
-    """Készlet listázása - helyszínenkénti bontással"""
+    """
+    Készlet listázása - helyszínenkénti bontással, lapozva
+    Szűrés, rendezés és lapozás SQL-ben; a helyszínenkénti bontás csak az oldal termékeire.
+    ?format=json esetén JSON (végtelen görgetéshez / mobil kliensnek), html=1-gyel a renderelt sorokkal
+    """
     db = get_db_connection()
     
     # Szűrési paraméterek
@@ -130,27 +292,27 @@ def list_inventory():
     category_id = request.args.get('category', type=int)
     stock_filter = request.args.get('stock', '')  # 'low', 'zero', 'all'
     location_id = request.args.get('location', type=int)  # helyszín szűrő
+    sort = request.args.get('sort', 'name')
+    if sort not in INVENTORY_SORTS:
+        sort = 'name'
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = INVENTORY_PAGE_SIZE
+    if request.args.get('format') == 'json':
+        per_page = min(max(request.args.get('per_page', INVENTORY_PAGE_SIZE, type=int), 1), INVENTORY_MAX_PAGE_SIZE)
     
     # Helyszínek lekérdezése
-    locations = db.execute('''
-        SELECT id, name, location_type FROM locations 
-        WHERE is_deleted = 0 AND is_active = 1
-        ORDER BY 
-            CASE location_type 
-                WHEN 'WAREHOUSE' THEN 1 
-                WHEN 'CAR' THEN 2 
-                WHEN 'VENDING' THEN 3 
-            END, name
-    ''').fetchall()
+    locations = refcache.active_locations(db)
     
     # Össz készlet lekérdezése (location_inventory táblából - csak aktív helyszínekről)
+    # total_count: a szűrt termékek száma (ablakfüggvény, a lapozás előtt számolva)
     query = '''
         SELECT 
             p.id, p.name, p.barcode, p.package_size, p.min_stock_level,
             c.name as category_name,
             u.abbreviation as unit_abbr,
             COALESCE(SUM(CASE WHEN l.is_deleted = 0 THEN li.quantity ELSE 0 END), 0) as current_quantity,
-            MAX(li.last_updated) as last_updated
+            MAX(li.last_updated) as last_updated,
+            COUNT(*) OVER () as total_count
         FROM products p
         LEFT JOIN categories c ON p.category_id = c.id
         LEFT JOIN units u ON p.unit_id = u.id
@@ -181,47 +343,51 @@ def list_inventory():
     elif stock_filter == 'zero':
         query += ' HAVING current_quantity = 0 OR current_quantity IS NULL'
     
-    query += ' ORDER BY p.name'
+    page_query = query + f' ORDER BY {INVENTORY_SORTS[sort]} LIMIT ? OFFSET ?'
+    
+    inventory = db.execute(page_query, params + [per_page, (page - 1) * per_page]).fetchall()
     
-    inventory = db.execute(query, params).fetchall()
+    if inventory:
+        total = inventory[0]['total_count']
+    elif page > 1:
+        # Az utolsó oldalon túl nincs sor, ami a darabszámot hordozná
+        total = db.execute(f'SELECT COUNT(*) FROM ({query})', params).fetchone()[0]
+    else:
+        total = 0
+    total_pages = max((total + per_page - 1) // per_page, 1)
     
-    # Helyszínenkenti készlet minden termékhez
+    # Helyszínenkenti készlet az oldal termékeihez
     location_quantities = {}
     if not location_id:  # Csak ha nincs helyszín szűrő
-        location_qty_query = '''
-            SELECT 
-                li.product_id,
-                li.location_id,
-                l.name as location_name,
-                l.location_type,
-                li.quantity
-            FROM location_inventory li
-            JOIN locations l ON li.location_id = l.id
-            WHERE l.is_deleted = 0 AND l.is_active = 1 AND li.quantity > 0
-            ORDER BY 
-                CASE l.location_type 
-                    WHEN 'WAREHOUSE' THEN 1 
-                    WHEN 'CAR' THEN 2 
-                    WHEN 'VENDING' THEN 3 
-                END, l.name
-        '''
-        location_qty_rows = db.execute(location_qty_query).fetchall()
-        
-        for row in location_qty_rows:
-            product_id = row['product_id']
-            if product_id not in location_quantities:
-                location_quantities[product_id] = []
-            location_quantities[product_id].append({
-                'location_id': row['location_id'],
-                'location_name': row['location_name'],
-                'location_type': row['location_type'],
-                'quantity': row['quantity']
-            })
+        location_quantities = page_location_quantities(db, [item['id'] for item in inventory])
+    
+    if request.args.get('format') == 'json':
+        result = {
+            'success': True,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'has_more': page < total_pages,
+            'items': [
+                dict({key: item[key] for key in ('id', 'name', 'barcode', 'package_size', 'unit_abbr',
+                                                 'category_name', 'min_stock_level', 'current_quantity',
+                                                 'last_updated')},
+                     locations=location_quantities.get(item['id'], []))
+                for item in inventory
+            ]
+        }
+        if request.args.get('html'):
+            inventory_rows = get_template_attribute('macros/inventory.html', 'inventory_rows')
+            result['html'] = str(inventory_rows(inventory, location_quantities, location_id, LocationType))
+        return jsonify(result)
     
     # Kategóriák a szűrőhöz
-    categories = db.execute('''
-        SELECT id, name FROM categories WHERE is_deleted = 0 ORDER BY name
-    ''').fetchall()
+    categories = refcache.categories(db)
+    
+    # Szűrők a lapozó linkekhez (üres értékek nélkül)
+    filter_args = {key: value for key, value in (('search', search), ('category', category_id),
+                                                  ('location', location_id), ('stock', stock_filter),
+                                                  ('sort', sort if sort != 'name' else None)) if value}
     
     return render_template('inventory/list.html',
                          inventory=inventory,
@@ -232,9 +398,73 @@ def list_inventory():
                          selected_category=category_id,
                          selected_location=location_id,
                          stock_filter=stock_filter,
+                         sort=sort,
+                         page=page,
+                         per_page=per_page,
+                         total=total,
+                         total_pages=total_pages,
+                         filter_args=filter_args,
                          LocationType=LocationType)
 
 
+@writer.command('movement')
+def record_location_movement(db, product_id, movement_type, quantity_change, location_id, note=None):
+    """
+    Helyszín alapú készletmozgás (bevét, kiadás, korrekció, selejt) az író szálon
+    Visszatér: az új mennyiség; negatív készletnél ValueError
+    """
+    # Aktuális készlet lekérdezése - helyszín alapú
+    current = db.execute('''
+        SELECT quantity FROM location_inventory 
+        WHERE product_id = ? AND location_id = ?
+    ''', (product_id, location_id)).fetchone()
+    
+    current_quantity = current['quantity'] if current else 0
+    new_quantity = current_quantity + quantity_change
+    
+    # Negatív készlet ellenőrzés
+    if new_quantity < 0:
+        location_name = db.execute('SELECT name FROM locations WHERE id = ?', (location_id,)).fetchone()
+        raise ValueError(f'Nincs elegendő készlet ezen a helyszínen ({location_name["name"]})! Jelenlegi: {current_quantity}')
+    
+    # Helyszín-specifikus készlet frissítése
+    if current:
+        db.execute('''
+            UPDATE location_inventory 
+            SET quantity = ?, last_updated = ? 
+            WHERE product_id = ? AND location_id = ?
+        ''', (new_quantity, datetime.now(), product_id, location_id))
+    else:
+        db.execute('''
+            INSERT INTO location_inventory (product_id, location_id, quantity)
+            VALUES (?, ?, ?)
+        ''', (product_id, location_id, new_quantity))
+    
+    # Összkészlet frissítése az inventory táblában (kompatibilitás)
+    total_qty = db.execute('''
+        SELECT COALESCE(SUM(li.quantity), 0) as total 
+        FROM location_inventory li
+        JOIN locations l ON li.location_id = l.id
+        WHERE li.product_id = ? AND l.is_deleted = 0
+    ''', (product_id,)).fetchone()['total']
+    
+    existing_inv = db.execute('SELECT id FROM inventory WHERE product_id = ?', (product_id,)).fetchone()
+    if existing_inv:
+        db.execute('UPDATE inventory SET quantity = ?, last_updated = ? WHERE product_id = ?',
+                  (total_qty, datetime.now(), product_id))
+    else:
+        db.execute('INSERT INTO inventory (product_id, quantity) VALUES (?, ?)', (product_id, total_qty))
+    
+    # Mozgás rögzítése helyszínnel
+    db.execute('''
+        INSERT INTO inventory_movements 
+        (product_id, movement_type, quantity_change, quantity_before, quantity_after, location_id, note)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (product_id, movement_type, quantity_change, current_quantity, new_quantity, location_id, note))
+    
+    return new_quantity
+
+
 @inventory_bp.route('/movement', methods=['GET', 'POST'])
 @login_required
 def add_movement():
@@ -242,24 +472,11 @@ def add_movement():
     db = get_db_connection()
     
     # Helyszínek lekérdezése
-    locations = db.execute('''
-        SELECT id, name, location_type FROM locations 
-        WHERE is_deleted = 0 AND is_active = 1
-        ORDER BY 
-            CASE location_type 
-                WHEN 'WAREHOUSE' THEN 1 
-                WHEN 'CAR' THEN 2 
-                WHEN 'VENDING' THEN 3 
-            END, name
-    ''').fetchall()
+    locations = refcache.active_locations(db)
     
     # Alapértelmezett helyszín (raktár)
-    default_location = db.execute('''
-        SELECT id FROM locations 
-        WHERE location_type = 'WAREHOUSE' AND is_deleted = 0 AND is_active = 1 
-        LIMIT 1
-    ''').fetchone()
-    default_location_id = default_location['id'] if default_location else None
+    warehouses = refcache.active_locations(db, LocationType.WAREHOUSE)
+    default_location_id = warehouses[0]['id'] if warehouses else None
     
     if request.method == 'POST':
         product_id = request.form.get('product_id')
@@ -285,14 +502,6 @@ def add_movement():
             flash('Helyszín kiválasztása kötelező!', 'danger')
             return redirect(url_for('inventory.add_movement'))
         
-        # Aktuális készlet lekérdezése - helyszín alapú
-        current = db.execute('''
-            SELECT quantity FROM location_inventory 
-            WHERE product_id = ? AND location_id = ?
-        ''', (product_id, location_id)).fetchone()
-        
-        current_quantity = current['quantity'] if current else 0
-        
         # Mennyiség számítása a mozgás típusa alapján
         if movement_type in ['STOCK_OUT', 'LOSS']:
             quantity_change = -quantity
@@ -302,51 +511,9 @@ def add_movement():
         else:
             quantity_change = quantity
         
-        new_quantity = current_quantity + quantity_change
-        
-        # Negatív készlet ellenőrzés
-        if new_quantity < 0:
-            location_name = db.execute('SELECT name FROM locations WHERE id = ?', (location_id,)).fetchone()
-            flash(f'Nincs elegendő készlet ezen a helyszínen ({location_name["name"]})! Jelenlegi: {current_quantity}', 'danger')
-            return redirect(url_for('inventory.add_movement'))
-        
         try:
-            # Helyszín-specifikus készlet frissítése
-            if current:
-                db.execute('''
-                    UPDATE location_inventory 
-                    SET quantity = ?, last_updated = ? 
-                    WHERE product_id = ? AND location_id = ?
-                ''', (new_quantity, datetime.now(), product_id, location_id))
-            else:
-                db.execute('''
-                    INSERT INTO location_inventory (product_id, location_id, quantity)
-                    VALUES (?, ?, ?)
-                ''', (product_id, location_id, new_quantity))
-            
-            # Összkészlet frissítése az inventory táblában (kompatibilitás)
-            total_qty = db.execute('''
-                SELECT COALESCE(SUM(li.quantity), 0) as total 
-                FROM location_inventory li
-                JOIN locations l ON li.location_id = l.id
-                WHERE li.product_id = ? AND l.is_deleted = 0
-            ''', (product_id,)).fetchone()['total']
-            
-            existing_inv = db.execute('SELECT id FROM inventory WHERE product_id = ?', (product_id,)).fetchone()
-            if existing_inv:
-                db.execute('UPDATE inventory SET quantity = ?, last_updated = ? WHERE product_id = ?',
-                          (total_qty, datetime.now(), product_id))
-            else:
-                db.execute('INSERT INTO inventory (product_id, quantity) VALUES (?, ?)', (product_id, total_qty))
-            
-            # Mozgás rögzítése helyszínnel
-            db.execute('''
-                INSERT INTO inventory_movements 
-                (product_id, movement_type, quantity_change, quantity_before, quantity_after, location_id, note)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (product_id, movement_type, quantity_change, current_quantity, new_quantity, location_id, note))
-            
-            db.commit()
+            writer.execute('movement', product_id=product_id, movement_type=movement_type,
+                           quantity_change=quantity_change, location_id=location_id, note=note)
             
             # Termék és helyszín neve a visszajelzéshez
             product = db.execute('SELECT name FROM products WHERE id = ?', (product_id,)).fetchone()
@@ -355,46 +522,26 @@ def add_movement():
             flash(f'Készletmozgás rögzítve: {product["name"]} ({location["name"]}) - {MovementType.get_label(movement_type)}', 'success')
             return redirect(url_for('inventory.list_inventory'))
             
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('inventory.add_movement'))
         except Exception as e:
-            db.rollback()
             flash(f'Hiba történt: {str(e)}', 'danger')
     
-    # Termékek az űrlaphoz - helyszínenkénti készlettel
-    products_base = db.execute('''
-        SELECT p.id, p.name, p.barcode, p.package_size, u.abbreviation as unit_abbr
+    # Termékek az űrlaphoz - csak kompakt lista össz készlettel (egy lekérdezés);
+    # a helyszínenkénti bontást az űrlap termék választáskor kéri le (product_locations)
+    products = db.execute('''
+        SELECT p.id, p.name, p.barcode, p.package_size, u.abbreviation as unit_abbr,
+               COALESCE(SUM(CASE WHEN l.is_deleted = 0 THEN li.quantity ELSE 0 END), 0) as current_quantity
         FROM products p
         LEFT JOIN units u ON p.unit_id = u.id
+        LEFT JOIN location_inventory li ON li.product_id = p.id
+        LEFT JOIN locations l ON li.location_id = l.id
         WHERE p.is_deleted = 0
+        GROUP BY p.id
         ORDER BY p.name
     ''').fetchall()
     
-    # Helyszínenkénti készlet minden termékhez
-    products = []
-    for p in products_base:
-        product_data = dict(p)
-        
-        # Össz készlet (csak aktív helyszínekről)
-        total_qty = db.execute('''
-            SELECT COALESCE(SUM(li.quantity), 0) as total 
-            FROM location_inventory li
-            JOIN locations l ON li.location_id = l.id
-            WHERE li.product_id = ? AND l.is_deleted = 0
-        ''', (p['id'],)).fetchone()['total']
-        product_data['current_quantity'] = total_qty
-        
-        # Helyszínenkénti készlet
-        location_qtys = db.execute('''
-            SELECT l.id, l.name, l.location_type, COALESCE(li.quantity, 0) as quantity
-            FROM locations l
-            LEFT JOIN location_inventory li ON l.id = li.location_id AND li.product_id = ?
-            WHERE l.is_deleted = 0 AND l.is_active = 1
-            ORDER BY CASE l.location_type WHEN 'WAREHOUSE' THEN 1 WHEN 'CAR' THEN 2 WHEN 'VENDING' THEN 3 END, l.name
-        ''', (p['id'],)).fetchall()
-        # Convert Row objects to dicts for JSON serialization
-        product_data['location_quantities'] = [dict(row) for row in location_qtys]
-        
-        products.append(product_data)
-    
     movement_types = [
         ('STOCK_IN', 'Bevételezés (+)'),
         ('STOCK_OUT', 'Kivételezés (-)'),
@@ -427,38 +574,244 @@ def add_movement():
                          LocationType=LocationType)
 
 
-@inventory_bp.route('/quick-out/<int:product_id>', methods=['POST'])
+
+@inventory_bp.route('/api/product/<int:product_id>/locations')
 @login_required
-def quick_stock_out(product_id):
-    """Gyors kivételezés (1 darab)"""
+@httpcache.conditional
+def product_locations(product_id):
+    """API: Egy termék készlete helyszínenként (a mozgás űrlap termék választásakor kéri)"""
     db = get_db_connection()
     
-    quantity = float(request.form.get('quantity', 1))
+    # UNIQUE(product_id, location_id) index - csak a termék sorai
+    quantities = dict(db.execute('''
+        SELECT location_id, quantity FROM location_inventory WHERE product_id = ?
+    ''', (product_id,)).fetchall())
     
+    # Össz készlet: minden nem törölt helyszín, bontás: csak az aktívak (típus, név sorrendben)
+    locations = refcache.locations(db)
+    total = sum(quantities.get(location['id'], 0) for location in locations)
+    
+    return jsonify({
+        'success': True,
+        'product_id': product_id,
+        'total': total,
+        'locations': [
+            {
+                'id': location['id'],
+                'name': location['name'],
+                'location_type': location['location_type'],
+                'quantity': quantities.get(location['id'], 0)
+            }
+            for location in locations if location['is_active']
+        ]
+    })
+
+# Tömeges import: engedélyezett mozgás típusok
+IMPORT_MOVEMENT_TYPES = [
+    ('STOCK_IN', 'Bevételezés (+)'),
+    ('INITIAL', 'Kezdőkészlet (+)')
+]
+
+# Az előnézetben legfeljebb ennyi hibás sort listázunk
+IMPORT_MAX_LISTED_ERRORS = 200
+
+
+def parse_stock_import(db, text_stream, location_id, default_note=None):
+    """
+    Készlet import CSV feldolgozása: vonalkód; mennyiség; [megjegyzés]
+    A vonalkódokat egyetlen lekérdezéssel oldjuk fel. Az első sor fejléc, ha nincs benne szám.
+    Visszatér: (változások, sorszámok, termék nevek, hibák [(sor, vonalkód, üzenet)])
+    """
+    products = {row['barcode']: (row['id'], row['name']) for row in db.execute('''
+        SELECT id, name, barcode FROM products WHERE is_deleted = 0 AND barcode IS NOT NULL
+    ''')}
+    
+    changes = []
+    line_numbers = []
+    names = {}
+    errors = []
+    for line_number, fields in iter_csv_rows(text_stream):
+        barcode = fields[0]
+        quantity = parse_number(fields[1]) if len(fields) > 1 else None
+        if line_number == 1 and quantity is None:
+            continue
+        
+        product = products.get(barcode)
+        if not product:
+            errors.append((line_number, barcode, 'Ismeretlen vonalkód'))
+            continue
+        if quantity is None or quantity <= 0:
+            errors.append((line_number, barcode, 'Hibás mennyiség'))
+            continue
+        
+        note = fields[2] if len(fields) > 2 and fields[2] else default_note
+        changes.append(StockChange(product[0], location_id, quantity, note))
+        line_numbers.append(line_number)
+        names[product[0]] = product[1]
+    
+    return changes, line_numbers, names, errors
+
+
+@inventory_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_stock():
+    """
+    Tömeges bevételezés CSV-ből (pl. szállítói szállítólevél)
+    1. lépés: feltöltés + próbafuttatás (előnézet, semmi nem íródik)
+    2. lépés: végrehajtás egy tranzakcióban, halmaz alapú írással
+    """
+    db = get_db_connection()
+    upload_dir = current_app.config['IMPORT_DIR']
+    
+    locations = refcache.active_locations(db)
+    
+    if request.method == 'GET':
+        return render_template('inventory/import.html',
+                             locations=locations,
+                             movement_types=IMPORT_MOVEMENT_TYPES,
+                             preview=None,
+                             LocationType=LocationType)
+    
+    action = request.form.get('action', 'preview')
+    location_id = request.form.get('location_id', type=int)
+    movement_type = request.form.get('movement_type', '')
+    note = request.form.get('note', '').strip() or None
+    
+    location = next((loc for loc in locations if loc['id'] == location_id), None)
+    if not location or movement_type not in dict(IMPORT_MOVEMENT_TYPES):
+        flash('Helyszín és mozgás típus kiválasztása kötelező!', 'danger')
+        return redirect(url_for('inventory.import_stock'))
+    
+    if action == 'apply':
+        token = request.form.get('token', '')
+        path = csv_import.upload_path(upload_dir, token)
+        if not path:
+            flash('Az import fájl lejárt, töltse fel újra!', 'warning')
+            return redirect(url_for('inventory.import_stock'))
+    else:
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Válasszon CSV fájlt!', 'danger')
+            return redirect(url_for('inventory.import_stock'))
+        token = csv_import.save_upload(upload, upload_dir)
+        path = csv_import.upload_path(upload_dir, token)
+    
+    with csv_import.open_upload(path) as f:
+        changes, line_numbers, names, errors = parse_stock_import(db, f, location_id, note)
+    
+    if action == 'apply' and not errors and changes:
+        try:
+            # Írási zár a beolvasás előtt: a görgetett előtte/utána értékek így pontosak
+            db.execute('BEGIN IMMEDIATE')
+            document_id = documents.create(db, documents.IMPORT_DOCUMENT_TYPES[movement_type],
+                                           location_id=location_id, note=note, created_by=audit_context()[0])
+            count = stock.apply_stock_changes(db, changes, movement_type, document_id=document_id)
+            documents.finish(db, document_id, count, sum(change.quantity_change for change in changes))
+            db.commit()
+        except ValueError as e:
+            db.rollback()
+            flash(str(e), 'danger')
+            return redirect(url_for('inventory.import_stock'))
+        except Exception as e:
+            db.rollback()
+            flash(f'Hiba történt: {str(e)}', 'danger')
+            return redirect(url_for('inventory.import_stock'))
+        
+        os.remove(path)
+        log_audit('inventory_movements', None, 'IMPORT', new_values={
+            'movement_type': movement_type,
+            'location_id': location_id,
+            'document_id': document_id,
+            'lines': count,
+            'products': len(names),
+            'total_quantity': sum(change.quantity_change for change in changes),
+            'note': note
+        })
+        
+        flash(f'Import kész: {count} tétel, {len(names)} termék könyvelve ({location["name"]})', 'success')
+        return redirect(url_for('documents.document_detail', document_id=document_id))
+    
+    # Próbafuttatás: előtte / utána termékenként, írás nélkül
+    planned, stock_errors = stock.plan_stock_changes(db, changes)
+    for index, message in stock_errors:
+        errors.append((line_numbers[index], '', message))
+    
+    summary = {}
+    for movement in planned:
+        row = summary.get(movement.product_id)
+        if row is None:
+            row = summary[movement.product_id] = {
+                'name': names[movement.product_id],
+                'before': movement.quantity_before,
+                'change': 0
+            }
+        row['change'] += movement.quantity_change
+        row['after'] = movement.quantity_after
+    
+    preview = {
+        'token': token,
+        'location': location,
+        'movement_type': movement_type,
+        'note': note,
+        'line_count': len(changes),
+        'total_quantity': sum(change.quantity_change for change in changes),
+        'products': sorted(summary.values(), key=lambda row: row['name']),
+        'errors': errors[:IMPORT_MAX_LISTED_ERRORS],
+        'error_count': len(errors)
+    }
+    
+    return render_template('inventory/import.html',
+                         locations=locations,
+                         movement_types=IMPORT_MOVEMENT_TYPES,
+                         preview=preview,
+                         selected_location_id=location_id,
+                         selected_movement_type=movement_type,
+                         LocationType=LocationType)
+
+@writer.command('quick_stock')
+def apply_quick_stock(db, product_id, quantity_change, movement_type, note):
+    """
+    Gyors +/- az összkészleten (inventory tábla) az író szálon
+    Visszatér: az új mennyiség; negatív készletnél ValueError
+    """
     # Aktuális készlet
     current = db.execute('''
         SELECT quantity FROM inventory WHERE product_id = ?
     ''', (product_id,)).fetchone()
     
     current_quantity = current['quantity'] if current else 0
+    new_quantity = current_quantity + quantity_change
     
-    if current_quantity < quantity:
-        return jsonify({'success': False, 'message': 'Nincs elegendő készlet!'}), 400
-    
-    new_quantity = current_quantity - quantity
+    if new_quantity < 0:
+        raise ValueError('Nincs elegendő készlet!')
     
-    try:
+    if current:
         db.execute('''
             UPDATE inventory SET quantity = ?, last_updated = ? WHERE product_id = ?
         ''', (new_quantity, datetime.now(), product_id))
-        
+    else:
         db.execute('''
-            INSERT INTO inventory_movements 
-            (product_id, movement_type, quantity_change, quantity_before, quantity_after, note)
-            VALUES (?, 'STOCK_OUT', ?, ?, ?, 'Gyors kivételezés')
-        ''', (product_id, -quantity, current_quantity, new_quantity))
-        
-        db.commit()
+            INSERT INTO inventory (product_id, quantity) VALUES (?, ?)
+        ''', (product_id, new_quantity))
+    
+    db.execute('''
+        INSERT INTO inventory_movements 
+        (product_id, movement_type, quantity_change, quantity_before, quantity_after, note)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (product_id, movement_type, quantity_change, current_quantity, new_quantity, note))
+    
+    return new_quantity
+
+
+@inventory_bp.route('/quick-out/<int:product_id>', methods=['POST'])
+@login_required
+def quick_stock_out(product_id):
+    """Gyors kivételezés (1 darab)"""
+    quantity = float(request.form.get('quantity', 1))
+    
+    try:
+        new_quantity = writer.execute('quick_stock', product_id=product_id, quantity_change=-quantity,
+                                      movement_type='STOCK_OUT', note='Gyors kivételezés')
         
         return jsonify({
             'success': True,
@@ -466,8 +819,9 @@ def quick_stock_out(product_id):
             'message': 'Kivételezés sikeres!'
         })
         
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
@@ -475,35 +829,11 @@ def quick_stock_out(product_id):
 @login_required
 def quick_stock_in(product_id):
     """Gyors bevételezés"""
-    db = get_db_connection()
-    
     quantity = float(request.form.get('quantity', 1))
     
-    # Aktuális készlet
-    current = db.execute('''
-        SELECT quantity FROM inventory WHERE product_id = ?
-    ''', (product_id,)).fetchone()
-    
-    current_quantity = current['quantity'] if current else 0
-    new_quantity = current_quantity + quantity
-    
     try:
-        if current:
-            db.execute('''
-                UPDATE inventory SET quantity = ?, last_updated = ? WHERE product_id = ?
-            ''', (new_quantity, datetime.now(), product_id))
-        else:
-            db.execute('''
-                INSERT INTO inventory (product_id, quantity) VALUES (?, ?)
-            ''', (product_id, new_quantity))
-        
-        db.execute('''
-            INSERT INTO inventory_movements 
-            (product_id, movement_type, quantity_change, quantity_before, quantity_after, note)
-            VALUES (?, 'STOCK_IN', ?, ?, ?, 'Gyors bevételezés')
-        ''', (product_id, quantity, current_quantity, new_quantity))
-        
-        db.commit()
+        new_quantity = writer.execute('quick_stock', product_id=product_id, quantity_change=quantity,
+                                      movement_type='STOCK_IN', note='Gyors bevételezés')
         
         return jsonify({
             'success': True,
@@ -512,28 +842,23 @@ def quick_stock_in(product_id):
         })
         
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
 
 @inventory_bp.route('/history')
 @login_required
+@httpcache.conditional
 def movement_history():
     """Készletmozgások története - helyszín megjelenítéssel"""
     db = get_db_connection()
     
-    # Szűrési paraméterek
-    product_id = request.args.get('product', type=int)
-    movement_type = request.args.get('type', '')
-    location_id = request.args.get('location', type=int)
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
+    filters, params = build_movement_filters(request.args)
     
-    query = '''
+    query = f'''
         SELECT 
             im.id, im.movement_type, im.quantity_change, 
             im.quantity_before, im.quantity_after, im.note, im.created_at,
-            im.location_id, im.source_location_id, im.target_location_id,
+            im.location_id, im.source_location_id, im.target_location_id, im.document_id,
             p.name as product_name, p.id as product_id, p.package_size,
             u.abbreviation as unit_abbr,
             l.name as location_name, l.location_type,
@@ -545,31 +870,10 @@ def movement_history():
         LEFT JOIN locations l ON im.location_id = l.id
         LEFT JOIN locations sl ON im.source_location_id = sl.id
         LEFT JOIN locations tl ON im.target_location_id = tl.id
-        WHERE 1=1
+        WHERE {filters}
+        ORDER BY im.created_at DESC
+        LIMIT 500
     '''
-    params = []
-    
-    if product_id:
-        query += ' AND im.product_id = ?'
-        params.append(product_id)
-    
-    if movement_type:
-        query += ' AND im.movement_type = ?'
-        params.append(movement_type)
-    
-    if location_id:
-        query += ' AND (im.location_id = ? OR im.source_location_id = ? OR im.target_location_id = ?)'
-        params.extend([location_id, location_id, location_id])
-    
-    if date_from:
-        query += ' AND DATE(im.created_at) >= ?'
-        params.append(date_from)
-    
-    if date_to:
-        query += ' AND DATE(im.created_at) <= ?'
-        params.append(date_to)
-    
-    query += ' ORDER BY im.created_at DESC LIMIT 500'
     
     movements = db.execute(query, params).fetchall()
     
@@ -579,11 +883,7 @@ def movement_history():
     ''').fetchall()
     
     # Helyszínek a szűrőhöz
-    locations = db.execute('''
-        SELECT id, name, location_type FROM locations 
-        WHERE is_deleted = 0
-        ORDER BY CASE location_type WHEN 'WAREHOUSE' THEN 1 WHEN 'CAR' THEN 2 WHEN 'VENDING' THEN 3 END, name
-    ''').fetchall()
+    locations = refcache.locations(db)
     
     movement_types = [
         ('STOCK_IN', 'Bevételezés'),
@@ -603,87 +903,344 @@ def movement_history():
                          products=products,
                          locations=locations,
                          movement_types=movement_types,
-                         selected_product=product_id,
-                         selected_type=movement_type,
-                         selected_location=location_id,
-                         date_from=date_from,
-                         date_to=date_to,
+                         selected_product=request.args.get('product', type=int),
+                         selected_type=request.args.get('type', ''),
+                         selected_location=request.args.get('location', type=int),
+                         date_from=request.args.get('date_from', ''),
+                         date_to=request.args.get('date_to', ''),
                          MovementType=MovementType,
                          LocationType=LocationType)
 
 
+@inventory_bp.route('/history/export')
+@login_required
+def export_movement_history():
+    """
+    Készletmozgások exportálása (CSV / XLSX) - a történet oldal szűrőivel, limit nélkül
+    Időrendben (id szerint) streamelünk, így nincs szükség a teljes eredmény rendezésére
+    """
+    filters, params = build_movement_filters(request.args)
+    
+    query = f'''
+        SELECT 
+            im.id, im.created_at, im.movement_type,
+            p.id, p.name, p.barcode,
+            im.quantity_change, im.quantity_before, im.quantity_after,
+            u.abbreviation,
+            l.name, sl.name, tl.name,
+            im.reference_movement_id, im.note
+        FROM inventory_movements im
+        JOIN products p ON im.product_id = p.id
+        LEFT JOIN units u ON p.unit_id = u.id
+        LEFT JOIN locations l ON im.location_id = l.id
+        LEFT JOIN locations sl ON im.source_location_id = sl.id
+        LEFT JOIN locations tl ON im.target_location_id = tl.id
+        WHERE {filters}
+        ORDER BY im.id
+    '''
+    
+    headers = ['Mozgás ID', 'Időpont (UTC)', 'Típus', 'Termék ID', 'Termék', 'Vonalkód',
+               'Változás', 'Előtte', 'Utána', 'Egység',
+               'Helyszín', 'Forrás', 'Cél', 'Hivatkozott mozgás', 'Megjegyzés']
+    
+    return export_response(query, params, headers,
+                           filename=f'keszletmozgasok_{datetime.now().strftime("%Y%m%d")}',
+                           export_format=request.args.get('format', 'csv'),
+                           sheet_name='Készletmozgások')
+
+@writer.command('set_location_quantity')
+def set_location_quantity(db, product_id, location_id, new_quantity, note):
+    """
+    Egy helyszín készletének beállítása konkrét értékre, ADJUSTMENT mozgással (író szálon)
+    Visszatér: a változás (0, ha a készlet már ennyi volt - ekkor nincs mozgás)
+    """
+    current = db.execute('''
+        SELECT quantity FROM location_inventory WHERE product_id = ? AND location_id = ?
+    ''', (product_id, location_id)).fetchone()
+    
+    quantity_change = new_quantity - (current['quantity'] if current else 0)
+    if quantity_change:
+        stock.apply_stock_changes(db, [StockChange(product_id, location_id, quantity_change, note)], 'ADJUSTMENT')
+    return quantity_change
+
+
 @inventory_bp.route('/set-quantity/<int:product_id>', methods=['POST'])
 @login_required
 def set_quantity(product_id):
-    """Készlet beállítása konkrét értékre (leltározás)"""
+    """Készlet beállítása konkrét értékre egy helyszínen (egy termék korrekciója)"""
     db = get_db_connection()
     
     new_quantity = float(request.form.get('quantity', 0))
+    location_id = request.form.get('location_id', type=int)
     note = request.form.get('note', 'Leltározás/korrekció')
     
     if new_quantity < 0:
         flash('A mennyiség nem lehet negatív!', 'danger')
         return redirect(url_for('inventory.list_inventory'))
     
-    # Aktuális készlet
-    current = db.execute('''
-        SELECT quantity FROM inventory WHERE product_id = ?
-    ''', (product_id,)).fetchone()
-    
-    current_quantity = current['quantity'] if current else 0
-    quantity_change = new_quantity - current_quantity
+    location = next((loc for loc in refcache.active_locations(db) if loc['id'] == location_id), None)
+    if not location:
+        flash('Helyszín kiválasztása kötelező!', 'danger')
+        return redirect(url_for('inventory.list_inventory'))
     
     try:
-        if current:
-            db.execute('''
-                UPDATE inventory SET quantity = ?, last_updated = ? WHERE product_id = ?
-            ''', (new_quantity, datetime.now(), product_id))
-        else:
-            db.execute('''
-                INSERT INTO inventory (product_id, quantity) VALUES (?, ?)
-            ''', (product_id, new_quantity))
+        writer.execute('set_location_quantity', product_id=product_id, location_id=location_id,
+                       new_quantity=new_quantity, note=note)
         
-        db.execute('''
-            INSERT INTO inventory_movements 
-            (product_id, movement_type, quantity_change, quantity_before, quantity_after, note)
-            VALUES (?, 'ADJUSTMENT', ?, ?, ?, ?)
-        ''', (product_id, quantity_change, current_quantity, new_quantity, note))
+        product = db.execute('SELECT name FROM products WHERE id = ?', (product_id,)).fetchone()
+        flash(f'Készlet beállítva: {product["name"]} - {new_quantity} ({location["name"]})', 'success')
         
-        db.commit()
+    except Exception as e:
+        flash(f'Hiba történt: {str(e)}', 'danger')
+    
+    return redirect(url_for('inventory.list_inventory', location=location_id))
+
+
+@inventory_bp.route('/stocktake', methods=['GET', 'POST'])
+@login_required
+def stocktake_list():
+    """Leltár munkamenetek listája, új leltár indítása helyszínre"""
+    db = get_db_connection()
+    locations = refcache.active_locations(db)
+    
+    if request.method == 'POST':
+        location_id = request.form.get('location_id', type=int)
+        note = request.form.get('note', '').strip() or None
         
-        product = db.execute('SELECT name FROM products WHERE id = ?', (product_id,)).fetchone()
-        flash(f'Készlet beállítva: {product["name"]} - {new_quantity}', 'success')
+        if not any(loc['id'] == location_id for loc in locations):
+            flash('Helyszín kiválasztása kötelező!', 'danger')
+            return redirect(url_for('inventory.stocktake_list'))
+        
+        open_session = db.execute('''
+            SELECT id FROM stocktake_sessions WHERE location_id = ? AND status = ?
+        ''', (location_id, stocktake.OPEN)).fetchone()
+        if open_session:
+            flash('Ezen a helyszínen már folyamatban van egy leltár.', 'warning')
+            return redirect(url_for('inventory.stocktake_session', session_id=open_session['id']))
         
+        user_id = audit_context()[0]
+        cursor = db.execute('''
+            INSERT INTO stocktake_sessions (location_id, note, created_by) VALUES (?, ?, ?)
+        ''', (location_id, note, user_id))
+        db.commit()
+        
+        log_audit('stocktake_sessions', cursor.lastrowid, 'CREATE', new_values={'location_id': location_id, 'note': note})
+        return redirect(url_for('inventory.stocktake_session', session_id=cursor.lastrowid))
+    
+    sessions = db.execute('''
+        SELECT s.*, l.name as location_name,
+               (SELECT COUNT(*) FROM stocktake_counts c WHERE c.session_id = s.id) as counted_products
+        FROM stocktake_sessions s
+        JOIN locations l ON s.location_id = l.id
+        ORDER BY s.status = ? DESC, s.id DESC
+        LIMIT 100
+    ''', (stocktake.OPEN,)).fetchall()
+    
+    return render_template('inventory/stocktake_list.html',
+                         sessions=sessions,
+                         locations=locations,
+                         status_labels=stocktake.STATUS_LABELS,
+                         LocationType=LocationType)
+
+
+@inventory_bp.route('/stocktake/<int:session_id>')
+@login_required
+def stocktake_session(session_id):
+    """
+    Leltár számolás: beolvasás / kézi bevitel, eltérések a nyilvántartáshoz képest
+    ?format=json esetén az eltérés lista JSON-ban
+    """
+    db = get_db_connection()
+    session = stocktake.get_session(db, session_id)
+    if not session:
+        flash('A leltár nem található!', 'danger')
+        return redirect(url_for('inventory.stocktake_list'))
+    
+    include_uncounted = request.args.get('uncounted') == '1'
+    rows = stocktake.differences(db, session_id, session['location_id'], include_uncounted)
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'session_id': session_id,
+            'status': session['status'],
+            'items': [dict(row) for row in rows]
+        })
+    
+    is_open = session['status'] == stocktake.OPEN
+    return render_template('inventory/stocktake.html',
+                         count_session=session,
+                         rows=rows,
+                         include_uncounted=include_uncounted,
+                         changed_count=sum(1 for row in rows if row['difference']),
+                         net_difference=sum(row['difference'] for row in rows),
+                         movements_since_start=stocktake.movements_since_start(db, session) if is_open else 0,
+                         status_labels=stocktake.STATUS_LABELS,
+                         is_open=is_open)
+
+
+@inventory_bp.route('/stocktake/<int:session_id>/count', methods=['POST'])
+@login_required
+def stocktake_count(session_id):
+    """
+    Számolt mennyiség rögzítése (JSON vagy űrlap): barcode vagy product_id, quantity,
+    mode = 'add' (hozzáad, pl. darabonkénti beolvasás) vagy 'set' (felülír)
+    """
+    db = get_db_connection()
+    data = request.get_json(silent=True) or request.form
+    
+    session = db.execute('SELECT id, location_id, status FROM stocktake_sessions WHERE id = ?',
+                         (session_id,)).fetchone()
+    if not session or session['status'] != stocktake.OPEN:
+        return jsonify({'success': False, 'message': 'A leltár nem található vagy már le van zárva!'}), 409
+    
+    barcode = str(data.get('barcode') or '').strip()
+    if barcode:
+        product = db.execute('''
+            SELECT id, name FROM products WHERE barcode = ? AND is_deleted = 0
+        ''', (barcode,)).fetchone()
+    else:
+        product = db.execute('''
+            SELECT id, name FROM products WHERE id = ? AND is_deleted = 0
+        ''', (data.get('product_id'),)).fetchone()
+    if not product:
+        return jsonify({'success': False, 'message': 'Termék nem található!'}), 404
+    
+    try:
+        quantity = float(data.get('quantity', 1))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Hibás mennyiség!'}), 400
+    add = data.get('mode', 'add') == 'add'
+    if quantity < 0 or (add and quantity == 0):
+        return jsonify({'success': False, 'message': 'Hibás mennyiség!'}), 400
+    
+    counted = stocktake.record_count(db, session_id, product['id'], quantity, add)
+    db.commit()
+    
+    system = db.execute('''
+        SELECT quantity FROM location_inventory WHERE product_id = ? AND location_id = ?
+    ''', (product['id'], session['location_id'])).fetchone()
+    system_quantity = system['quantity'] if system else 0
+    
+    return jsonify({
+        'success': True,
+        'product_id': product['id'],
+        'name': product['name'],
+        'counted_quantity': counted,
+        'system_quantity': system_quantity,
+        'difference': counted - system_quantity
+    })
+
+
+@inventory_bp.route('/stocktake/<int:session_id>/count/<int:product_id>/delete', methods=['POST'])
+@login_required
+def stocktake_delete_count(session_id, product_id):
+    """Számolt tétel törlése (a termék nem számoltnak minősül)"""
+    db = get_db_connection()
+    db.execute('''
+        DELETE FROM stocktake_counts
+        WHERE session_id = ? AND product_id = ?
+          AND session_id IN (SELECT id FROM stocktake_sessions WHERE status = ?)
+    ''', (session_id, product_id, stocktake.OPEN))
+    db.commit()
+    return redirect(url_for('inventory.stocktake_session', session_id=session_id))
+
+
+@writer.command('stocktake_apply')
+def apply_stocktake(db, session_id, include_uncounted, created_by=None):
+    """
+    Leltár könyvelése az író szálon: az eltérések egy lekérdezéssel, az ADJUSTMENT
+    mozgások (egy STOCKTAKE bizonylaton) és a készlet halmaz alapon, a munkamenet
+    lezárásával együtt egy tranzakcióban
+    Visszatér: az audit naplóba kerülő adatok
+    """
+    session = db.execute('SELECT * FROM stocktake_sessions WHERE id = ?', (session_id,)).fetchone()
+    if not session or session['status'] != stocktake.OPEN:
+        raise ValueError('A leltár nem található vagy már le van zárva!')
+    
+    location_id = session['location_id']
+    note = f'Leltár #{session_id}' + (f': {session["note"]}' if session['note'] else '')
+    rows = stocktake.differences(db, session_id, location_id, include_uncounted, only_changed=True)
+    
+    changes = [StockChange(row['product_id'], location_id, row['difference'], note) for row in rows]
+    adjusted = 0
+    document_id = None
+    if changes:
+        document_id = documents.create(db, documents.STOCKTAKE, location_id=location_id, note=note,
+                                       created_by=created_by)
+        adjusted = stock.apply_stock_changes(db, changes, 'ADJUSTMENT', document_id=document_id)
+        documents.finish(db, document_id, adjusted, sum(change.quantity_change for change in changes))
+    
+    db.execute('''
+        UPDATE stocktake_sessions
+        SET status = ?, closed_at = CURRENT_TIMESTAMP, adjusted_count = ?, document_id = ?
+        WHERE id = ?
+    ''', (stocktake.APPLIED, adjusted, document_id, session_id))
+    
+    return {
+        'location_id': location_id,
+        'adjusted': adjusted,
+        'document_id': document_id,
+        'net_change': sum(change.quantity_change for change in changes),
+        'include_uncounted': include_uncounted
+    }
+
+
+@inventory_bp.route('/stocktake/<int:session_id>/apply', methods=['POST'])
+@login_required
+def stocktake_apply(session_id):
+    """Leltár könyvelése: minden eltérés ADJUSTMENT mozgással, egy tranzakcióban"""
+    include_uncounted = request.form.get('include_uncounted') == '1'
+    
+    try:
+        result = writer.execute('stocktake_apply', session_id=session_id, include_uncounted=include_uncounted,
+                                created_by=audit_context()[0])
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('inventory.stocktake_session', session_id=session_id))
     except Exception as e:
-        db.rollback()
         flash(f'Hiba történt: {str(e)}', 'danger')
+        return redirect(url_for('inventory.stocktake_session', session_id=session_id))
     
-    return redirect(url_for('inventory.list_inventory'))
+    log_audit('stocktake_sessions', session_id, 'APPLY', new_values=result)
+    flash(f'Leltár könyvelve: {result["adjusted"]} termék korrekciója', 'success')
+    return redirect(url_for('inventory.stocktake_session', session_id=session_id))
 
 
-@inventory_bp.route('/undo-movement/<int:movement_id>', methods=['POST'])
+@inventory_bp.route('/stocktake/<int:session_id>/cancel', methods=['POST'])
 @login_required
-def undo_movement(movement_id):
-    """Készletmozgás visszavonása (ellentétes mozgás létrehozása)"""
+def stocktake_cancel(session_id):
+    """Leltár elvetése (a készlet nem változik)"""
     db = get_db_connection()
+    cursor = db.execute('''
+        UPDATE stocktake_sessions SET status = ?, closed_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = ?
+    ''', (stocktake.CANCELLED, session_id, stocktake.OPEN))
+    db.commit()
     
-    # Eredeti mozgás lekérdezése
+    if cursor.rowcount:
+        log_audit('stocktake_sessions', session_id, 'CANCEL')
+        flash('Leltár elvetve.', 'info')
+    return redirect(url_for('inventory.stocktake_list'))
+
+
+@writer.command('undo_movement')
+def undo_location_movement(db, movement_id):
+    """
+    Ellentétes (REVERSAL) mozgás az író szálon
+    Az ismételt visszavonás és a negatív készlet ellenőrzése a tranzakción belül fut
+    Visszatér: az audit naplóba kerülő adatok
+    """
     movement = db.execute('''
-        SELECT im.*, p.name as product_name, l.name as location_name
-        FROM inventory_movements im
-        LEFT JOIN products p ON im.product_id = p.id
-        LEFT JOIN locations l ON im.location_id = l.id
-        WHERE im.id = ?
+        SELECT * FROM inventory_movements WHERE id = ?
     ''', (movement_id,)).fetchone()
     
     if not movement:
-        flash('A mozgás nem található!', 'danger')
-        return redirect(url_for('inventory.movement_history'))
+        raise ValueError('A mozgás nem található!')
     
-    # Már visszavont mozgás ellenőrzése
-    if movement['movement_type'] == 'REVERSAL':
-        flash('Visszavonás nem vonható vissza!', 'warning')
-        return redirect(url_for('inventory.movement_history'))
+    # Áthelyezésnél a pár másik tagja és a kompenzáló áthelyezés is számít
+    if find_reversal(db, movement):
+        raise ValueError('Ez a mozgás már vissza lett vonva!')
     
     product_id = movement['product_id']
     location_id = movement['location_id']
@@ -702,55 +1259,87 @@ def undo_movement(movement_id):
     new_quantity = current_quantity + reversal_change
     
     if new_quantity < 0:
-        flash(f'Nem vonható vissza: a készlet negatívba menne ({new_quantity})!', 'danger')
+        raise ValueError(f'Nem vonható vissza: a készlet negatívba menne ({new_quantity})!')
+    
+    # Helyszín-specifikus készlet frissítése
+    if current:
+        db.execute('''
+            UPDATE location_inventory 
+            SET quantity = ?, last_updated = ? 
+            WHERE product_id = ? AND location_id = ?
+        ''', (new_quantity, datetime.now(), product_id, location_id))
+    else:
+        db.execute('''
+            INSERT INTO location_inventory (product_id, location_id, quantity)
+            VALUES (?, ?, ?)
+        ''', (product_id, location_id, new_quantity))
+    
+    # Összkészlet frissítése az inventory táblában (kompatibilitás)
+    total_qty = db.execute('''
+        SELECT COALESCE(SUM(li.quantity), 0) as total 
+        FROM location_inventory li
+        JOIN locations l ON li.location_id = l.id
+        WHERE li.product_id = ? AND l.is_deleted = 0
+    ''', (product_id,)).fetchone()['total']
+    
+    existing_inv = db.execute('SELECT * FROM inventory WHERE product_id = ?', (product_id,)).fetchone()
+    if existing_inv:
+        db.execute('UPDATE inventory SET quantity = ?, last_updated = ? WHERE product_id = ?',
+                  (total_qty, datetime.now(), product_id))
+    else:
+        db.execute('INSERT INTO inventory (product_id, quantity) VALUES (?, ?)', 
+                  (product_id, total_qty))
+    
+    # Visszavonás mozgás rögzítése
+    original_type = movement['movement_type']
+    db.execute('''
+        INSERT INTO inventory_movements 
+        (product_id, movement_type, quantity_change, quantity_before, quantity_after, location_id,
+         reference_movement_id, note)
+        VALUES (?, 'REVERSAL', ?, ?, ?, ?, ?, ?)
+    ''', (product_id, reversal_change, current_quantity, new_quantity, location_id,
+          movement_id, f'Visszavonás: #{movement_id} ({original_type})'))
+    
+    return {'product_id': product_id, 'location_id': location_id, 'quantity_change': reversal_change}
+
+
+@inventory_bp.route('/undo-movement/<int:movement_id>', methods=['POST'])
+@login_required
+def undo_movement(movement_id):
+    """Készletmozgás visszavonása (ellentétes mozgás létrehozása)"""
+    db = get_db_connection()
+    
+    # Eredeti mozgás lekérdezése
+    movement = db.execute('''
+        SELECT im.*, p.name as product_name, l.name as location_name
+        FROM inventory_movements im
+        LEFT JOIN products p ON im.product_id = p.id
+        LEFT JOIN locations l ON im.location_id = l.id
+        WHERE im.id = ?
+    ''', (movement_id,)).fetchone()
+    
+    if not movement:
+        flash('A mozgás nem található!', 'danger')
+        return redirect(url_for('inventory.movement_history'))
+    
+    # Már visszavont mozgás ellenőrzése
+    if movement['movement_type'] == 'REVERSAL':
+        flash('Visszavonás nem vonható vissza!', 'warning')
+        return redirect(url_for('inventory.movement_history'))
+    
+    if find_reversal(db, movement):
+        flash('Ez a mozgás már vissza lett vonva!', 'warning')
         return redirect(url_for('inventory.movement_history'))
     
     try:
-        # Helyszín-specifikus készlet frissítése
-        if current:
-            db.execute('''
-                UPDATE location_inventory 
-                SET quantity = ?, last_updated = ? 
-                WHERE product_id = ? AND location_id = ?
-            ''', (new_quantity, datetime.now(), product_id, location_id))
-        else:
-            db.execute('''
-                INSERT INTO location_inventory (product_id, location_id, quantity)
-                VALUES (?, ?, ?)
-            ''', (product_id, location_id, new_quantity))
-        
-        # Összkészlet frissítése az inventory táblában (kompatibilitás)
-        total_qty = db.execute('''
-            SELECT COALESCE(SUM(li.quantity), 0) as total 
-            FROM location_inventory li
-            JOIN locations l ON li.location_id = l.id
-            WHERE li.product_id = ? AND l.is_deleted = 0
-        ''', (product_id,)).fetchone()['total']
-        
-        existing_inv = db.execute('SELECT * FROM inventory WHERE product_id = ?', (product_id,)).fetchone()
-        if existing_inv:
-            db.execute('UPDATE inventory SET quantity = ?, last_updated = ? WHERE product_id = ?',
-                      (total_qty, datetime.now(), product_id))
-        else:
-            db.execute('INSERT INTO inventory (product_id, quantity) VALUES (?, ?)', 
-                      (product_id, total_qty))
-        
-        # Visszavonás mozgás rögzítése
-        original_type = movement['movement_type']
-        db.execute('''
-            INSERT INTO inventory_movements 
-            (product_id, movement_type, quantity_change, quantity_before, quantity_after, location_id, note)
-            VALUES (?, 'REVERSAL', ?, ?, ?, ?, ?)
-        ''', (product_id, reversal_change, current_quantity, new_quantity, location_id,
-              f'Visszavonás: #{movement_id} ({original_type})'))
-        
-        db.commit()
+        reversal = writer.execute('undo_movement', movement_id=movement_id)
         
         flash(f'Mozgás #{movement_id} sikeresen visszavonva! ({movement["product_name"]})', 'success')
-        log_audit(db, 'undo_movement', f'movement_id={movement_id}, product={product_id}')
+        log_audit('inventory_movements', movement_id, 'REVERSAL', None, reversal)
         
+    except ValueError as e:
+        flash(str(e), 'danger')
     except Exception as e:
-        db.rollback()
         flash(f'Hiba történt a visszavonás során: {str(e)}', 'danger')
     
     return redirect(url_for('inventory.movement_history'))
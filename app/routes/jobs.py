@@ -0,0 +1,118 @@
+"""
+Háttér feladatok: állapot oldal, API (haladás lekérdezése), leállítás, worker parancs
+"""
+import json
+import threading
+
+import click
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+from flask_login import login_required
+from app.database import get_db_connection
+from app import jobs
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/jobs')
+
+
+@jobs_bp.route('/')
+@login_required
+def list_jobs():
+    """Feladatok listája (várakozók, futók, legutóbbi befejezettek)"""
+    db = get_db_connection()
+    status = request.args.get('status', '')
+    
+    return render_template('jobs/list.html',
+                         jobs=jobs.recent(db, status=status or None),
+                         workers=jobs.active_workers(db),
+                         status_labels=jobs.STATUS_LABELS,
+                         selected_status=status)
+
+
+@jobs_bp.route('/<int:job_id>')
+@login_required
+def job_detail(job_id):
+    """Feladat állapota / eredménye (befejezésig lekérdezéssel frissül)"""
+    db = get_db_connection()
+    job = jobs.get(db, job_id)
+    
+    if not job:
+        flash('Feladat nem található!', 'danger')
+        return redirect(url_for('jobs.list_jobs'))
+    
+    return render_template('jobs/detail.html',
+                         job=job,
+                         workers=jobs.active_workers(db))
+
+
+@jobs_bp.route('/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    """Feladat leállítása (várakozó azonnal, futó a következő haladás jelentésnél)"""
+    status = jobs.cancel(get_db_connection(), job_id)
+    
+    if status is None:
+        message, category = 'A feladat már befejeződött.', 'warning'
+    elif status == jobs.STATUS_CANCELLED:
+        message, category = 'Feladat leállítva.', 'success'
+    else:
+        message, category = 'Leállítás kérve - a feladat a következő lépésnél áll meg.', 'info'
+    
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'success': status is not None, 'status': status, 'message': message})
+    
+    flash(message, category)
+    return redirect(request.referrer or url_for('jobs.job_detail', job_id=job_id))
+
+
+@jobs_bp.route('/api/<int:job_id>')
+@login_required
+def api_job(job_id):
+    """
+    API: Feladat állapota
+    Válasz: {"success": true, "job": {"status": "running", "progress": 1500, "total": 8000, "percent": 19, ...}}
+    """
+    job = jobs.get(get_db_connection(), job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Feladat nem található!'}), 404
+    
+    response = jsonify({'success': True, 'job': job})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@jobs_bp.route('/api/list')
+@login_required
+def api_list_jobs():
+    """API: Legutóbbi feladatok és az élő workerek száma"""
+    db = get_db_connection()
+    
+    response = jsonify({
+        'success': True,
+        'jobs': jobs.recent(db, status=request.args.get('status') or None),
+        'workers': len(jobs.active_workers(db))
+    })
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@jobs_bp.cli.command('worker')
+@click.option('--burst', is_flag=True, help='Kilépés, ha a sor kiürült')
+def worker_command(burst):
+    """Feladat worker (docker compose: worker szolgáltatás; kézi telepítés: systemd)"""
+    stop = threading.Event()
+    jobs.install_signal_handlers(stop)
+    print('Worker indul' + (' (burst)' if burst else ''))
+    jobs.work(current_app._get_current_object(), burst=burst, stop=stop)
+    print('Worker leállt')
+
+
+@jobs_bp.cli.command('enqueue')
+@click.argument('kind')
+@click.option('--params', default=None, help='Paraméterek JSON objektumként, pl. \'{"refit": true}\'')
+@click.option('--priority', default=jobs.PRIORITY_LOW, show_default=True, help='Prioritás (nagyobb előbb fut)')
+def enqueue_command(kind, params, priority):
+    """Feladat a sorba (cron: flask --app wsgi jobs enqueue backup)"""
+    try:
+        job_id = jobs.enqueue(get_db_connection(), kind, json.loads(params) if params else None, priority)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(f'Feladat: #{job_id} ({jobs.kind_label(kind)})')
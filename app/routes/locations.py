@@ -6,6 +6,9 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required
 from app.database import get_db_connection, log_audit
 from app.models import LocationType
+from app.routes.catalog import conditional_json
+from app.export import export_response
+from app import alerts, catalog, forecast, httpcache, refcache
 from datetime import datetime
 
 locations_bp = Blueprint('locations', __name__, url_prefix='/locations')
@@ -240,6 +243,7 @@ def restore_location(id):
 
 @locations_bp.route('/<int:id>/inventory')
 @login_required
+@httpcache.conditional
 def location_inventory(id):
     """Helyszín készletének megtekintése"""
     db = get_db_connection()
@@ -257,11 +261,14 @@ def location_inventory(id):
             p.barcode,
             p.package_size,
             c.name as category_name,
-            u.abbreviation as unit_abbr
+            u.abbreviation as unit_abbr,
+            f.daily_rate as forecast_rate,
+            li.quantity / NULLIF(f.daily_rate, 0) as cover_days
         FROM location_inventory li
         JOIN products p ON li.product_id = p.id
         LEFT JOIN categories c ON p.category_id = c.id
         LEFT JOIN units u ON p.unit_id = u.id
+        LEFT JOIN demand_forecasts f ON f.location_id = li.location_id AND f.product_id = li.product_id
         WHERE li.location_id = ? AND p.is_deleted = 0
         ORDER BY c.name, p.name
     ''', (id,)).fetchall()
@@ -286,32 +293,129 @@ def location_inventory(id):
                          location=location,
                          inventory=inventory,
                          movements=movements,
+                         cover_warning_days=forecast.COVER_WARNING_DAYS,
                          LocationType=LocationType)
 
 
+@locations_bp.route('/<int:id>/inventory/<int:product_id>/min-level', methods=['POST'])
+@login_required
+def set_min_level(id, product_id):
+    """Helyszín minimum készlet beállítása egy termékre - a riasztás azonnal újraértékelve"""
+    db = get_db_connection()
+    
+    item = db.execute('''
+        SELECT * FROM location_inventory WHERE location_id = ? AND product_id = ?
+    ''', (id, product_id)).fetchone()
+    if not item:
+        flash('A termék nincs nyilvántartva ezen a helyszínen!', 'danger')
+        return redirect(url_for('locations.location_inventory', id=id))
+    
+    try:
+        min_level = float(request.form.get('min_stock_level', '0').replace(',', '.'))
+    except ValueError:
+        min_level = -1
+    if min_level < 0:
+        flash('Érvénytelen minimum készlet!', 'danger')
+        return redirect(url_for('locations.location_inventory', id=id))
+    
+    try:
+        db.execute('BEGIN IMMEDIATE')
+        db.execute('''
+            UPDATE location_inventory SET min_stock_level = ?
+            WHERE location_id = ? AND product_id = ?
+        ''', (min_level, id, product_id))
+        # A minimum szint változása nem készletesemény - a párt itt értékeljük újra
+        alerts.evaluate(db, [(product_id, id)])
+        db.commit()
+    
+        log_audit('location_inventory', item['id'], 'UPDATE',
+                 {'min_stock_level': item['min_stock_level']},
+                 {'min_stock_level': min_level, 'location_id': id, 'product_id': product_id})
+    
+        flash('Minimum készlet frissítve!', 'success')
+    except Exception as e:
+        db.rollback()
+        flash(f'Hiba történt: {str(e)}', 'danger')
+    
+    return redirect(url_for('locations.location_inventory', id=id))
+
+
+@locations_bp.route('/<int:id>/inventory/export')
+@login_required
+def export_location_inventory(id):
+    """Helyszín készletének exportálása (CSV / XLSX)"""
+    db = get_db_connection()
+    
+    location = db.execute('SELECT * FROM locations WHERE id = ?', (id,)).fetchone()
+    if not location:
+        flash('Helyszín nem található!', 'danger')
+        return redirect(url_for('locations.list_locations'))
+    
+    query = '''
+        SELECT 
+            p.id, p.name, p.barcode, c.name, p.package_size,
+            li.quantity, u.abbreviation, li.min_stock_level, li.last_updated
+        FROM location_inventory li
+        JOIN products p ON li.product_id = p.id
+        LEFT JOIN categories c ON p.category_id = c.id
+        LEFT JOIN units u ON p.unit_id = u.id
+        WHERE li.location_id = ? AND p.is_deleted = 0
+        ORDER BY c.name, p.name
+    '''
+    
+    headers = ['Termék ID', 'Termék', 'Vonalkód', 'Kategória', 'Kiszerelés',
+               'Mennyiség', 'Egység', 'Minimum készlet', 'Utolsó módosítás (UTC)']
+    
+    return export_response(query, (id,), headers,
+                           filename=f'keszlet_{id}_{datetime.now().strftime("%Y%m%d")}',
+                           export_format=request.args.get('format', 'csv'),
+                           sheet_name=location['name'])
+
 @locations_bp.route('/api/list')
 @login_required
 def api_list_locations():
-    """API: Helyszínek listája (AJAX-hoz)"""
+    """API: Helyszínek listája (AJAX-hoz) - változatlan lista esetén 304"""
     db = get_db_connection()
     
     location_type = request.args.get('type', '')
     
-    query = '''
-        SELECT id, name, location_type FROM locations 
-        WHERE is_deleted = 0 AND is_active = 1
-    '''
-    params = []
+    etag = f'locations-{catalog.table_version(db, "locations")}-{location_type}'
+    if request.if_none_match.contains(etag):
+        return conditional_json({}, etag)
     
-    if location_type:
-        query += ' AND location_type = ?'
-        params.append(location_type)
+    locations = sorted(refcache.active_locations(db, location_type or None), key=lambda row: row['name'])
+    
+    return conditional_json({
+        'success': True,
+        'locations': [{'id': loc['id'], 'name': loc['name'], 'location_type': loc['location_type']}
+                      for loc in locations]
+    }, etag)
+
+
+@locations_bp.route('/api/alerts')
+@login_required
+def api_alerts():
+    """API: Nyitott helyszín riasztások (küszöb alatt), opcionálisan egy helyszínre"""
+    db = get_db_connection()
     
-    query += ' ORDER BY name'
+    location_id = request.args.get('location', type=int)
     
-    locations = db.execute(query, params).fetchall()
+    alerts.refresh(db)
+    rows = alerts.active_alerts(db, location_id=location_id)
     
     return jsonify({
         'success': True,
-        'locations': [dict(loc) for loc in locations]
+        'count': len(rows),
+        'alerts': [{
+            'id': row['id'],
+            'location_id': row['location_id'],
+            'location_name': row['location_name'],
+            'product_id': row['product_id'],
+            'product_name': row['product_name'],
+            'barcode': row['barcode'],
+            'quantity': row['quantity'],
+            'min_level': row['min_level'],
+            'daily_rate': row['daily_rate'],
+            'opened_at': row['opened_at'].isoformat() if row['opened_at'] else None
+        } for row in rows]
     })
@@ -0,0 +1,55 @@
+"""
+Metrika route-ok (Prometheus scrape végpont)
+"""
+from flask import Blueprint, Response, request, current_app, abort
+from app import metrics
+import glob
+import hmac
+import os
+import time
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _scrape_time_gauges():
+    """Scrape pillanatában számolt értékek: adatbázis/WAL méret, backup kora"""
+    db_path = current_app.config['DATABASE_PATH']
+    gauges = [
+        ('edibes_db_size_bytes', None, _file_size(db_path)),
+        ('edibes_db_wal_size_bytes', None, _file_size(f'{db_path}-wal')),
+    ]
+
+    backup_dir = current_app.config['BACKUP_DIR']
+    backups = glob.glob(os.path.join(backup_dir, 'leltar_backup_*.db'))
+    if backups:
+        newest = max(os.path.getmtime(path) for path in backups)
+        gauges.append(('edibes_backup_last_timestamp_seconds', None, newest))
+        gauges.append(('edibes_backup_age_seconds', None, time.time() - newest))
+
+    return gauges
+
+
+@metrics_bp.route('/metrics')
+def scrape():
+    """
+    Prometheus scrape végpont - bejelentkezés nélkül, Bearer tokennel
+    Token nélküli konfigurációban zárva (403): a metrikák útvonalakat, méreteket árulnak el
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(403)
+
+    # Állandó idejű összehasonlítás (a válaszidőből ne lehessen a tokent kitalálni)
+    supplied = request.headers.get('Authorization', '').encode()
+    if not hmac.compare_digest(supplied, f'Bearer {token}'.encode()):
+        abort(401)
+
+    body = metrics.render(_scrape_time_gauges())
+    return Response(body, content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,11 +1,13 @@
 """
 Termék törzsadatok kezelése
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required
-from app.database import get_db_connection, log_audit
+from app.database import get_db_connection, log_audit, audit_context
+from app import csv_import, jobs, product_import, refcache
 from datetime import datetime
 import json
+import os
 
 products_bp = Blueprint('products', __name__, url_prefix='/products')
 
@@ -54,14 +56,10 @@ def list_products():
     products = db.execute(query, params).fetchall()
     
     # Kategóriák a szűrőhöz
-    categories = db.execute('''
-        SELECT id, name FROM categories WHERE is_deleted = 0 ORDER BY name
-    ''').fetchall()
+    categories = refcache.categories(db)
     
     # Mértékegységek az űrlaphoz
-    units = db.execute('''
-        SELECT id, name, abbreviation FROM units WHERE is_deleted = 0 ORDER BY name
-    ''').fetchall()
+    units = refcache.units(db)
     
     return render_template('products/list.html',
                          products=products,
@@ -138,13 +136,9 @@ def add_product():
             flash(f'Hiba történt: {str(e)}', 'danger')
     
     # Kategóriák és egységek az űrlaphoz
-    categories = db.execute('''
-        SELECT id, name FROM categories WHERE is_deleted = 0 ORDER BY name
-    ''').fetchall()
+    categories = refcache.categories(db)
     
-    units = db.execute('''
-        SELECT id, name, abbreviation FROM units WHERE is_deleted = 0 ORDER BY name
-    ''').fetchall()
+    units = refcache.units(db)
     
     return render_template('products/form.html',
                          categories=categories,
@@ -219,13 +213,9 @@ def edit_product(product_id):
             flash(f'Hiba történt: {str(e)}', 'danger')
     
     # Kategóriák és egységek az űrlaphoz
-    categories = db.execute('''
-        SELECT id, name FROM categories WHERE is_deleted = 0 ORDER BY name
-    ''').fetchall()
+    categories = refcache.categories(db)
     
-    units = db.execute('''
-        SELECT id, name, abbreviation FROM units WHERE is_deleted = 0 ORDER BY name
-    ''').fetchall()
+    units = refcache.units(db)
     
     return render_template('products/form.html',
                          categories=categories,
@@ -298,6 +288,68 @@ def restore_product(product_id):
     return redirect(url_for('products.list_products'))
 
 
+@jobs.handler('product_import', 'Termék import')
+def _run_product_import(job, path, filename=None, audit_context=(None, None, None)):
+    """Háttér feladat: a feltöltött termék lista importja, utána a fájl törlése"""
+    try:
+        with csv_import.open_upload(path) as f:
+            return product_import.import_products(job.db, f, tuple(audit_context), job.progress)
+    finally:
+        os.remove(path)
+
+
+@products_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_products():
+    """
+    Termék lista importja CSV-ből (upsert vonalkód alapján)
+    Kis fájl a kérésben fut le, nagy fájl a feladat sorba kerül - mindkét esetben
+    a feladat oldalára irányítunk, ahol a haladás és az eredmény látható.
+    """
+    if request.method == 'GET':
+        return render_template('products/import.html', job=None)
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Válasszon CSV fájlt!', 'danger')
+        return redirect(url_for('products.import_products'))
+    
+    upload_dir = current_app.config['IMPORT_DIR']
+    path = csv_import.upload_path(upload_dir, csv_import.save_upload(upload, upload_dir))
+    
+    try:
+        with csv_import.open_upload(path) as f:
+            total = product_import.count_rows(f)
+    except ValueError as e:
+        os.remove(path)
+        flash(str(e), 'danger')
+        return redirect(url_for('products.import_products'))
+    
+    db = get_db_connection()
+    job_id = jobs.enqueue(db, 'product_import',
+                          {'filename': upload.filename, 'path': path, 'audit_context': audit_context()},
+                          total=total)
+    
+    if total <= current_app.config['PRODUCT_IMPORT_SYNC_ROWS']:
+        jobs.run(current_app.config['DATABASE_PATH'], job_id)
+    
+    return redirect(url_for('products.import_job', job_id=job_id))
+
+
+@products_bp.route('/import/<int:job_id>')
+@login_required
+def import_job(job_id):
+    """Termék import állapota / eredménye"""
+    db = get_db_connection()
+    job = jobs.get(db, job_id)
+    
+    if not job or job['kind'] != 'product_import':
+        flash('Import nem található!', 'danger')
+        return redirect(url_for('products.import_products'))
+    
+    return render_template('products/import.html', job=job)
+
+
 @products_bp.route('/api/barcode/<barcode>')
 @login_required
 def get_by_barcode(barcode):
@@ -0,0 +1,334 @@
+"""
+Riportok - készlet visszamenőleg (adott nap végén), forgalmi trendek
+"""
+import click
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required
+from app.database import get_db_connection
+from app.export import export_response
+from app.config import get_budapest_time
+from app.models import MovementType
+from app import alerts, forecast, jobs, rollups, snapshots
+from datetime import datetime, timedelta
+
+reports_bp = Blueprint('reports', __name__, url_prefix='/reports')
+
+
+def _parse_report_date(value):
+    """Riport nap (ÉÉÉÉ-HH-NN), alapértelmezés a mai nap; hibás érték esetén None"""
+    if not value:
+        return get_budapest_time().date()
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def stock_as_of_report_query(db, day, location_id=None):
+    """
+    Készlet a nap végén (a mozgás napló dátum szűrőjével azonos határ: a következő nap 00:00)
+    Visszatér: (sql, params, alap) - oszlopok: helyszín, termék, vonalkód, mennyiség, egység
+    """
+    as_of = datetime.combine(day + timedelta(days=1), datetime.min.time())
+    stock_sql, params, base = snapshots.as_of_query(db, as_of, location_id)
+    query = f'''
+        SELECT l.name AS location_name, p.name AS product_name, p.barcode,
+               s.quantity, u.abbreviation AS unit_abbr
+        FROM ({stock_sql}) s
+        JOIN products p ON s.product_id = p.id
+        JOIN locations l ON s.location_id = l.id
+        LEFT JOIN units u ON p.unit_id = u.id
+        WHERE ABS(s.quantity) > 1e-9
+        ORDER BY l.name, p.name
+    '''
+    return query, params, base
+
+
+@reports_bp.route('/stock-as-of')
+@login_required
+def stock_as_of():
+    """Készlet adott nap végén (pl. hónapvégi leltár riport)"""
+    db = get_db_connection()
+    
+    day = _parse_report_date(request.args.get('date', ''))
+    if day is None:
+        flash('Hibás dátum!', 'danger')
+        return redirect(url_for('reports.stock_as_of'))
+    location_id = request.args.get('location', type=int)
+    
+    # A napi checkpoint itt készül el, ha ma még nem volt riport
+    snapshots.ensure_daily_checkpoint(db)
+    
+    query, params, base = stock_as_of_report_query(db, day, location_id)
+    rows = db.execute(query, params).fetchall()
+    
+    locations = db.execute('''
+        SELECT id, name FROM locations WHERE is_deleted = 0 ORDER BY name
+    ''').fetchall()
+    
+    return render_template('reports/stock_as_of.html',
+                         rows=rows,
+                         base=base,
+                         day=day,
+                         locations=locations,
+                         selected_location=location_id)
+
+
+@reports_bp.route('/stock-as-of/export')
+@login_required
+def export_stock_as_of():
+    """Készlet adott nap végén - CSV / XLSX letöltés"""
+    db = get_db_connection()
+    
+    day = _parse_report_date(request.args.get('date', ''))
+    if day is None:
+        flash('Hibás dátum!', 'danger')
+        return redirect(url_for('reports.stock_as_of'))
+    
+    query, params, _ = stock_as_of_report_query(db, day, request.args.get('location', type=int))
+    headers = ['Helyszín', 'Termék', 'Vonalkód', 'Mennyiség', 'Egység']
+    
+    return export_response(query, params, headers,
+                           filename=f'keszlet_{day.strftime("%Y%m%d")}',
+                           export_format=request.args.get('format', 'csv'),
+                           sheet_name=f'Készlet {day.isoformat()}')
+
+
+# Trend riport mozgástípus szűrők: érték -> (címke, típusok); az egyes típusok is választhatók
+TREND_TYPE_GROUPS = {
+    'consumption': ('Fogyasztás (kivételezés + fogyasztás)', ('STOCK_OUT', 'CONSUMPTION')),
+    'receipts': ('Beszerzés (bevételezés)', ('STOCK_IN',)),
+    'loss': ('Selejt/Veszteség', ('LOSS',)),
+}
+
+PERIOD_LABELS = {
+    'day': 'Napi',
+    'week': 'Heti',
+    'month': 'Havi',
+    'hour': 'Óránkénti',
+}
+
+# Alapértelmezett riport intervallum (napok) időszakonként
+DEFAULT_RANGE_DAYS = {'hour': 1, 'day': 30, 'week': 84, 'month': 365}
+
+
+def _trend_movement_types(value):
+    """Típus szűrő -> mozgástípusok (None = minden típus); ismeretlen érték esetén ValueError"""
+    if not value:
+        return None
+    if value in TREND_TYPE_GROUPS:
+        return TREND_TYPE_GROUPS[value][1]
+    if value in MovementType.LABELS:
+        return (value,)
+    raise ValueError(f'Ismeretlen mozgástípus: {value}')
+
+
+def _trend_params(args):
+    """
+    Trend riport paraméterek a kérésből
+    Visszatér: szótár (period, start, end, location_id, product_id, type, movement_types); hiba esetén ValueError
+    """
+    period = args.get('period', 'week')
+    if period not in rollups.PERIODS:
+        raise ValueError(f'Ismeretlen időszak: {period}')
+    end = _parse_report_date(args.get('to', ''))
+    if end is None:
+        raise ValueError('Hibás záró dátum!')
+    start = (_parse_report_date(args.get('from', ''))
+             if args.get('from') else end - timedelta(days=DEFAULT_RANGE_DAYS[period] - 1))
+    if start is None:
+        raise ValueError('Hibás kezdő dátum!')
+    if start > end:
+        start, end = end, start
+    movement_type = args.get('type', 'consumption')
+    return {
+        'period': period,
+        'start': start,
+        'end': end,
+        'location_id': args.get('location', type=int),
+        'product_id': args.get('product', type=int),
+        'type': movement_type,
+        'movement_types': _trend_movement_types(movement_type),
+    }
+
+
+def _trend_direction(movement_types):
+    """Kimenő típusoknál a (negatív) összeget pozitívként mutatjuk"""
+    if movement_types and all(MovementType.is_outbound(t) for t in movement_types):
+        return -1
+    return 1
+
+
+def _week_label(bucket):
+    start = datetime.strptime(bucket, '%Y-%m-%d').date()
+    return f'{start.strftime("%Y.%m.%d")} - {(start + timedelta(days=6)).strftime("%m.%d")}'
+
+
+@reports_bp.route('/trends')
+@login_required
+def trends():
+    """Forgalmi trend (pl. heti fogyasztás automatánként) az előre összesített rollup sorokból"""
+    db = get_db_connection()
+    
+    try:
+        params = _trend_params(request.args)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reports.trends'))
+    
+    # Az utolsó frissítés óta rögzített mozgások összesítése; nagy lemaradást (pl. első megnyitás
+    # régi mozgásnaplón) a háttér feladat dolgoz fel, addig a vízjelig összesített adat látszik
+    rollup_lag = rollups.catch_up(db)
+    if rollup_lag:
+        jobs.enqueue_once(db, 'rollup', priority=jobs.PRIORITY_LOW)
+    
+    filters = dict(location_id=params['location_id'], product_id=params['product_id'],
+                   movement_types=params['movement_types'])
+    direction = _trend_direction(params['movement_types'])
+    
+    # Időszak × helyszín kimutatás
+    sql, sql_params = rollups.series_query(params['period'], params['start'], params['end'],
+                                           group_by=('location',), **filters)
+    buckets = []
+    cells = {}
+    location_totals = {}
+    bucket_totals = {}
+    for row in db.execute(sql, sql_params):
+        quantity = direction * row['quantity']
+        if not buckets or buckets[-1] != row['bucket']:
+            buckets.append(row['bucket'])
+        cells[(row['bucket'], row['location_id'])] = quantity
+        location_totals[row['location_id']] = location_totals.get(row['location_id'], 0) + quantity
+        bucket_totals[row['bucket']] = bucket_totals.get(row['bucket'], 0) + quantity
+    
+    location_names = {row['id']: row['name'] for row in db.execute('SELECT id, name FROM locations')}
+    location_names[rollups.NO_LOCATION] = 'Helyszín nélkül'
+    columns = sorted(location_totals, key=lambda location_id: location_names.get(location_id, ''))
+    
+    # Termékek a teljes intervallumban (legnagyobb forgalom elöl)
+    sql, sql_params = rollups.series_query(params['period'], params['start'], params['end'],
+                                           group_by=('product',), by_bucket=False, **filters)
+    product_rows = sorted(db.execute(sql, sql_params).fetchall(),
+                          key=lambda row: -abs(row['quantity']))[:20]
+    products = {}
+    if product_rows:
+        product_ids = [row['product_id'] for row in product_rows]
+        products = {row['id']: row for row in db.execute(f'''
+            SELECT p.id, p.name, p.barcode, u.abbreviation AS unit_abbr
+            FROM products p LEFT JOIN units u ON p.unit_id = u.id
+            WHERE p.id IN ({",".join("?" * len(product_ids))})
+        ''', product_ids)}
+    
+    locations = db.execute('''
+        SELECT id, name FROM locations WHERE is_deleted = 0 ORDER BY name
+    ''').fetchall()
+    
+    labels = {bucket: _week_label(bucket) if params['period'] == 'week' else bucket for bucket in buckets}
+    peak = max((abs(value) for value in bucket_totals.values()), default=0)
+    
+    return render_template('reports/trends.html',
+                         params=params,
+                         rollup_lag=rollup_lag,
+                         buckets=buckets,
+                         labels=labels,
+                         cells=cells,
+                         columns=columns,
+                         location_names=location_names,
+                         location_totals=location_totals,
+                         bucket_totals=bucket_totals,
+                         peak=peak,
+                         product_rows=product_rows,
+                         products=products,
+                         direction=direction,
+                         locations=locations,
+                         type_groups=TREND_TYPE_GROUPS,
+                         movement_labels=MovementType.LABELS,
+                         period_labels=PERIOD_LABELS)
+
+
+@reports_bp.route('/api/rollups')
+@login_required
+def api_rollups():
+    """
+    Forgalmi idősor JSON-ban
+    Paraméterek: period (hour/day/week/month), from, to (ÉÉÉÉ-HH-NN), location, product,
+    type (consumption / receipts / loss / mozgástípus), group (location,product,type)
+    """
+    db = get_db_connection()
+    
+    try:
+        params = _trend_params(request.args)
+        group_by = tuple(key for key in request.args.get('group', '').split(',') if key)
+        unknown = [key for key in group_by if key not in rollups.GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f'Ismeretlen csoportosítás: {", ".join(unknown)}')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    rollup_lag = rollups.catch_up(db)
+    if rollup_lag:
+        jobs.enqueue_once(db, 'rollup', priority=jobs.PRIORITY_LOW)
+    sql, sql_params = rollups.series_query(
+        params['period'], params['start'], params['end'],
+        location_id=params['location_id'], product_id=params['product_id'],
+        movement_types=params['movement_types'], group_by=group_by)
+    
+    return jsonify({
+        'success': True,
+        'period': params['period'],
+        'from': params['start'].isoformat(),
+        'to': params['end'].isoformat(),
+        'movement_types': list(params['movement_types'] or []),
+        'rollup_lag': rollup_lag,
+        'rows': [dict(row) for row in db.execute(sql, sql_params)]
+    })
+
+
+@jobs.handler('rollup', 'Forgalmi összesítők frissítése')
+def _run_rollup(job, rebuild=False):
+    """Háttér feladat: forgalmi összesítők frissítése / újraépítése"""
+    processed = rollups.rebuild(job.db) if rebuild else rollups.refresh(job.db)
+    return {'processed': processed, 'watermark': rollups.watermark(job.db)}
+
+
+@jobs.handler('forecast', 'Fogyás előrejelzés')
+def _run_forecast(job, refit=False):
+    """Háttér feladat: fogyás előrejelzés léptetése / újraillesztése, utána a fedezeti riasztások"""
+    if refit:
+        rollups.refresh(job.db)
+        mode, count = 'refit', forecast.refit(job.db)
+    else:
+        mode, count = forecast.update(job.db)
+    opened, closed = alerts.evaluate_forecasts(job.db)
+    return {'mode': mode, 'series': count, 'alerts_opened': opened, 'alerts_closed': closed}
+
+
+@reports_bp.cli.command('checkpoint')
+def checkpoint_command():
+    """Napi készlet checkpoint (cron: flask --app wsgi reports checkpoint)"""
+    checkpoint_id = snapshots.ensure_daily_checkpoint(get_db_connection())
+    print(f'Checkpoint: #{checkpoint_id}' if checkpoint_id else 'A mai checkpoint már létezik.')
+
+
+@reports_bp.cli.command('rollup')
+@click.option('--rebuild', is_flag=True, help='Összesítők újraépítése a teljes mozgásnaplóból')
+def rollup_command(rebuild):
+    """Forgalmi összesítők frissítése (cron: flask --app wsgi reports rollup)"""
+    db = get_db_connection()
+    processed = rollups.rebuild(db) if rebuild else rollups.refresh(db)
+    print(f'Összesítve: {processed} mozgás (vízjel: #{rollups.watermark(db)})')
+
+
+@reports_bp.cli.command('forecast')
+@click.option('--refit', is_flag=True, help='Teljes újraillesztés (egyébként csak a lezárt új napok)')
+def forecast_command(refit):
+    """Fogyás előrejelzés frissítése (cron: flask --app wsgi reports forecast)"""
+    db = get_db_connection()
+    if refit:
+        rollups.refresh(db)
+        mode, count = 'refit', forecast.refit(db)
+    else:
+        mode, count = forecast.update(db)
+    opened, closed = alerts.evaluate_forecasts(db)
+    print(f'{"Újraillesztve" if mode == "refit" else "Léptetve"}: {count} idősor '
+          f'(riasztás: {opened} új, {closed} lezárva)')
@@ -8,11 +8,20 @@ LOGISZTIKAI SZABÁLYOK:
 3. FOGYASZTÁS: Autó -> Automata (CONSUMPTION/TRANSFER)
 4. VISSZAVONÁS: Kompenzáló tranzakció (REVERSAL) - soha nem törlünk!
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify,
+                   Response, current_app)
 from flask_login import login_required
 from app.database import get_db_connection, log_audit
 from app.models import MovementType, LocationType
-from datetime import datetime
+from app import (assets, forecast, httpcache, jobs, metrics, refcache, replenishment, rollups, stock_events,
+                 writer)
+from datetime import datetime, timezone
+import json
+import os
+import queue
+import random
+import sqlite3
+import time
 
 transfer_bp = Blueprint('transfer', __name__, url_prefix='/transfer')
 
@@ -72,7 +81,9 @@ def record_movement(db, product_id, movement_type, quantity_change,
     return cursor.lastrowid
 
 
-def execute_transfer(db, product_id, source_location_id, target_location_id, quantity, note=None):
+@writer.command('transfer')
+def execute_transfer(db, product_id, source_location_id, target_location_id, quantity, note=None,
+                     reference_movement_id=None):
     """
     ATOMI ÁTHELYEZÉS végrehajtása
     
@@ -81,6 +92,8 @@ def execute_transfer(db, product_id, source_location_id, target_location_id, qua
     2. Célba növekszik
     3. Mindkét mozgás naplózódik
     
+    A route-ok az író szálon futtatják: writer.execute('transfer', ...)
+    reference_movement_id: visszavonásnál az eredeti TRANSFER_OUT (a kompenzáló TRANSFER_OUT sorra kerül)
     Visszatér: (source_movement_id, target_movement_id)
     """
     if quantity <= 0:
@@ -107,6 +120,7 @@ def execute_transfer(db, product_id, source_location_id, target_location_id, qua
         location_id=source_location_id,
         source_location_id=source_location_id,
         target_location_id=target_location_id,
+        reference_movement_id=reference_movement_id,
         note=note
     )
     
@@ -123,24 +137,79 @@ def execute_transfer(db, product_id, source_location_id, target_location_id, qua
     return source_movement_id, target_movement_id
 
 
+def count_transfers(source_location_id, target_location_id, quantity, count=1):
+    """
+    Áthelyezés üzleti metrikák - a writer.execute visszatérése (COMMIT) után, a route-ból
+    A visszavonás kompenzáló áthelyezése nem számít áthelyezésnek.
+    """
+    labels = {'source': str(source_location_id), 'target': str(target_location_id)}
+    metrics.inc('edibes_transfers_total', labels, count)
+    metrics.inc('edibes_transfer_quantity_total', labels, quantity)
+
+
+def update_inventory_total(db, product_id):
+    """Összkészlet frissítése az inventory táblában (kompatibilitás)"""
+    total_qty = db.execute('''
+        SELECT COALESCE(SUM(li.quantity), 0) as total 
+        FROM location_inventory li
+        JOIN locations l ON li.location_id = l.id
+        WHERE li.product_id = ? AND l.is_deleted = 0
+    ''', (product_id,)).fetchone()['total']
+    
+    existing_inv = db.execute('SELECT id FROM inventory WHERE product_id = ?', (product_id,)).fetchone()
+    if existing_inv:
+        db.execute('UPDATE inventory SET quantity = ?, last_updated = CURRENT_TIMESTAMP WHERE product_id = ?',
+                  (total_qty, product_id))
+    else:
+        db.execute('INSERT INTO inventory (product_id, quantity) VALUES (?, ?)', (product_id, total_qty))
+
+
+@writer.command('consume')
+def execute_consumption(db, product_id, source_location_id, quantity, note=None):
+    """
+    AUTÓ KIADÁS végrehajtása (CONSUMPTION mozgás)
+    A commit a hívó feladata (route-ból: writer.execute('consume', ...)).
+    
+    Visszatér: (movement_id, quantity_after)
+    """
+    if quantity <= 0:
+        raise ValueError('A mennyiségnek pozitívnak kell lennie!')
+    
+    # Készlet csökkentése az autóból - ez CONSUMPTION típusú mozgás
+    before, after = update_location_stock(db, product_id, source_location_id, -quantity)
+    
+    movement_id = record_movement(
+        db, product_id, MovementType.CONSUMPTION, -quantity,
+        before, after,
+        location_id=source_location_id,
+        note=note
+    )
+    
+    update_inventory_total(db, product_id)
+    
+    return movement_id, after
+
+
+def count_consumption(car_location_id, quantity):
+    """Autó kiadás üzleti metrikák - a writer.execute visszatérése (COMMIT) után, a route-ból"""
+    labels = {'car': str(car_location_id)}
+    metrics.inc('edibes_consumptions_total', labels)
+    metrics.inc('edibes_consumption_quantity_total', labels, quantity)
+
+
 @transfer_bp.route('/')
 @login_required
+@httpcache.conditional
 def transfer_home():
     """Áthelyezés főoldal - workflow választó"""
     db = get_db_connection()
     
     # Helyszínek típus szerint
-    warehouses = db.execute('''
-        SELECT * FROM locations WHERE location_type = 'WAREHOUSE' AND is_deleted = 0 AND is_active = 1
-    ''').fetchall()
+    warehouses = refcache.active_locations(db, LocationType.WAREHOUSE)
     
-    cars = db.execute('''
-        SELECT * FROM locations WHERE location_type = 'CAR' AND is_deleted = 0 AND is_active = 1
-    ''').fetchall()
+    cars = refcache.active_locations(db, LocationType.CAR)
     
-    vendings = db.execute('''
-        SELECT * FROM locations WHERE location_type = 'VENDING' AND is_deleted = 0 AND is_active = 1
-    ''').fetchall()
+    vendings = refcache.active_locations(db, LocationType.VENDING)
     
     return render_template('transfer/home.html',
                          warehouses=warehouses,
@@ -151,6 +220,7 @@ def transfer_home():
 
 @transfer_bp.route('/quick')
 @login_required
+@httpcache.conditional
 def quick_transfer():
     """
     GYORS ÁTHELYEZÉS - termék alapú
@@ -173,16 +243,7 @@ def quick_transfer():
         ''', (product_id,)).fetchone()
     
     # Összes aktív helyszín
-    locations = db.execute('''
-        SELECT * FROM locations 
-        WHERE is_deleted = 0 AND is_active = 1
-        ORDER BY 
-            CASE location_type 
-                WHEN 'WAREHOUSE' THEN 1 
-                WHEN 'CAR' THEN 2 
-                WHEN 'VENDING' THEN 3 
-            END, name
-    ''').fetchall()
+    locations = refcache.active_locations(db)
     
     # Termék készletei helyszínenként
     location_stocks = {}
@@ -239,7 +300,9 @@ def execute_quick_transfer():
         return redirect(url_for('transfer.quick_transfer', product=product_id))
     
     try:
-        execute_transfer(db, product_id, source_id, target_id, quantity, note)
+        writer.execute('transfer', product_id=product_id, source_location_id=source_id,
+                       target_location_id=target_id, quantity=quantity, note=note)
+        count_transfers(source_id, target_id, quantity)
         
         # Termék és helyszín nevek a flash üzenethez
         product = db.execute('SELECT name FROM products WHERE id = ?', (product_id,)).fetchone()
@@ -247,19 +310,19 @@ def execute_quick_transfer():
         target = db.execute('SELECT name FROM locations WHERE id = ?', (target_id,)).fetchone()
         
         flash(f'Sikeres áthelyezés! {int(quantity)} db {product["name"]} ({source["name"]} → {target["name"]})', 'success')
-        return redirect(url_for('inventory.inventory_list'))
+        return redirect(url_for('inventory.list_inventory'))
         
     except ValueError as e:
         flash(str(e), 'danger')
         return redirect(url_for('transfer.quick_transfer', product=product_id))
     except Exception as e:
-        db.rollback()
         flash(f'Hiba történt: {str(e)}', 'danger')
         return redirect(url_for('transfer.quick_transfer', product=product_id))
 
 
 @transfer_bp.route('/warehouse-to-car', methods=['GET', 'POST'])
 @login_required
+@httpcache.conditional
 def warehouse_to_car():
     """
     FELTÖLTÉS: Raktár -> Autó
@@ -274,48 +337,57 @@ def warehouse_to_car():
         quantity = request.form.get('quantity', type=float)
         note = request.form.get('note', '').strip() or None
         
+        is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+        
         if not all([source_id, target_id, product_id, quantity]):
+            if is_ajax:
+                return jsonify({'success': False, 'error': 'Minden mező kitöltése kötelező!'})
             flash('Minden mező kitöltése kötelező!', 'danger')
             return redirect(url_for('transfer.warehouse_to_car'))
         
         try:
-            execute_transfer(db, product_id, source_id, target_id, quantity, note)
-            db.commit()
+            writer.execute('transfer', product_id=product_id, source_location_id=source_id,
+                           target_location_id=target_id, quantity=quantity, note=note)
+            count_transfers(source_id, target_id, quantity)
             
             # Termék neve a visszajelzéshez
             product = db.execute('SELECT name FROM products WHERE id = ?', (product_id,)).fetchone()
             source = db.execute('SELECT name FROM locations WHERE id = ?', (source_id,)).fetchone()
             target = db.execute('SELECT name FROM locations WHERE id = ?', (target_id,)).fetchone()
             
-            flash(f'Áthelyezve: {quantity} db {product["name"]} ({source["name"]} → {target["name"]})', 'success')
+            message = f'Áthelyezve: {quantity} db {product["name"]} ({source["name"]} → {target["name"]})'
+            
+            # AJAX esetén az oldal marad, a készletet az SSE stream frissíti
+            if is_ajax:
+                return jsonify({'success': True, 'message': message})
+            
+            flash(message, 'success')
             
             # Maradunk az oldalon a folytatáshoz
             return redirect(url_for('transfer.warehouse_to_car', 
                                    source=source_id, target=target_id))
             
         except ValueError as e:
+            if is_ajax:
+                return jsonify({'success': False, 'error': str(e)})
             flash(str(e), 'danger')
         except Exception as e:
-            db.rollback()
+            if is_ajax:
+                return jsonify({'success': False, 'error': str(e)})
             flash(f'Hiba történt: {str(e)}', 'danger')
     
+    # Az oldal készletadatai ehhez az eseményhez képest frissek (SSE visszajátszás innen indul)
+    stock_event_id = stock_events.current_event_id(db)
+    
     # Előre kiválasztott helyszínek
     selected_source = request.args.get('source', type=int)
     selected_target = request.args.get('target', type=int)
     
     # Raktárak
-    warehouses = db.execute('''
-        SELECT * FROM locations 
-        WHERE location_type = 'WAREHOUSE' AND is_deleted = 0 AND is_active = 1
-        ORDER BY name
-    ''').fetchall()
+    warehouses = refcache.active_locations(db, LocationType.WAREHOUSE)
     
     # Autók
-    cars = db.execute('''
-        SELECT * FROM locations 
-        WHERE location_type = 'CAR' AND is_deleted = 0 AND is_active = 1
-        ORDER BY name
-    ''').fetchall()
+    cars = refcache.active_locations(db, LocationType.CAR)
     
     # Alapértelmezett raktár ha nincs kiválasztva
     if not selected_source and warehouses:
@@ -341,11 +413,13 @@ def warehouse_to_car():
                          cars=cars,
                          products=products,
                          selected_source=selected_source,
-                         selected_target=selected_target)
+                         selected_target=selected_target,
+                         stock_event_id=stock_event_id)
 
 
 @transfer_bp.route('/car-to-vending', methods=['GET', 'POST'])
 @login_required
+@httpcache.conditional
 def car_to_vending():
     """
     AUTOMATA FELTÖLTÉS: Autó -> Automata
@@ -368,8 +442,9 @@ def car_to_vending():
             return redirect(url_for('transfer.car_to_vending'))
         
         try:
-            execute_transfer(db, product_id, source_id, target_id, quantity, note)
-            db.commit()
+            writer.execute('transfer', product_id=product_id, source_location_id=source_id,
+                           target_location_id=target_id, quantity=quantity, note=note)
+            count_transfers(source_id, target_id, quantity)
             
             product = db.execute('SELECT name FROM products WHERE id = ?', (product_id,)).fetchone()
             
@@ -388,25 +463,17 @@ def car_to_vending():
                 return jsonify({'success': False, 'error': str(e)})
             flash(str(e), 'danger')
         except Exception as e:
-            db.rollback()
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({'success': False, 'error': str(e)})
             flash(f'Hiba történt: {str(e)}', 'danger')
     
+    stock_event_id = stock_events.current_event_id(db)
     selected_source = request.args.get('source', type=int)
     selected_target = request.args.get('target', type=int)
     
-    cars = db.execute('''
-        SELECT * FROM locations 
-        WHERE location_type = 'CAR' AND is_deleted = 0 AND is_active = 1
-        ORDER BY name
-    ''').fetchall()
+    cars = refcache.active_locations(db, LocationType.CAR)
     
-    vendings = db.execute('''
-        SELECT * FROM locations 
-        WHERE location_type = 'VENDING' AND is_deleted = 0 AND is_active = 1
-        ORDER BY name
-    ''').fetchall()
+    vendings = refcache.active_locations(db, LocationType.VENDING)
     
     if not selected_source and cars:
         selected_source = cars[0]['id']
@@ -430,11 +497,104 @@ def car_to_vending():
                          vendings=vendings,
                          products=products,
                          selected_source=selected_source,
-                         selected_target=selected_target)
+                         selected_target=selected_target,
+                         stock_event_id=stock_event_id)
+
+
+@transfer_bp.route('/replenishment')
+@login_required
+def replenishment_plan():
+    """
+    FELTÖLTÉSI TERV: mit vigyen az autó a kiválasztott automatákba
+    Helyszín minimum készlet + várható fogyás a következő látogatásig -> igény automatánként,
+    az autó készletével összevetve (a hiány a raktárból felrakandó).
+    ?format=json esetén JSON (pl. mobil kliensnek)
+    """
+    db = get_db_connection()
+    
+    cars = refcache.active_locations(db, LocationType.CAR)
+    
+    vendings = refcache.active_locations(db, LocationType.VENDING)
+    
+    selected_car = request.args.get('car', type=int)
+    horizon_days = request.args.get('horizon', replenishment.DEFAULT_HORIZON_DAYS, type=int)
+    lookback_days = request.args.get('lookback', replenishment.DEFAULT_LOOKBACK_DAYS, type=int)
+    horizon_days = min(max(horizon_days, 1), 90)
+    lookback_days = min(max(lookback_days, 1), 365)
+    
+    # Első megnyitáskor minden automata kiválasztva
+    vending_ids = {vm['id'] for vm in vendings}
+    if 'car' in request.args:
+        selected_locations = [location_id for location_id in request.args.getlist('location', type=int)
+                              if location_id in vending_ids]
+    else:
+        selected_locations = [vm['id'] for vm in vendings]
+    if not selected_car and cars:
+        selected_car = cars[0]['id']
+    
+    rows = []
+    rollup_lag = None
+    if selected_car and selected_locations:
+        # Friss mozgások összesítése (nagy lemaradásnál háttér feladat); az előrejelzés léptetése /
+        # újraillesztése is háttér feladatban fut, a terv a tárolt előrejelzésekből készül (ahol
+        # nincs, az előzmény átlagából)
+        rollup_lag = rollups.catch_up(db)
+        if rollup_lag:
+            jobs.enqueue_once(db, 'rollup', priority=jobs.PRIORITY_LOW)
+        if forecast.due(db):
+            jobs.enqueue_once(db, 'forecast', priority=jobs.PRIORITY_LOW)
+        rows = replenishment.plan(db, selected_car, selected_locations, horizon_days, lookback_days)
+    by_location, by_product = replenishment.summarize(rows)
+    
+    products = {}
+    if by_product:
+        product_ids = list(by_product)
+        products = {row['id']: row for row in db.execute(f'''
+            SELECT p.id, p.name, p.barcode, p.package_size, u.abbreviation AS unit_abbr
+            FROM products p LEFT JOIN units u ON p.unit_id = u.id
+            WHERE p.id IN ({",".join("?" * len(product_ids))})
+        ''', product_ids)}
+    
+    pick_list = [dict(total, product_id=product_id, name=products[product_id]['name'])
+                 for product_id, total in by_product.items()]
+    pick_list.sort(key=lambda item: item['name'])
+    
+    if request.args.get('format') == 'json':
+        return jsonify({
+            'success': True,
+            'car_id': selected_car,
+            'horizon_days': horizon_days,
+            'lookback_days': lookback_days,
+            'rollup_lag': rollup_lag,
+            'stops': [
+                {'location_id': location_id, 'items': [
+                    {key: row[key] for key in ('product_id', 'quantity', 'min_level', 'daily_rate',
+                                               'forecasted', 'need', 'from_car')}
+                    for row in by_location[location_id]
+                ]}
+                for location_id in selected_locations if location_id in by_location
+            ],
+            'pick_list': pick_list
+        })
+    
+    return render_template('transfer/replenishment.html',
+                         cars=cars,
+                         vendings=vendings,
+                         warehouses=refcache.active_locations(db, LocationType.WAREHOUSE),
+                         selected_car=selected_car,
+                         selected_locations=selected_locations,
+                         horizon_days=horizon_days,
+                         lookback_days=lookback_days,
+                         rollup_lag=rollup_lag,
+                         by_location=by_location,
+                         pick_list=pick_list,
+                         products=products,
+                         location_names={vm['id']: vm['name'] for vm in vendings})
 
 
 @transfer_bp.route('/quick/<int:source_id>/<int:target_id>')
 @login_required
+@httpcache.conditional
 def quick_transfer_page(source_id, target_id):
     """
     GYORS ÁTHELYEZÉS oldal - vonalkód olvasóval
@@ -449,6 +609,8 @@ def quick_transfer_page(source_id, target_id):
         flash('Helyszín nem található!', 'danger')
         return redirect(url_for('transfer.transfer_home'))
     
+    stock_event_id = stock_events.current_event_id(db)
+    
     # Készlet a forráson
     products = db.execute('''
         SELECT 
@@ -466,6 +628,7 @@ def quick_transfer_page(source_id, target_id):
                          source=source,
                          target=target,
                          products=products,
+                         stock_event_id=stock_event_id,
                          LocationType=LocationType)
 
 
@@ -486,8 +649,9 @@ def api_execute_transfer():
         return jsonify({'success': False, 'error': 'Hiányzó paraméterek!'})
     
     try:
-        execute_transfer(db, product_id, source_id, target_id, float(quantity), note or None)
-        db.commit()
+        writer.execute('transfer', product_id=product_id, source_location_id=source_id,
+                       target_location_id=target_id, quantity=float(quantity), note=note or None)
+        count_transfers(source_id, target_id, float(quantity))
         
         product = db.execute('SELECT name FROM products WHERE id = ?', (product_id,)).fetchone()
         new_stock = get_location_stock(db, product_id, source_id)
@@ -501,10 +665,294 @@ def api_execute_transfer():
     except ValueError as e:
         return jsonify({'success': False, 'error': str(e)})
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'error': str(e)})
 
 
+# Offline szinkron: támogatott mozgás típusok
+SYNC_MOVEMENT_TYPES = ('TRANSFER', 'CONSUMPTION')
+
+
+def _parse_client_ts(value):
+    """Kliens időbélyeg (ISO 8601) UTC-re normalizálva, hibás érték esetén None"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _validate_sync_item(item, product_ids, locations):
+    """
+    Offline tétel ellenőrzése
+    Visszatér: hibaüzenet vagy None
+    """
+    if item.get('type') not in SYNC_MOVEMENT_TYPES:
+        return 'Ismeretlen mozgás típus!'
+    
+    if item.get('product_id') not in product_ids:
+        return 'Termék nem található!'
+    
+    quantity = item.get('quantity')
+    if isinstance(quantity, bool) or not isinstance(quantity, (int, float)) or quantity <= 0:
+        return 'A mennyiségnek pozitívnak kell lennie!'
+    
+    source_type = locations.get(item.get('source_location_id'))
+    if not source_type:
+        return 'Forrás helyszín nem található!'
+    
+    if item['type'] == 'CONSUMPTION':
+        if source_type != LocationType.CAR:
+            return 'Kiadás csak autóból lehetséges!'
+    else:
+        if item.get('target_location_id') not in locations:
+            return 'Cél helyszín nem található!'
+        if item['target_location_id'] == item['source_location_id']:
+            return 'A forrás és cél helyszín nem lehet ugyanaz!'
+    
+    return None
+
+
+def _apply_sync_item(db, item):
+    """Offline tétel alkalmazása, visszatér: a (forrás oldali) mozgás ID"""
+    quantity = float(item['quantity'])
+    note = (item.get('note') or '').strip() or None
+    
+    if item['type'] == 'CONSUMPTION':
+        movement_id, _ = execute_consumption(db, item['product_id'], item['source_location_id'],
+                                             quantity, note or 'Autó kiadás (offline)')
+        return movement_id
+    
+    movement_id, _ = execute_transfer(db, item['product_id'], item['source_location_id'],
+                                      item['target_location_id'], quantity,
+                                      note or 'Automata feltöltés (offline)')
+    return movement_id
+
+
+@writer.command('sync')
+def _apply_sync_batch(db, pending, product_ids, locations):
+    """
+    Offline köteg alkalmazása az író szálon (egy tranzakció, tételenként SAVEPOINT)
+    Visszatér: (tételenkénti eredmények, státusz számlálók)
+    """
+    # A nyugták az írási tranzakcióban olvasva: párhuzamos újraküldés sem fut le kétszer
+    receipts = {}
+    client_ids = list({entry[2] for entry in pending})
+    if client_ids:
+        for row in db.execute(f'''
+            SELECT client_id, status, movement_id, error FROM sync_receipts
+            WHERE client_id IN ({",".join("?" * len(client_ids))})
+        ''', client_ids):
+            receipts[row['client_id']] = dict(row)
+    
+    results = []
+    counts = {}
+    for client_ts, _, client_id, item in pending:
+        receipt = receipts.get(client_id)
+        if receipt:
+            results.append({'client_id': client_id, 'status': 'duplicate',
+                            'original_status': receipt['status'],
+                            'movement_id': receipt['movement_id'], 'error': receipt['error']})
+            counts['duplicate'] = counts.get('duplicate', 0) + 1
+            continue
+        
+        movement_id = None
+        error = _validate_sync_item(item, product_ids, locations)
+        if error:
+            status = 'invalid'
+        else:
+            db.execute('SAVEPOINT sync_item')
+            try:
+                movement_id = _apply_sync_item(db, item)
+                db.execute('RELEASE sync_item')
+                status = 'applied'
+            except (ValueError, sqlite3.IntegrityError) as e:
+                db.execute('ROLLBACK TO sync_item')
+                db.execute('RELEASE sync_item')
+                status, error = 'conflict', str(e)
+        
+        db.execute('''
+            INSERT INTO sync_receipts (client_id, status, movement_id, error, client_ts)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (client_id, status, movement_id, error, client_ts.strftime('%Y-%m-%d %H:%M:%S')))
+        receipts[client_id] = {'status': status, 'movement_id': movement_id, 'error': error}
+        
+        results.append({'client_id': client_id, 'status': status,
+                        'movement_id': movement_id, 'error': error})
+        counts[status] = counts.get(status, 0) + 1
+    
+    return results, counts
+
+
+@transfer_bp.route('/api/sync', methods=['POST'])
+@login_required
+def api_sync():
+    """
+    API: Offline sorban gyűlt mozgások tömeges szinkronizálása
+    Body: {"movements": [{"client_id", "client_ts", "type": "TRANSFER"|"CONSUMPTION",
+                          "product_id", "source_location_id", "target_location_id",
+                          "quantity", "note"}]}
+    
+    - Egy tranzakció, a tételek kliens időbélyeg szerinti sorrendben
+    - Tételenként SAVEPOINT: egy ütköző tétel (pl. elfogyott a készlet) nem görgeti vissza a többit
+    - client_id alapján a már feldolgozott tételek nem futnak le újra (elveszett válasz utáni újraküldés)
+    Válasz: tételenkénti eredmény (applied / duplicate / conflict / invalid)
+    """
+    db = get_db_connection()
+    
+    data = request.get_json(silent=True) or {}
+    items = data.get('movements')
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({'success': False, 'error': 'Hiányzó vagy hibás mozgás lista!'}), 400
+    
+    max_batch = current_app.config['SYNC_MAX_BATCH']
+    if len(items) > max_batch:
+        return jsonify({'success': False, 'error': f'Egyszerre legfeljebb {max_batch} tétel küldhető!'}), 400
+    
+    results = []
+    pending = []
+    for index, item in enumerate(items):
+        client_id = item.get('client_id')
+        client_ts = _parse_client_ts(item.get('client_ts'))
+        if not isinstance(client_id, str) or not client_id or len(client_id) > 64 or client_ts is None:
+            results.append({'client_id': client_id if isinstance(client_id, str) else None,
+                            'status': 'invalid', 'error': 'Hiányzó kliens azonosító vagy időbélyeg!'})
+            continue
+        pending.append((client_ts, index, client_id, item))
+    
+    # Sorrend: ahogy a terepen történt (azonos időnél a beküldési sorrend)
+    pending.sort(key=lambda entry: (entry[0], entry[1]))
+    
+    # Ellenőrzéshez szükséges adatok egy-egy lekérdezéssel
+    product_ids = {row['id'] for row in db.execute('SELECT id FROM products WHERE is_deleted = 0')}
+    locations = {row['id']: row['location_type'] for row in refcache.active_locations(db)}
+    
+    try:
+        # Egy író parancs: a teljes köteg egy tranzakcióban, az írási zárat egyszer szerezzük meg
+        applied_results, counts = writer.execute('sync', pending=pending, product_ids=product_ids,
+                                                 locations=locations)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    results.extend(applied_results)
+    
+    # Üzleti metrikák a COMMIT után, csak az alkalmazott tételekre (a köteg eredménye a pending sorrendjében)
+    for (_, _, _, item), result in zip(pending, applied_results):
+        if result['status'] != 'applied':
+            continue
+        if item['type'] == 'CONSUMPTION':
+            count_consumption(item['source_location_id'], float(item['quantity']))
+        else:
+            count_transfers(item['source_location_id'], item['target_location_id'], float(item['quantity']))
+    counts['invalid'] = counts.get('invalid', 0) + len(items) - len(pending)
+    
+    for status, count in counts.items():
+        if count:
+            metrics.inc('edibes_sync_items_total', {'status': status}, count)
+    
+    return jsonify({
+        'success': True,
+        'applied': counts.get('applied', 0),
+        'conflicts': counts.get('conflict', 0),
+        'results': results
+    })
+
+
+@transfer_bp.route('/sw.js')
+def service_worker():
+    """
+    Service worker a terepi oldalakhoz (app shell cache, offline sor)
+    A /transfer/ alól szolgáljuk ki, így a scope pontosan ezeket az oldalakat fedi.
+    A fájl elé kerül a konfiguráció (cache verzió, előre cache-elendő statikus fájlok):
+    új alkalmazás verziónál vagy statikus buildnél a böngésző eltérő workert kap és frissít.
+    """
+    with open(os.path.join(current_app.static_folder, 'sw.js'), encoding='utf-8') as f:
+        source = f.read()
+    
+    config = {
+        'version': '-'.join(part for part in (current_app.config['APP_VERSION'], assets.build_id()) if part),
+        'offlineQueue': url_for('static', filename='js/offline-queue.js'),
+        'precache': assets.shell_urls()
+    }
+    
+    response = current_app.response_class(f'self.SW_CONFIG = {json.dumps(config)};\n{source}',
+                                          mimetype='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@transfer_bp.route('/api/stock-stream')
+@login_required
+def api_stock_stream():
+    """
+    API: Élő készletváltozások (Server-Sent Events)
+    URL: /transfer/api/stock-stream?locations=1,2&last_id=123
+    Esemény: {"p": termék, "l": helyszín, "q": új mennyiség}
+    """
+    db = get_db_connection()
+    
+    location_ids = [int(x) for x in request.args.get('locations', '').split(',') if x.strip().isdigit()]
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_id', type=int)
+    
+    config = current_app.config
+    stock_events.hub.configure(config['DATABASE_PATH'], config['SSE_POLL_INTERVAL'],
+                               config['STOCK_EVENTS_RETENTION_HOURS'])
+    
+    # Először feliratkozunk, utána játsszuk vissza a kimaradt eseményeket - így nincs rés
+    subscription = stock_events.hub.subscribe(location_ids, limit=config['SSE_MAX_STREAMS'])
+    if subscription is None:
+        # Tele a worker: a stream azonnal lezárul, a böngésző a retry idő után csatlakozik újra
+        # (204 helyett, mert arra az EventSource végleg feladja). Jitter, hogy ne egyszerre jöjjenek.
+        metrics.inc('edibes_sse_rejected_total')
+        retry_ms = int(config['SSE_BUSY_RETRY_SECONDS'] * 1000 * random.uniform(0.75, 1.25))
+        response = Response(f'retry: {retry_ms}\n\n', mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    backlog, reset = [], False
+    if last_id is not None:
+        backlog, reset = stock_events.events_since(db, last_id, location_ids)
+    
+    def generate():
+        sent_id = last_id or 0
+        deadline = time.time() + config['SSE_STREAM_SECONDS']
+        try:
+            yield 'retry: 3000\n\n'
+            if reset:
+                yield 'event: reset\ndata: {}\n\n'
+                return
+            for row in backlog:
+                sent_id = row[0]
+                yield stock_events.format_event(row)
+            
+            while time.time() < deadline:
+                try:
+                    row = subscription.get(timeout=min(15, max(deadline - time.time(), 0.1)))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                if row is None:
+                    yield 'event: reset\ndata: {}\n\n'
+                    return
+                if row[0] <= sent_id:
+                    continue
+                sent_id = row[0]
+                yield stock_events.format_event(row)
+        finally:
+            stock_events.hub.unsubscribe(subscription)
+    
+    # A generátor nem használ request kontextust, így a DB kapcsolat a stream alatt felszabadul
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 @transfer_bp.route('/api/product-by-barcode/<barcode>')
 @login_required
 def api_product_by_barcode(barcode):
@@ -536,6 +984,7 @@ def api_product_by_barcode(barcode):
 
 @transfer_bp.route('/history')
 @login_required
+@httpcache.conditional
 def transfer_history():
     """Áthelyezések története"""
     db = get_db_connection()
@@ -566,9 +1015,7 @@ def transfer_history():
     
     movements = db.execute(query, params).fetchall()
     
-    locations = db.execute('''
-        SELECT id, name, location_type FROM locations WHERE is_deleted = 0 ORDER BY name
-    ''').fetchall()
+    locations = sorted(refcache.locations(db), key=lambda row: row['name'])
     
     return render_template('transfer/history.html',
                          movements=movements,
@@ -577,6 +1024,107 @@ def transfer_history():
                          MovementType=MovementType)
 
 
+def _transfer_pair(db, movement):
+    """Az áthelyezés TRANSFER_OUT sora és TRANSFER_IN párjának id-ja (None, ha nincs) - bármelyik tagjából"""
+    if movement['movement_type'] == 'TRANSFER_IN' and movement['reference_movement_id']:
+        out_row = db.execute('''
+            SELECT * FROM inventory_movements WHERE id = ?
+        ''', (movement['reference_movement_id'],)).fetchone() or movement
+    else:
+        out_row = movement
+    in_row = db.execute('''
+        SELECT id FROM inventory_movements
+        WHERE reference_movement_id = ? AND movement_type = 'TRANSFER_IN'
+    ''', (out_row['id'],)).fetchone()
+    return out_row, in_row['id'] if in_row else None
+
+
+def find_reversal(db, movement):
+    """
+    A mozgás visszavonásának id-ja, ha már vissza lett vonva (különben None)
+    Áthelyezésnél a pár bármelyik tagja számít, és mindkét visszavonási út: kompenzáló pár (a
+    kompenzáló TRANSFER_OUT az eredeti TRANSFER_OUT-ra hivatkozik; a korábban rögzítettek csak a
+    megjegyzésben: Visszavonás: #id) vagy soronkénti REVERSAL (inventory.undo_movement).
+    """
+    if movement['movement_type'] not in ('TRANSFER_OUT', 'TRANSFER_IN'):
+        row = db.execute('''
+            SELECT id FROM inventory_movements 
+            WHERE reference_movement_id = ? AND movement_type = 'REVERSAL'
+        ''', (movement['id'],)).fetchone()
+        return row['id'] if row else None
+    
+    out_row, in_id = _transfer_pair(db, movement)
+    row = db.execute('''
+        SELECT id FROM inventory_movements
+        WHERE (reference_movement_id = ? AND movement_type IN ('TRANSFER_OUT', 'REVERSAL'))
+           OR (reference_movement_id = ? AND movement_type = 'REVERSAL')
+        LIMIT 1
+    ''', (out_row['id'], in_id)).fetchone()
+    if not row:
+        # Régi kompenzáló pár: csak az eredeti utáni mozgások között keresünk (rowid tartomány)
+        notes = [f'Visszavonás: #{movement_id}' for movement_id in (out_row['id'], in_id) if movement_id]
+        row = db.execute(f'''
+            SELECT id FROM inventory_movements
+            WHERE id > ? AND product_id = ? AND movement_type = 'TRANSFER_OUT'
+              AND note IN ({",".join("?" * len(notes))})
+            LIMIT 1
+        ''', [out_row['id'], movement['product_id']] + notes).fetchone()
+    return row['id'] if row else None
+
+
+def _is_transfer_reversal(db, movement):
+    """Kompenzáló áthelyezés (visszavonás) tagja-e a mozgás"""
+    out_row, _ = _transfer_pair(db, movement)
+    return bool(out_row['reference_movement_id']) or (out_row['note'] or '').startswith('Visszavonás: #')
+
+
+@writer.command('reverse')
+def reverse_movement(db, movement_id):
+    """
+    Kompenzáló mozgás az író szálon
+    Az ismételt visszavonás ellenőrzése is itt fut (a parancs savepointjában), így két párhuzamos
+    kérés sem vonja vissza kétszer - áthelyezésnél a pár másik tagján keresztül sem
+    """
+    original = db.execute('''
+        SELECT * FROM inventory_movements WHERE id = ?
+    ''', (movement_id,)).fetchone()
+    if not original:
+        raise ValueError('Mozgás nem található!')
+    
+    if find_reversal(db, original):
+        raise ValueError('Ez a mozgás már vissza lett vonva!')
+    
+    # Bizonylat tétel áthelyezése nem hagy REVERSAL nyomot, a bizonylat visszavonása újra mozgatná
+    if original['movement_type'] in ['TRANSFER_OUT', 'TRANSFER_IN'] and original['document_id']:
+        raise ValueError(f'Bizonylat tétele - a teljes bizonylat vonható vissza (#{original["document_id"]})!')
+    
+    # Kompenzáló mozgás: ellentétes irányba, ellentétes mennyiséggel
+    if original['movement_type'] in ['TRANSFER_OUT', 'TRANSFER_IN']:
+        if _is_transfer_reversal(db, original):
+            raise ValueError('Visszavonás nem vonható vissza!')
+        
+        # Áthelyezés visszavonása: vissza kell helyezni
+        out_row, _ = _transfer_pair(db, original)
+        source_id = original['target_location_id']  # Eredeti cél = új forrás
+        target_id = original['source_location_id']  # Eredeti forrás = új cél
+        quantity = abs(original['quantity_change'])
+        
+        execute_transfer(db, original['product_id'], source_id, target_id, quantity,
+                       f'Visszavonás: #{movement_id}', reference_movement_id=out_row['id'])
+    else:
+        # Egyéb mozgás visszavonása
+        location_id = original['location_id']
+        quantity_change = -original['quantity_change']
+        
+        before, after = update_location_stock(db, original['product_id'], 
+                                              location_id, quantity_change)
+        
+        record_movement(db, original['product_id'], MovementType.REVERSAL,
+                      quantity_change, before, after, location_id,
+                      reference_movement_id=movement_id,
+                      note=f'Visszavonás: #{movement_id}')
+
+
 @transfer_bp.route('/reversal/<int:movement_id>', methods=['POST'])
 @login_required
 def create_reversal(movement_id):
@@ -595,46 +1143,18 @@ def create_reversal(movement_id):
         flash('Mozgás nem található!', 'danger')
         return redirect(url_for('transfer.transfer_history'))
     
-    # Ellenőrizzük, hogy már volt-e visszavonás
-    existing_reversal = db.execute('''
-        SELECT id FROM inventory_movements 
-        WHERE reference_movement_id = ? AND movement_type = 'REVERSAL'
-    ''', (movement_id,)).fetchone()
-    
-    if existing_reversal:
+    # Ellenőrizzük, hogy már volt-e visszavonás (a végleges ellenőrzés az író szálon fut)
+    if find_reversal(db, original):
         flash('Ez a mozgás már vissza lett vonva!', 'warning')
         return redirect(url_for('transfer.transfer_history'))
     
     try:
-        # Kompenzáló mozgás: ellentétes irányba, ellentétes mennyiséggel
-        if original['movement_type'] in ['TRANSFER_OUT', 'TRANSFER_IN']:
-            # Áthelyezés visszavonása: vissza kell helyezni
-            source_id = original['target_location_id']  # Eredeti cél = új forrás
-            target_id = original['source_location_id']  # Eredeti forrás = új cél
-            quantity = abs(original['quantity_change'])
-            
-            execute_transfer(db, original['product_id'], source_id, target_id, quantity,
-                           f'Visszavonás: #{movement_id}')
-        else:
-            # Egyéb mozgás visszavonása
-            location_id = original['location_id']
-            quantity_change = -original['quantity_change']
-            
-            before, after = update_location_stock(db, original['product_id'], 
-                                                  location_id, quantity_change)
-            
-            record_movement(db, original['product_id'], MovementType.REVERSAL,
-                          quantity_change, before, after, location_id,
-                          reference_movement_id=movement_id,
-                          note=f'Visszavonás: #{movement_id}')
-        
-        db.commit()
+        writer.execute('reverse', movement_id=movement_id)
         flash('Mozgás sikeresen visszavonva!', 'success')
         
     except ValueError as e:
         flash(f'Visszavonás sikertelen: {str(e)}', 'danger')
     except Exception as e:
-        db.rollback()
         flash(f'Hiba történt: {str(e)}', 'danger')
     
     return redirect(url_for('transfer.transfer_history'))
@@ -642,6 +1162,7 @@ def create_reversal(movement_id):
 
 @transfer_bp.route('/car-consumption', methods=['GET', 'POST'])
 @login_required
+@httpcache.conditional
 def car_consumption():
     """
     AUTÓ KIADÁS: Termék kikerül az autóból (fogyasztás)
@@ -669,33 +1190,9 @@ def car_consumption():
             return redirect(url_for('transfer.car_consumption'))
         
         try:
-            # Készlet csökkentése az autóból - ez CONSUMPTION típusú mozgás
-            before, after = update_location_stock(db, product_id, source_id, -quantity)
-            
-            # Mozgás rögzítése
-            record_movement(
-                db, product_id, MovementType.CONSUMPTION, -quantity,
-                before, after,
-                location_id=source_id,
-                note=note
-            )
-            
-            # Összkészlet frissítése az inventory táblában (kompatibilitás)
-            total_qty = db.execute('''
-                SELECT COALESCE(SUM(li.quantity), 0) as total 
-                FROM location_inventory li
-                JOIN locations l ON li.location_id = l.id
-                WHERE li.product_id = ? AND l.is_deleted = 0
-            ''', (product_id,)).fetchone()['total']
-            
-            existing_inv = db.execute('SELECT id FROM inventory WHERE product_id = ?', (product_id,)).fetchone()
-            if existing_inv:
-                db.execute('UPDATE inventory SET quantity = ?, last_updated = CURRENT_TIMESTAMP WHERE product_id = ?',
-                          (total_qty, product_id))
-            else:
-                db.execute('INSERT INTO inventory (product_id, quantity) VALUES (?, ?)', (product_id, total_qty))
-            
-            db.commit()
+            _, after = writer.execute('consume', product_id=product_id, source_location_id=source_id,
+                                      quantity=quantity, note=note)
+            count_consumption(source_id, quantity)
             
             product = db.execute('SELECT name FROM products WHERE id = ?', (product_id,)).fetchone()
             
@@ -714,7 +1211,6 @@ def car_consumption():
                 return jsonify({'success': False, 'error': str(e)})
             flash(str(e), 'danger')
         except Exception as e:
-            db.rollback()
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({'success': False, 'error': str(e)})
             flash(f'Hiba történt: {str(e)}', 'danger')
@@ -722,11 +1218,7 @@ def car_consumption():
     selected_source = request.args.get('source', type=int)
     
     # Autók lekérdezése
-    cars = db.execute('''
-        SELECT * FROM locations 
-        WHERE location_type = 'CAR' AND is_deleted = 0 AND is_active = 1
-        ORDER BY name
-    ''').fetchall()
+    cars = refcache.active_locations(db, LocationType.CAR)
     
     if not selected_source and cars:
         selected_source = cars[0]['id']
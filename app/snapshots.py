@@ -0,0 +1,174 @@
+"""
+Készlet visszamenőleg (point-in-time) - napi checkpoint + mozgás visszajátszás
+
+A stock_checkpoints tábla naponta legfeljebb egy checkpointot tárol: a
+location_inventory nem nulla sorainak másolatát (stock_snapshots) és az
+akkor utolsó mozgás azonosítóját. Egy T időpont készlete:
+- a T előtti legutóbbi checkpoint + az utána, T előtt rögzített mozgások összege,
+- ha T előtt nincs checkpoint: a T utáni első checkpoint (vagy az élő készlet)
+  mínusz a T és a checkpoint közötti mozgások.
+Így egy hónapvégi riport költsége a checkpoint óta történt mozgások számával
+arányos, nem a teljes előzményével. Csak a helyszínhez kötött mozgások
+(location_id) számítanak - ugyanezek módosítják a location_inventory táblát.
+
+Az időpontok UTC-ben értendők, mint a created_at oszlopok. A visszajátszó
+lekérdezésekben a unáris + jelöli, melyik feltétel NE használjon indexet
+(előre: id tartomány, vissza: created_at index).
+"""
+from datetime import datetime, timedelta
+
+# Napi checkpointok megőrzése; ennél régebbiekből csak a hónap első checkpointja marad
+DAILY_RETENTION_DAYS = 60
+
+
+def init_schema(db):
+    """Checkpoint táblák és a mozgás időpont index (init_db hívja)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS stock_checkpoints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            taken_at TIMESTAMP NOT NULL,
+            last_movement_id INTEGER NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_stock_checkpoints_taken_at ON stock_checkpoints(taken_at)')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS stock_snapshots (
+            checkpoint_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity REAL NOT NULL,
+            PRIMARY KEY (checkpoint_id, location_id, product_id),
+            FOREIGN KEY (checkpoint_id) REFERENCES stock_checkpoints(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+    # Időszak szűrés és visszajátszás a mozgásnaplón
+    db.execute('CREATE INDEX IF NOT EXISTS idx_inventory_movements_created_at ON inventory_movements(created_at)')
+
+
+def _timestamp(value):
+    """datetime -> a created_at oszlopokkal összehasonlítható szöveg"""
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def create_checkpoint(db):
+    """
+    Checkpoint készítése az élő készletből (saját tranzakció, commit)
+    Az írási zár alatt a készlet és az utolsó mozgás azonosítója összetartozik.
+    """
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        last_movement_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM inventory_movements').fetchone()[0]
+        cursor = db.execute('''
+            INSERT INTO stock_checkpoints (taken_at, last_movement_id) VALUES (?, ?)
+        ''', (_timestamp(datetime.utcnow()), last_movement_id))
+        checkpoint_id = cursor.lastrowid
+        row_count = db.execute('''
+            INSERT INTO stock_snapshots (checkpoint_id, location_id, product_id, quantity)
+            SELECT ?, location_id, product_id, quantity FROM location_inventory WHERE quantity != 0
+        ''', (checkpoint_id,)).rowcount
+        db.execute('UPDATE stock_checkpoints SET row_count = ? WHERE id = ?', (row_count, checkpoint_id))
+        _prune_checkpoints(db)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return checkpoint_id
+
+
+def _prune_checkpoints(db):
+    """Régi napi checkpointok ritkítása (havonta egy marad)"""
+    cutoff = _timestamp(datetime.utcnow() - timedelta(days=DAILY_RETENTION_DAYS))
+    db.execute('''
+        DELETE FROM stock_snapshots WHERE checkpoint_id IN (
+            SELECT id FROM stock_checkpoints
+            WHERE taken_at < ?
+              AND id NOT IN (SELECT MIN(id) FROM stock_checkpoints GROUP BY strftime('%Y-%m', taken_at))
+        )
+    ''', (cutoff,))
+    db.execute('''
+        DELETE FROM stock_checkpoints
+        WHERE taken_at < ?
+          AND id NOT IN (SELECT MIN(id) FROM stock_checkpoints GROUP BY strftime('%Y-%m', taken_at))
+    ''', (cutoff,))
+
+
+def ensure_daily_checkpoint(db):
+    """Mai (UTC) checkpoint készítése, ha még nincs - visszatér: új checkpoint id vagy None"""
+    today = _timestamp(datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0))
+    exists = db.execute('SELECT 1 FROM stock_checkpoints WHERE taken_at >= ? LIMIT 1', (today,)).fetchone()
+    if exists:
+        return None
+    return create_checkpoint(db)
+
+
+def as_of_query(db, as_of, location_id=None):
+    """
+    Termék × helyszín készlet az as_of (UTC datetime, kizárólagos) időpont előtt
+    Visszatér: (sql, params, alap) - az SQL oszlopai: product_id, location_id, quantity;
+    alap: {'kind': 'checkpoint' / 'live', 'taken_at': ..., 'direction': 'forward' / 'backward'}
+    A lekérdezést a hívó futtatja (oldal) vagy streameli (export).
+    """
+    until = _timestamp(as_of)
+    location_filter = ' AND location_id = ?' if location_id else ''
+    location_params = [location_id] if location_id else []
+
+    previous = db.execute('''
+        SELECT id, taken_at, last_movement_id FROM stock_checkpoints
+        WHERE taken_at <= ? ORDER BY taken_at DESC LIMIT 1
+    ''', (until,)).fetchone()
+
+    if previous:
+        # Előre: checkpoint + az utána, as_of előtt rögzített mozgások
+        sql = f'''
+            SELECT product_id, location_id, SUM(quantity) AS quantity FROM (
+                SELECT product_id, location_id, quantity FROM stock_snapshots
+                WHERE checkpoint_id = ?{location_filter}
+                UNION ALL
+                SELECT product_id, location_id, quantity_change FROM inventory_movements
+                WHERE id > ? AND +created_at < ? AND location_id IS NOT NULL{location_filter}
+            )
+            GROUP BY product_id, location_id
+        '''
+        params = [previous['id']] + location_params + [previous['last_movement_id'], until] + location_params
+        return sql, params, {'kind': 'checkpoint', 'taken_at': previous['taken_at'], 'direction': 'forward'}
+
+    following = db.execute('''
+        SELECT id, taken_at, last_movement_id FROM stock_checkpoints
+        ORDER BY taken_at LIMIT 1
+    ''').fetchone()
+
+    if following:
+        # Vissza: a legelső checkpointból kivonjuk az as_of és a checkpoint közötti mozgásokat
+        sql = f'''
+            SELECT product_id, location_id, SUM(quantity) AS quantity FROM (
+                SELECT product_id, location_id, quantity FROM stock_snapshots
+                WHERE checkpoint_id = ?{location_filter}
+                UNION ALL
+                SELECT product_id, location_id, -quantity_change FROM inventory_movements
+                WHERE created_at >= ? AND +id <= ? AND location_id IS NOT NULL{location_filter}
+            )
+            GROUP BY product_id, location_id
+        '''
+        params = [following['id']] + location_params + [until, following['last_movement_id']] + location_params
+        return sql, params, {'kind': 'checkpoint', 'taken_at': following['taken_at'], 'direction': 'backward'}
+
+    # Még nincs checkpoint: az élő készletből visszafelé
+    sql = f'''
+        SELECT product_id, location_id, SUM(quantity) AS quantity FROM (
+            SELECT product_id, location_id, quantity FROM location_inventory
+            WHERE 1=1{location_filter}
+            UNION ALL
+            SELECT product_id, location_id, -quantity_change FROM inventory_movements
+            WHERE created_at >= ? AND location_id IS NOT NULL{location_filter}
+        )
+        GROUP BY product_id, location_id
+    '''
+    params = location_params + [until] + location_params
+    return sql, params, {'kind': 'live', 'taken_at': None, 'direction': 'backward'}
+
+
+def stock_as_of(db, as_of, location_id=None):
+    """Készlet az adott időpontban: {(product_id, location_id): mennyiség} (nullák nélkül)"""
+    sql, params, _ = as_of_query(db, as_of, location_id)
+    return {(row[0], row[1]): row[2] for row in db.execute(sql, params) if abs(row[2]) > 1e-9}
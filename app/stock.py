@@ -0,0 +1,129 @@
+"""
+Halmaz alapú (set-based) készletkönyvelés tömeges műveletekhez
+
+Soronkénti lekérdezés / UPDATE / commit helyett:
+1. az érintett helyszínek készletét egyetlen lekérdezéssel beolvassuk,
+2. a sorok előtte/utána értékét memóriában görgetjük,
+3. a mozgásokat és a location_inventory upsertet executemany-vel írjuk,
+4. az inventory összkészletet egy-egy UPDATE / INSERT ... SELECT frissíti.
+
+A hívó nyisson írási tranzakciót (BEGIN IMMEDIATE) a beolvasás előtt,
+különben egy párhuzamos írás a beolvasás és az írás között elveszhet.
+"""
+from collections import namedtuple
+
+StockChange = namedtuple('StockChange', 'product_id location_id quantity_change note')
+
+PlannedMovement = namedtuple(
+    'PlannedMovement', 'product_id location_id quantity_change quantity_before quantity_after note'
+)
+
+
+def current_quantities(db, location_ids):
+    """Helyszínek készlete egy lekérdezéssel: {(product_id, location_id): mennyiség}"""
+    location_ids = list(set(location_ids))
+    if not location_ids:
+        return {}
+    rows = db.execute(f'''
+        SELECT product_id, location_id, quantity FROM location_inventory
+        WHERE location_id IN ({",".join("?" * len(location_ids))})
+    ''', location_ids).fetchall()
+    return {(row[0], row[1]): row[2] for row in rows}
+
+
+def plan_stock_changes(db, changes):
+    """
+    Változások előtte/utána értékeinek kiszámítása (írás nélkül - próbafuttatáshoz is)
+    Visszatér: (tervezett mozgások, hibák) - hiba, ha egy sor negatív készletet okozna
+    """
+    quantities = current_quantities(db, [change.location_id for change in changes])
+
+    planned = []
+    errors = []
+    for index, change in enumerate(changes):
+        key = (change.product_id, change.location_id)
+        before = quantities.get(key, 0)
+        after = before + change.quantity_change
+        if after < 0:
+            errors.append((index, f'Nincs elegendő készlet! Jelenlegi: {before}, változás: {change.quantity_change}'))
+            continue
+        quantities[key] = after
+        planned.append(PlannedMovement(change.product_id, change.location_id, change.quantity_change,
+                                       before, after, change.note))
+    return planned, errors
+
+
+def refresh_inventory_totals(db, product_ids):
+    """Összkészlet (inventory tábla, kompatibilitás) frissítése sok termékre két utasítással"""
+    db.execute('CREATE TEMP TABLE IF NOT EXISTS affected_products (product_id INTEGER PRIMARY KEY)')
+    db.execute('DELETE FROM temp.affected_products')
+    db.executemany('INSERT OR IGNORE INTO temp.affected_products (product_id) VALUES (?)',
+                   [(product_id,) for product_id in product_ids])
+
+    total_sql = '''
+        SELECT COALESCE(SUM(li.quantity), 0)
+        FROM location_inventory li
+        JOIN locations l ON li.location_id = l.id
+        WHERE li.product_id = {product} AND l.is_deleted = 0
+    '''
+    db.execute(f'''
+        UPDATE inventory
+        SET quantity = ({total_sql.format(product='inventory.product_id')}),
+            last_updated = CURRENT_TIMESTAMP
+        WHERE product_id IN (SELECT product_id FROM temp.affected_products)
+    ''')
+    db.execute(f'''
+        INSERT INTO inventory (product_id, quantity)
+        SELECT a.product_id, ({total_sql.format(product='a.product_id')})
+        FROM temp.affected_products a
+        WHERE NOT EXISTS (SELECT 1 FROM inventory i WHERE i.product_id = a.product_id)
+    ''')
+    db.execute('DELETE FROM temp.affected_products')
+
+
+def checked_plan(db, changes):
+    """plan_stock_changes, az első hibánál ValueError"""
+    planned, errors = plan_stock_changes(db, changes)
+    if errors:
+        index, message = errors[0]
+        raise ValueError(f'{index + 1}. tétel: {message}')
+    return planned
+
+
+def store_quantities(db, planned):
+    """A tervezett mozgások végső mennyiségei a location_inventory-ba (páronként egy upsert)"""
+    # Termék × helyszín páronként a végső mennyiség (az utolsó tervezett érték)
+    final = {}
+    for m in planned:
+        final[(m.product_id, m.location_id)] = m.quantity_after
+
+    db.executemany('''
+        INSERT INTO location_inventory (product_id, location_id, quantity, last_updated)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(product_id, location_id) DO UPDATE SET
+            quantity = excluded.quantity,
+            last_updated = excluded.last_updated
+    ''', [(product_id, location_id, quantity) for (product_id, location_id), quantity in final.items()])
+
+
+def apply_stock_changes(db, changes, movement_type, document_id=None):
+    """
+    Sok készletváltozás könyvelése egy menetben (commit a hívó feladata)
+    changes: StockChange lista, a könyvelés sorrendjében
+    document_id: a mozgások bizonylata (documents.py), ha van
+    Visszatér: a rögzített mozgások száma; negatív készlet esetén ValueError (semmi nem íródik)
+    """
+    planned = checked_plan(db, changes)
+
+    db.executemany('''
+        INSERT INTO inventory_movements
+        (product_id, movement_type, quantity_change, quantity_before, quantity_after, location_id, note,
+         document_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(m.product_id, movement_type, m.quantity_change, m.quantity_before, m.quantity_after,
+           m.location_id, m.note, document_id) for m in planned])
+
+    store_quantities(db, planned)
+    refresh_inventory_totals(db, {m.product_id for m in planned})
+
+    return len(planned)
@@ -0,0 +1,208 @@
+"""
+Élő készletváltozás események (Server-Sent Events)
+
+A location_inventory tábla triggerei minden mennyiségváltozást beírnak a
+stock_events táblába - így bármelyik írási útvonal (áthelyezés, fogyasztás,
+korrekció, visszavonás) eseményt generál. Minden gunicorn worker egyetlen
+háttérszálat futtat (StockEventHub), amely a táblát pollozza és az új
+eseményeket szétosztja a workerben nyitott SSE kapcsolatoknak. A workerek
+között így nincs szükség külön üzenetközvetítőre, a közös SQLite fájl a
+változásfolyam.
+"""
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+# Ennyi eseményt olvasunk egyszerre a táblából
+BATCH_SIZE = 500
+
+# Egy kliens sorában legfeljebb ennyi esemény várakozhat (lassú kliens védelem)
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+# Régi események törlésének gyakorisága (másodperc)
+PRUNE_INTERVAL = 600
+
+
+def init_schema(db):
+    """stock_events tábla és triggerek létrehozása (init_db hívja)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS stock_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            quantity REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_location_inventory_insert_event
+        AFTER INSERT ON location_inventory
+        BEGIN
+            INSERT INTO stock_events (product_id, location_id, quantity)
+            VALUES (NEW.product_id, NEW.location_id, NEW.quantity);
+        END
+    ''')
+    db.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_location_inventory_update_event
+        AFTER UPDATE OF quantity ON location_inventory
+        WHEN NEW.quantity IS NOT OLD.quantity
+        BEGIN
+            INSERT INTO stock_events (product_id, location_id, quantity)
+            VALUES (NEW.product_id, NEW.location_id, NEW.quantity);
+        END
+    ''')
+
+
+def format_event(row):
+    """Egy esemény SSE formátumban (kompakt JSON: p=termék, l=helyszín, q=mennyiség)"""
+    data = json.dumps({'p': row[1], 'l': row[2], 'q': row[3]}, separators=(',', ':'))
+    return f'id: {row[0]}\nevent: stock\ndata: {data}\n\n'
+
+
+def events_since(db, last_id, location_ids=None):
+    """
+    Események lekérdezése egy azonosító után (Last-Event-ID visszajátszás)
+    Visszatér: (események, reset) - reset=True ha a kért események már törölve lettek, vagy
+    BATCH_SIZE-nál több maradt ki (pl. leltár könyvelés, import): a hub csak a saját utolsó
+    azonosítója utániakat küldi, a köztes események elvesznének - az oldal újratöltése olcsóbb
+    """
+    oldest = db.execute('SELECT MIN(id) FROM stock_events').fetchone()[0]
+    if oldest is not None and last_id + 1 < oldest:
+        return [], True
+
+    query = 'SELECT id, product_id, location_id, quantity FROM stock_events WHERE id > ?'
+    params = [last_id]
+    if location_ids:
+        query += f' AND location_id IN ({",".join("?" * len(location_ids))})'
+        params.extend(location_ids)
+    query += ' ORDER BY id LIMIT ?'
+    params.append(BATCH_SIZE + 1)
+
+    rows = db.execute(query, params).fetchall()
+    if len(rows) > BATCH_SIZE:
+        return [], True
+    return [tuple(row) for row in rows], False
+
+
+def current_event_id(db):
+    """A legutolsó kiosztott esemény azonosító (törlés után sem csökken)"""
+    row = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'stock_events'").fetchone()
+    return row[0] if row else 0
+
+
+class StockEventHub:
+    """
+    Processzenkénti fan-out: egy polling szál, sok feliratkozó sor
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._thread = None
+        self._db_path = None
+        self._poll_interval = 0.5
+        self._retention_hours = 24
+
+    def configure(self, db_path, poll_interval, retention_hours):
+        self._db_path = db_path
+        self._poll_interval = poll_interval
+        self._retention_hours = retention_hours
+
+    def subscribe(self, location_ids=None, limit=None):
+        """
+        Új feliratkozó sor; location_ids=None esetén minden helyszín eseményei
+        limit: legfeljebb ennyi egyidejű feliratkozó a processzben - fölötte None
+        """
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers[q] = set(location_ids) if location_ids else None
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stock-event-hub', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.pop(q, None)
+
+    def reset_after_fork(self):
+        """Fork után a szülő szála nem létezik a gyerekben"""
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._thread = None
+
+    def _publish(self, rows):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for q, location_filter in subscribers:
+            for row in rows:
+                if location_filter is not None and row[2] not in location_filter:
+                    continue
+                try:
+                    q.put_nowait(row)
+                except queue.Full:
+                    # Túl lassú kliens: a sort ürítjük, a None jelzi, hogy töltse újra az oldalt
+                    self.unsubscribe(q)
+                    try:
+                        while True:
+                            q.get_nowait()
+                    except queue.Empty:
+                        pass
+                    q.put_nowait(None)
+                    break
+
+    def _run(self):
+        db = sqlite3.connect(self._db_path, timeout=30.0)
+        try:
+            last_id = current_event_id(db)
+            data_version = None
+            last_prune = 0.0
+
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        return
+
+                # data_version csak akkor változik, ha más kapcsolat írt az adatbázisba
+                version = db.execute('PRAGMA data_version').fetchone()[0]
+                if version != data_version:
+                    data_version = version
+                    while True:
+                        rows = db.execute('''
+                            SELECT id, product_id, location_id, quantity
+                            FROM stock_events WHERE id > ? ORDER BY id LIMIT ?
+                        ''', (last_id, BATCH_SIZE)).fetchall()
+                        if not rows:
+                            break
+                        last_id = rows[-1][0]
+                        self._publish([tuple(row) for row in rows])
+                        if len(rows) < BATCH_SIZE:
+                            break
+
+                now = time.time()
+                if now - last_prune > PRUNE_INTERVAL:
+                    last_prune = now
+                    try:
+                        db.execute('''
+                            DELETE FROM stock_events
+                            WHERE created_at < datetime('now', ?)
+                        ''', (f'-{int(self._retention_hours)} hours',))
+                        db.commit()
+                    except sqlite3.OperationalError:
+                        db.rollback()
+
+                time.sleep(self._poll_interval)
+        except Exception as e:
+            print(f"Készletesemény hub hiba: {e}")
+            with self._lock:
+                self._thread = None
+        finally:
+            db.close()
+
+
+hub = StockEventHub()
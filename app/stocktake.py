@@ -0,0 +1,132 @@
+"""
+Leltár (stocktake) munkamenetek: egy helyszín termékeinek megszámolása és könyvelése
+
+A számolt mennyiségek a stocktake_counts táblába kerülnek (termékenként egy sor,
+ismételt beolvasás hozzáad vagy felülír), a készlet közben nem változik. Könyveléskor
+az eltérést a location_inventory-hoz képest egyetlen lekérdezés adja (differences),
+a korrekciós (ADJUSTMENT) mozgásokat a stock.apply_stock_changes írja halmaz alapon,
+egy tranzakcióban, egy STOCKTAKE bizonylaton - egy 300 tételes raktár leltára egy
+commit, nem 300, és egészben visszavonható (documents.reverse).
+
+A munkamenet alatt a helyszínen történt egyéb mozgásokat (pl. áthelyezés) a
+könyvelés felülírná, ezért a leltár oldal figyelmeztet rájuk (movements_since_start).
+"""
+import sqlite3
+
+OPEN = 'OPEN'
+APPLIED = 'APPLIED'
+CANCELLED = 'CANCELLED'
+
+STATUS_LABELS = {
+    OPEN: 'Folyamatban',
+    APPLIED: 'Könyvelve',
+    CANCELLED: 'Elvetve'
+}
+
+
+def init_schema(db):
+    """Leltár táblák létrehozása (init_db hívja)"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS stocktake_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            location_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'OPEN',
+            note TEXT,
+            created_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at TIMESTAMP,
+            adjusted_count INTEGER,
+            document_id INTEGER,
+            FOREIGN KEY (location_id) REFERENCES locations(id)
+        )
+    ''')
+    # Migráció: a könyvelés bizonylata (documents.py)
+    try:
+        db.execute('ALTER TABLE stocktake_sessions ADD COLUMN document_id INTEGER')
+    except sqlite3.OperationalError:
+        # Oszlop már létezik
+        pass
+    db.execute('''
+        CREATE INDEX IF NOT EXISTS idx_stocktake_sessions_status
+        ON stocktake_sessions(status, created_at)
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS stocktake_counts (
+            session_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            counted_quantity REAL NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (session_id, product_id),
+            FOREIGN KEY (session_id) REFERENCES stocktake_sessions(id),
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )
+    ''')
+
+
+def get_session(db, session_id):
+    return db.execute('''
+        SELECT s.*, l.name as location_name, l.location_type,
+               (SELECT COUNT(*) FROM stocktake_counts c WHERE c.session_id = s.id) as counted_products
+        FROM stocktake_sessions s
+        JOIN locations l ON s.location_id = l.id
+        WHERE s.id = ?
+    ''', (session_id,)).fetchone()
+
+
+def record_count(db, session_id, product_id, quantity, add=False):
+    """
+    Számolt mennyiség rögzítése (commit a hívó feladata)
+    add=True: a meglévő számhoz ad (pl. darabonkénti beolvasás), különben felülír
+    Visszatér: a termék számolt mennyisége
+    """
+    return db.execute('''
+        INSERT INTO stocktake_counts (session_id, product_id, counted_quantity, updated_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(session_id, product_id) DO UPDATE SET
+            counted_quantity = CASE WHEN ? THEN counted_quantity + excluded.counted_quantity
+                                    ELSE excluded.counted_quantity END,
+            updated_at = excluded.updated_at
+        RETURNING counted_quantity
+    ''', (session_id, product_id, quantity, 1 if add else 0)).fetchone()[0]
+
+
+def differences(db, session_id, location_id, include_uncounted=False, only_changed=False):
+    """
+    Számolt és nyilvántartott készlet termékenként, egyetlen lekérdezéssel
+    include_uncounted: a helyszín nem számolt, de készleten lévő termékei 0 számolt mennyiséggel
+    (teljes leltár); only_changed: csak az eltérő sorok
+    """
+    uncounted_sql = '''
+        UNION ALL
+        SELECT li.product_id, 0, li.quantity, 0
+        FROM location_inventory li
+        WHERE li.location_id = :location_id AND li.quantity != 0
+          AND NOT EXISTS (SELECT 1 FROM stocktake_counts c
+                          WHERE c.session_id = :session_id AND c.product_id = li.product_id)
+    ''' if include_uncounted else ''
+
+    return db.execute(f'''
+        SELECT d.product_id, p.name, p.barcode, d.counted_quantity, d.system_quantity,
+               d.counted_quantity - d.system_quantity as difference, d.counted
+        FROM (
+            SELECT c.product_id, c.counted_quantity, COALESCE(li.quantity, 0) as system_quantity, 1 as counted
+            FROM stocktake_counts c
+            LEFT JOIN location_inventory li
+                ON li.product_id = c.product_id AND li.location_id = :location_id
+            WHERE c.session_id = :session_id
+            {uncounted_sql}
+        ) d
+        JOIN products p ON d.product_id = p.id
+        {'WHERE d.counted_quantity != d.system_quantity' if only_changed else ''}
+        ORDER BY p.name
+    ''', {'session_id': session_id, 'location_id': location_id}).fetchall()
+
+
+def movements_since_start(db, session):
+    """A munkamenet kezdete óta a helyszínen rögzített mozgások száma"""
+    return db.execute('''
+        SELECT COUNT(*) FROM inventory_movements
+        WHERE created_at >= (SELECT created_at FROM stocktake_sessions WHERE id = :session_id)
+          AND (location_id = :location_id OR source_location_id = :location_id
+               OR target_location_id = :location_id)
+    ''', {'session_id': session['id'], 'location_id': session['location_id']}).fetchone()[0]
@@ -0,0 +1,173 @@
+"""
+Egyetlen író szál csoportos commit-tal (group commit) a készletmozgásokhoz
+
+A kérések nem saját kapcsolaton írnak és commitolnak, hanem parancsot tesznek
+a processz író sorába (áthelyezés, kiadás, korrekció, visszavonás), és a
+Future eredményére várnak. Az író szál a sorban összegyűlt parancsokat egy
+tranzakcióban hajtja végre (parancsonként SAVEPOINT, így egy hibás parancs
+csak önmagát görgeti vissza), egyetlen COMMIT-tal (egy fsync), majd minden
+Future megkapja a saját eredményét vagy kivételét.
+
+Terhelés alatt, amíg egy COMMIT fsync-re vár, a következő kérések már a sorba
+gyűlnek, így a következő tranzakció többet visz - az fsync-ek száma nem a
+kérésekkel, hanem a kötegekkel nő. Processzen belül nincs írási zár verseny;
+gunicorn workerek között a busy_timeout továbbra is sorba állítja az írókat.
+
+A parancsok a domain kódnál regisztrálnak:
+
+    @writer.command('transfer')
+    def _transfer_command(db, product_id, ...):
+        ...
+
+A parancs a kapott kapcsolaton dolgozik, nem commitol, hibánál kivételt dob
+(ValueError: üzleti hiba, a hívó ugyanúgy kapja meg, mint közvetlen hívásnál).
+"""
+import queue
+import threading
+from concurrent.futures import Future
+
+from flask import current_app
+from app import metrics
+from app.database import open_connection
+
+# Egy tranzakcióba legfeljebb ennyi parancs kerül
+MAX_BATCH = 64
+
+# A kérés legfeljebb ennyit vár az eredményre (másodperc)
+RESULT_TIMEOUT = 60
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# Parancsok: név -> függvény(db, **params)
+_commands = {}
+
+
+def command(kind):
+    """Író parancs regisztrálása"""
+    def decorator(func):
+        _commands[kind] = func
+        return func
+    return decorator
+
+
+class StockWriter:
+    """Egy adatbázis fájl író szála és sora (processzenként egy)"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='stock-writer', daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def submit(self, kind, params):
+        if kind not in _commands:
+            raise ValueError(f'Ismeretlen író parancs: {kind}')
+        future = Future()
+        self._queue.put((kind, params, future))
+        return future
+
+    def stop(self, timeout=None):
+        """A sorban lévő parancsok végrehajtása után leáll"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        """Blokkol az első parancsig, utána a sorban már várakozókat veszi hozzá (várakozás nélkül)"""
+        item = self._queue.get()
+        if item is None:
+            return [], True
+        batch = [item]
+        while len(batch) < MAX_BATCH:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        db = open_connection(self.db_path)
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._apply(db, batch)
+        finally:
+            db.close()
+
+    def _apply(self, db, batch):
+        outcomes = []
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            for kind, params, future in batch:
+                db.execute('SAVEPOINT writer_command')
+                try:
+                    outcomes.append((future, _commands[kind](db, **params), None))
+                except Exception as e:
+                    db.execute('ROLLBACK TO writer_command')
+                    outcomes.append((future, None, e))
+                db.execute('RELEASE writer_command')
+            db.commit()
+        except Exception as e:
+            # Tranzakció szintű hiba (zár timeout, I/O): a köteg egyik parancsa sem íródott ki
+            if db.in_transaction:
+                db.rollback()
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        metrics.observe('edibes_writer_batch_size', len(batch), buckets=BATCH_SIZE_BUCKETS)
+        # Eredmény csak a COMMIT után - a hívó tartós állapotot lát
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+_lock = threading.Lock()
+_writers = {}
+
+
+def get_writer(db_path):
+    """A processz író szála ehhez az adatbázishoz (első használatkor indul)"""
+    writer = _writers.get(db_path)
+    if writer is not None and writer.is_alive():
+        return writer
+    with _lock:
+        writer = _writers.get(db_path)
+        if writer is None or not writer.is_alive():
+            writer = _writers[db_path] = StockWriter(db_path)
+    return writer
+
+
+def submit(db_path, kind, **params):
+    """Parancs a sorba, visszatér: Future"""
+    return get_writer(db_path).submit(kind, params)
+
+
+def execute(kind, **params):
+    """
+    Parancs végrehajtása kérésből, az eredmény visszaadásával
+    A parancs kivételét (pl. ValueError: nincs elegendő készlet) itt dobja tovább
+    """
+    return submit(current_app.config['DATABASE_PATH'], kind, **params).result(RESULT_TIMEOUT)
+
+
+def stop(timeout=None):
+    """Író szálak leállítása a sor kiürítése után (gunicorn worker kilépéskor)"""
+    for writer in list(_writers.values()):
+        writer.stop(timeout)
+
+
+def reset_after_fork():
+    """Fork után a szülő író szála nem létezik a gyerekben"""
+    global _lock
+    _lock = threading.Lock()
+    _writers.clear()
@@ -0,0 +1,86 @@
+"""
+Gunicorn telepítési profil (Docker, systemd)
+
+Indítás: gunicorn -c gunicorn.conf.py wsgi:app
+Minden érték környezeti változóval felülírható (GUNICORN_*).
+
+Méretezés:
+- SQLite egyszerre egy írót enged; a processzek a GIL miatt egy magot használnak.
+  Magonként egy worker kell, de a magszám fölött a további processzek már csak
+  egymás írási zárjára várnak (busy_timeout), ezért a default GUNICORN_MAX_WORKERS-nél megáll.
+- Szálak: egy nyitott élő készlet stream (SSE) a teljes SSE_STREAM_SECONDS idejére
+  lefoglal egy gthread szálat - minden nyitott áthelyezés képernyő egyet. A worker
+  legfeljebb SSE_MAX_STREAMS streamet fogad (fölötte a kliens később próbálkozik),
+  a szálszám ennél REQUEST_THREADS-szel több, ez marad a normál kéréseknek.
+  Mérés (bench_gunicorn.py, 1 mag, 8 kliens, 2 worker, 8 nyitott stream): 4 szálon
+  a streamek minden szálat elfoglalnak (0,4 req/s, 54 s késleltetés), 8 szálon
+  4-es stream korláttal 72 req/s; 16 streamnél korlát nélkül ismét 0,4 req/s,
+  korláttal 57 req/s.
+- A defaultokat a scripts/bench_gunicorn.py méréssel lehet ellenőrizni az adott gépen
+  (--streams: nyitott streamek a terhelés alatt).
+"""
+import os
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _default_workers():
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    return max(2, min(cpus, _env_int('GUNICORN_MAX_WORKERS', 4)))
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = _env_int('GUNICORN_WORKERS', _default_workers())
+# Normál kérések szálai workerenként a streamek (SSE_MAX_STREAMS, app config default: 4) mellett
+REQUEST_THREADS = 4
+threads = _env_int('GUNICORN_THREADS', _env_int('SSE_MAX_STREAMS', 4) + REQUEST_THREADS)
+worker_class = 'gthread'
+
+# Hosszú kérések (backup letöltés, import) ne kapjanak SIGKILL-t; leállításkor a futó feladatnak is jusson idő
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = 5
+
+# Az alkalmazás (create_app, init_db, sémamigráció) egyszer töltődik be a master processzben,
+# a workerek forkkal öröklik - nem fut N-szer párhuzamosan a migráció indításkor
+preload_app = True
+
+# Worker csere N kérés után (memória töredezettség), jitterrel, hogy ne egyszerre induljanak újra
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+# Szívverés fájl memóriában (SD kártyán a /tmp írása lassú és kopást okoz)
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def post_fork(server, worker):
+    """
+    A master processz állapotának eldobása a workerben.
+    Adatbázis kapcsolat nem öröklődik: init_db a saját app contextjében nyit és zár,
+    a kérések kapcsolata g-ben él. A processz szintű állapotot viszont nullázni kell.
+    """
+    from app import metrics, stock_events, jobs, writer, refcache, httpcache
+
+    metrics.reset_after_fork()
+    stock_events.hub.reset_after_fork()
+    jobs.reset_after_fork()
+    writer.reset_after_fork()
+    refcache.reset_after_fork()
+    httpcache.reset_after_fork()
+
+
+def worker_exit(server, worker):
+    """Kilépő worker: író sor kiürítése, beágyazott feladat worker megállítása, metrikák utolsó kiírása"""
+    from app import metrics, jobs, writer
+
+    writer.stop(timeout=graceful_timeout)
+    jobs.stop_embedded_worker(timeout=graceful_timeout)
+    metrics.flush()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Gunicorn worker / szál szám mérése a célgépen (pl. Raspberry Pi 4, 4 mag, ARM)
+
+Minden workers x threads kombinációra elindítja a gunicorn.conf.py profilt egy
+ideiglenes adatbázissal, vegyes olvasás/írás terhelést ad rá (dashboard, helyszín
+készlet, vonalkód keresés / áthelyezés), majd kiírja az áteresztést, a késleltetést
+és az írási zár versengést (a workerek metrika fájljaiból).
+
+A --streams N kliens közben nyitott élő készlet streamet tart (mint a nyitott
+áthelyezés képernyők); egy stream egy gunicorn szálat foglal, így ezzel mérhető,
+mennyi szál marad a normál kéréseknek. Az "sse" oszlop a kiszolgált / elutasított
+(SSE_MAX_STREAMS fölötti) stream kapcsolatok száma.
+
+Használat (a projekt gyökeréből, a venv-ben):
+    python scripts/bench_gunicorn.py
+    python scripts/bench_gunicorn.py --grid 2x4,4x4,4x8,8x2 --clients 16 --duration 30 --write-ratio 0.3
+    python scripts/bench_gunicorn.py --grid 2x4,2x8 --streams 8
+
+A terhelő kliensek ugyanazon a gépen futnak; Pi-n érdemes kevesebb klienssel is
+lefuttatni, vagy a --url opcióval egy másik gépről egy már futó példányt mérni.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WAREHOUSE_ID = 1
+CAR_ID = 2
+
+
+def seed_database(db_path, products):
+    """Séma létrehozása (create_app) és tesztadatok: termékek raktárban és autóban"""
+    from app import create_app
+    from app.config import Config
+
+    class BenchConfig(Config):
+        DATABASE_PATH = db_path
+        BACKUP_DIR = os.path.join(os.path.dirname(db_path), 'backups')
+        JOBS_EMBEDDED_WORKER = False
+
+    create_app(BenchConfig)
+
+    con = sqlite3.connect(db_path)
+    with con:
+        for i in range(products):
+            cur = con.execute('INSERT INTO products (name, barcode, unit_id, category_id) VALUES (?, ?, 1, 1)',
+                              (f'Teszt termék {i}', f'2990000{i:06d}'))
+            for location_id, quantity in ((WAREHOUSE_ID, 100000), (CAR_ID, 100000)):
+                con.execute('INSERT INTO location_inventory (product_id, location_id, quantity) VALUES (?, ?, ?)',
+                            (cur.lastrowid, location_id, quantity))
+    con.close()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, threads, port, db_path, metrics_dir):
+    env = dict(os.environ,
+               DATABASE_PATH=db_path,
+               METRICS_DIR=metrics_dir,
+               JOBS_EMBEDDED_WORKER='false',
+               GUNICORN_BIND=f'127.0.0.1:{port}',
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads),
+               GUNICORN_LOGLEVEL='warning')
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                            cwd=ROOT, env=env)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('A gunicorn nem indult el')
+        try:
+            urllib.request.urlopen(f'{url}/login', timeout=1).read()
+            return proc, url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError('A gunicorn nem válaszol')
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(60)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def make_client(url, password):
+    """Bejelentkezett kliens (saját session süti)"""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    data = urllib.parse.urlencode({'password': password}).encode()
+    opener.open(f'{url}/login', data, timeout=10).read()
+    return opener
+
+
+def client_loop(opener, url, products, write_ratio, stop, results):
+    rng = random.Random()
+    while not stop.is_set():
+        index = rng.randrange(products)
+        if rng.random() < write_ratio:
+            kind = 'write'
+            # Oda-vissza mozgatás, hogy a készlet ne fogyjon el
+            source, target = (WAREHOUSE_ID, CAR_ID) if rng.random() < 0.5 else (CAR_ID, WAREHOUSE_ID)
+            body = json.dumps({'source_location_id': source, 'target_location_id': target,
+                               'product_id': index + 1, 'quantity': 1}).encode()
+            req = urllib.request.Request(f'{url}/transfer/api/execute', body,
+                                         {'Content-Type': 'application/json'})
+        else:
+            kind = 'read'
+            req = rng.choice((f'{url}/',
+                              f'{url}/locations/{WAREHOUSE_ID}/inventory',
+                              f'{url}/transfer/api/product-by-barcode/2990000{index:06d}'))
+        started = time.perf_counter()
+        ok = True
+        try:
+            with opener.open(req, timeout=60) as resp:
+                payload = resp.read()
+            if kind == 'write':
+                ok = json.loads(payload).get('success', False)
+        except (urllib.error.URLError, OSError, ValueError):
+            ok = False
+        results.append((kind, time.perf_counter() - started, ok))
+
+
+def stream_loop(opener, url, stop, streams):
+    """Nyitott SSE kliens: a stream végéig olvas, utána a kapott retry idő múlva újracsatlakozik"""
+    while not stop.is_set():
+        retry = 3.0
+        try:
+            with opener.open(f'{url}/transfer/api/stock-stream?locations={WAREHOUSE_ID},{CAR_ID}',
+                             timeout=70) as resp:
+                streams.append(time.time())
+                for line in resp:
+                    if line.startswith(b'retry:'):
+                        retry = int(line[6:]) / 1000
+                    if stop.is_set():
+                        break
+        except (urllib.error.URLError, OSError, ValueError):
+            pass
+        stop.wait(retry)
+
+
+def lock_contention(metrics_dir):
+    """Írási zár statisztika a workerek metrika fájljaiból (a leállt workereké is)"""
+    from app import metrics
+
+    metrics.configure(metrics_dir)
+    counters, histograms, _ = metrics.collect()
+    wait = histograms.get(('edibes_db_lock_wait_seconds', ()), {'sum': 0.0, 'count': 0})
+    return {
+        'busy': int(counters.get(('edibes_db_busy_total', ()), 0)),
+        'locked': int(counters.get(('edibes_db_locked_errors_total', ()), 0)),
+        'lock_wait_avg_ms': (wait['sum'] / wait['count'] * 1000) if wait['count'] else 0.0,
+        'sse_rejected': int(counters.get(('edibes_sse_rejected_total', ()), 0)),
+    }
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run_load(url, args):
+    openers = [make_client(url, args.password) for _ in range(args.clients)]
+    stop = threading.Event()
+    results = []
+    streams = []
+
+    # A streamek a terhelés előtt nyílnak és végig nyitva maradnak (démon szálak: a szerver leállítása zárja);
+    # bejelentkezés előtte mindegyikkel, mert a nyitott streamek már elfoghatják a szálakat
+    stream_openers = [make_client(url, args.password) for _ in range(args.streams)]
+    for opener in stream_openers:
+        threading.Thread(target=stream_loop, args=(opener, url, stop, streams), daemon=True).start()
+    if args.streams:
+        time.sleep(1)
+
+    threads = [threading.Thread(target=client_loop,
+                                args=(opener, url, args.products, args.write_ratio, stop, results))
+               for opener in openers]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return results, streams
+
+
+def summarize(label, load, duration, contention=None):
+    results, streams = load
+    reads = [d for kind, d, ok in results if kind == 'read']
+    writes = [d for kind, d, ok in results if kind == 'write']
+    errors = sum(1 for _, _, ok in results if not ok)
+    row = (f'{label:>8} {len(results) / duration:8.1f} '
+           f'{percentile(reads, 0.5) * 1000:8.1f} {percentile(reads, 0.95) * 1000:8.1f} '
+           f'{percentile(writes, 0.5) * 1000:8.1f} {percentile(writes, 0.95) * 1000:8.1f} {errors:6d}')
+    if contention:
+        row += f' {contention["busy"]:6d} {contention["locked"]:6d} {contention["lock_wait_avg_ms"]:9.1f}'
+        if streams:
+            rejected = contention['sse_rejected']
+            row += f' {len(streams) - rejected:>5d}/{rejected:<5d}'
+    print(row, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', default='1x4,2x4,4x4,4x8,8x4',
+                        help='workers x threads kombinációk vesszővel (default: %(default)s)')
+    parser.add_argument('--clients', type=int, default=16, help='Párhuzamos kliensek (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=20, help='Mérés hossza másodpercben (default: %(default)s)')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='Írások aránya (default: %(default)s)')
+    parser.add_argument('--streams', type=int, default=0,
+                        help='Közben nyitva tartott élő készlet streamek (default: %(default)s)')
+    parser.add_argument('--products', type=int, default=500, help='Tesztadat termékek száma (default: %(default)s)')
+    parser.add_argument('--password', default=os.environ.get('APP_PASSWORD') or 'leltar2024')
+    parser.add_argument('--url', default=None, help='Már futó példány mérése (nincs indítás és tesztadat)')
+    args = parser.parse_args()
+
+    print(f'CPU: {os.cpu_count()}, kliensek: {args.clients}, írás arány: {args.write_ratio}, '
+          f'streamek: {args.streams}, {args.duration:.0f} s')
+    print(f'{"w x t":>8} {"req/s":>8} {"r p50":>8} {"r p95":>8} {"w p50":>8} {"w p95":>8} {"hiba":>6}'
+          f' {"busy":>6} {"locked":>6} {"zár ms":>9}' + (f' {"sse":>11}' if args.streams else ''))
+
+    if args.url:
+        summarize('url', run_load(args.url.rstrip('/'), args), args.duration)
+        return
+
+    for combo in args.grid.split(','):
+        workers, threads = (int(x) for x in combo.lower().split('x'))
+        workdir = tempfile.mkdtemp(prefix='edibes-bench-')
+        try:
+            db_path = os.path.join(workdir, 'data', 'leltar.db')
+            metrics_dir = os.path.join(workdir, 'metrics')
+            os.makedirs(os.path.dirname(db_path))
+            seed_database(db_path, args.products)
+
+            proc, url = start_server(workers, threads, free_port(), db_path, metrics_dir)
+            try:
+                load = run_load(url, args)
+            finally:
+                stop_server(proc)
+            summarize(combo, load, args.duration, lock_contention(metrics_dir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
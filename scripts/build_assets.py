@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Statikus fájlok buildje (lásd app/assets.py)
+
+1. A külső csomagok (VENDOR) letöltése a static/vendor könyvtárba
+2. Minden static/css, static/js és vendor fájl, valamint a bundle-ök (BUNDLES)
+   kiírása a static/dist könyvtárba tartalom hash-es névvel; CSS-ben a
+   hivatkozott fájlok (ikon fontok) url()-je a hash-es névre mutat
+3. Minifikálás: CSS beépítetten, JS az rjsmin csomaggal (ha telepítve van)
+4. Előtömörítés: .gz mindig, .br a brotli csomaggal (ha telepítve van)
+5. static/dist/manifest.json
+
+Használat (a projekt gyökeréből):
+    python scripts/build_assets.py              # a hiányzó külső csomagokat letölti
+    python scripts/build_assets.py --offline    # csak a meglévő static/vendor fájlokkal
+
+A Docker build a Dockerfile assets lépésében futtatja (a kész static/dist az
+alkalmazás és az nginx image-be is bekerül). Kézi telepítésnél frissítés után
+újra kell futtatni; a futó alkalmazás a manifestet induláskor olvassa be.
+"""
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+import urllib.request
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATIC = os.path.join(ROOT, 'static')
+
+# Az app csomag importja (adatbázis, Flask-Login...) nélkül, hogy a build egy
+# minimális Python környezetben is fusson
+_spec = importlib.util.spec_from_file_location('edibes_assets', os.path.join(ROOT, 'app', 'assets.py'))
+assets = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(assets)
+
+# Ezeket érdemes előtömöríteni (a woff/woff2 már tömörített)
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map')
+
+HASH_LENGTH = 12
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def fetch_vendor(offline):
+    for path, url in assets.VENDOR.items():
+        target = os.path.join(STATIC, path)
+        if os.path.exists(target):
+            continue
+        if offline:
+            sys.exit(f'Hiányzó külső csomag (--offline): static/{path}')
+        print(f'Letöltés: {url}')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with urllib.request.urlopen(url, timeout=60) as response:
+            data = response.read()
+        with open(target + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(target + '.tmp', target)
+
+
+def source_files():
+    """A build forrásai (static-on belüli útvonalak); a sw.js kimarad - állandó URL-en kell maradnia"""
+    paths = list(assets.VENDOR)
+    for directory in ('css', 'js'):
+        for name in sorted(os.listdir(os.path.join(STATIC, directory))):
+            if name.endswith(('.css', '.js')):
+                paths.append(f'{directory}/{name}')
+    # A CSS a fontokra hivatkozik, ezért azok kapnak először hash-es nevet
+    return sorted(paths, key=lambda path: path.endswith('.css'))
+
+
+def read_source(path):
+    with open(os.path.join(STATIC, path), 'rb') as f:
+        return f.read()
+
+
+def minify_css(text):
+    """Óvatos CSS minifikálás: megjegyzések és fölösleges szóközök (a ':' körül nem - szelektor is lehet)"""
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.strip()
+
+
+def rewrite_css_urls(text, source, output, files):
+    """url(...) hivatkozások a hash-es fájlokra, az output helyéhez képest relatívan"""
+    def replace(match):
+        url = match.group(2).strip()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path, _, fragment = url.partition('#')
+        path = path.split('?')[0]
+        resolved = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+        if resolved not in files:
+            print(f'  figyelem: {source}: ismeretlen hivatkozás {url}')
+            return match.group(0)
+        relative = posixpath.relpath(files[resolved], posixpath.dirname(output))
+        return f'url("{relative}{"#" + fragment if fragment else ""}")'
+    return CSS_URL.sub(replace, text)
+
+
+def transform(path, data, output, files):
+    """Forrás tartalma a dist-be írás előtt (CSS hivatkozások, minifikálás)"""
+    if path.endswith('.css'):
+        text = rewrite_css_urls(data.decode('utf-8'), path, output, files)
+        if not path.endswith('.min.css'):
+            text = minify_css(text)
+        return text.encode('utf-8')
+    if path.endswith('.js') and not path.endswith('.min.js') and rjsmin:
+        return rjsmin.jsmin(data.decode('utf-8')).encode('utf-8')
+    return data
+
+
+def hashed_name(path, data):
+    """dist/<könyvtár>/<név>.<hash>.<kiterjesztés>"""
+    stem, ext = posixpath.splitext(path)
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    return f'{assets.DIST_DIR}/{stem}.{digest}{ext}'
+
+
+def write_output(build_dir, name, data):
+    """Fájl és előtömörített változatai (csak ha ténylegesen kisebbek)"""
+    target = os.path.join(build_dir, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(data)
+    if not name.endswith(COMPRESSIBLE):
+        return
+    # mtime=0: azonos tartalomból azonos .gz (ismételhető build)
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(target + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def build():
+    build_dir = os.path.join(STATIC, assets.DIST_DIR + '.tmp')
+    shutil.rmtree(build_dir, ignore_errors=True)
+    # A kimenet útvonalai static/dist-hez képest íródnak, a tmp könyvtárba
+    def dist_path(name):
+        return name[len(assets.DIST_DIR) + 1:]
+
+    files = {}
+    for path in source_files():
+        # A hash a transzformált tartalomból: a CSS a hivatkozott fájlok hash-ét is tartalmazza
+        data = transform(path, read_source(path), f'{assets.DIST_DIR}/{path}', files)
+        files[path] = hashed_name(path, data)
+        write_output(build_dir, dist_path(files[path]), data)
+
+    bundles = {}
+    for bundle, sources in assets.BUNDLES.items():
+        output = f'{assets.DIST_DIR}/{bundle}'
+        parts = [transform(source, read_source(source), output, files) for source in sources]
+        separator = b'\n' if bundle.endswith('.css') else b';\n'
+        data = separator.join(part.rstrip() for part in parts) + b'\n'
+        bundles[bundle] = hashed_name(bundle, data)
+        write_output(build_dir, dist_path(bundles[bundle]), data)
+
+    # build: a kimenet azonosítója (a gyorsítótárazott HTML oldalak ETag-jébe kerül)
+    build_id = hashlib.sha256(json.dumps([files, bundles], sort_keys=True).encode()).hexdigest()[:HASH_LENGTH]
+    with open(os.path.join(build_dir, assets.MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump({'build': build_id, 'files': files, 'bundles': bundles}, f, indent=2, sort_keys=True)
+
+    # Csere egy lépésben (a régi dist csak utána törlődik)
+    dist_dir = os.path.join(STATIC, assets.DIST_DIR)
+    old_dir = dist_dir + '.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(dist_dir):
+        os.rename(dist_dir, old_dir)
+    os.rename(build_dir, dist_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return files, bundles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Statikus fájlok buildje (vendor, bundle, hash, előtömörítés)')
+    parser.add_argument('--offline', action='store_true', help='nem tölt le semmit, a static/vendor-nak teljesnek kell lennie')
+    args = parser.parse_args()
+
+    fetch_vendor(args.offline)
+    files, bundles = build()
+
+    if not rjsmin:
+        print('figyelem: rjsmin nincs telepítve, a JS fájlok minifikálás nélkül (csak tömörítve)')
+    if not brotli:
+        print('figyelem: brotli nincs telepítve, csak .gz változat készült')
+    for bundle, name in bundles.items():
+        size = os.path.getsize(os.path.join(STATIC, name))
+        print(f'{bundle:12} -> static/{name} ({size / 1024:.1f} KB)')
+    print(f'{len(files)} fájl, manifest: static/{assets.DIST_DIR}/{assets.MANIFEST_NAME}')
+
+
+if __name__ == '__main__':
+    main()
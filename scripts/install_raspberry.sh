@@ -75,7 +75,7 @@ WorkingDirectory=$APP_DIR
 Environment="PATH=$VENV_DIR/bin"
 Environment="SECRET_KEY=$SECRET_KEY"
 Environment="APP_PASSWORD=$APP_PASSWORD"
-ExecStart=$VENV_DIR/bin/gunicorn --workers 2 --bind 0.0.0.0:5000 wsgi:app
+ExecStart=$VENV_DIR/bin/gunicorn -c gunicorn.conf.py wsgi:app
 Restart=always
 RestartSec=5
 
@@ -94,8 +94,9 @@ echo -e "${GREEN}======================================${NC}"
 echo ""
 echo -e "Következő lépések:"
 echo -e "1. Másolja az alkalmazás fájljait ide: ${YELLOW}$APP_DIR${NC}"
-echo -e "2. Indítsa el a szolgáltatást: ${YELLOW}sudo systemctl start ${SERVICE_NAME}${NC}"
-echo -e "3. Nyissa meg böngészőben: ${YELLOW}http://$(hostname -I | awk '{print $1}'):5000${NC}"
+echo -e "2. Statikus fájlok buildje: ${YELLOW}cd $APP_DIR && $VENV_DIR/bin/python scripts/build_assets.py${NC}"
+echo -e "3. Indítsa el a szolgáltatást: ${YELLOW}sudo systemctl start ${SERVICE_NAME}${NC}"
+echo -e "4. Nyissa meg böngészőben: ${YELLOW}http://$(hostname -I | awk '{print $1}'):5000${NC}"
 echo ""
 echo -e "Hasznos parancsok:"
 echo -e "  Státusz:  ${YELLOW}sudo systemctl status ${SERVICE_NAME}${NC}"
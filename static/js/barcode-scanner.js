@@ -2,8 +2,18 @@
  * Barcode Scanner Module
  * Használja a natív Barcode Detection API-t ha elérhető (Chrome/Android),
  * egyébként fallback html5-qrcode-ra.
+ *
+ * Natív módban a dekódolás Web Workerben fut (barcode-worker.js): a kép közepének
+ * kivágott része (ROI) kicsinyítve kerül a detektorba. A következő képkocka csak az
+ * előző feldolgozása után jön, az ütem a dekódolási időhöz igazodik, és amíg az
+ * onDetected által visszaadott Promise (pl. termék keresés) fut, nincs új dekódolás.
  */
 
+// A worker URL-je a script tag data-worker attribútumából (hash-es név build után)
+const WORKER_URL = document.currentScript ? document.currentScript.dataset.worker : null;
+
+const BARCODE_FORMATS = ['ean_13', 'ean_8', 'code_128', 'code_39', 'code_93', 'upc_a', 'upc_e', 'itf', 'qr_code'];
+
 class BarcodeScanner {
     constructor(containerId, onDetected, options = {}) {
         this.containerId = containerId;
@@ -13,6 +23,10 @@ class BarcodeScanner {
             qrbox: { width: 280, height: 150 },
             aspectRatio: 1.777,
             focusMode: 'continuous',
+            // Natív módban a kép közepének ekkora része kerül dekódolásra (arány),
+            // legfeljebb decodeWidth pixel szélesre kicsinyítve
+            roi: { width: 0.8, height: 0.5 },
+            decodeWidth: 640,
             ...options
         };
         
@@ -21,7 +35,15 @@ class BarcodeScanner {
         this.videoElement = null;
         this.barcodeDetector = null;
         this.html5QrCode = null;
-        this.scanInterval = null;
+        this.worker = null;
+        this.scanActive = false;
+        this.scanTimer = null;
+        this.scanBusy = false;
+        this.frameId = 0;
+        this.pendingFrame = null;
+        this.decodeMs = 0;
+        this.paused = false;
+        this.lookupPending = false;
         this.lastDetected = null;
         this.lastDetectedTime = 0;
         this.debounceMs = 1500; // Ugyanazt a kódot 1.5mp-en belül ne olvassa újra
@@ -50,7 +72,8 @@ class BarcodeScanner {
     
     async startNative() {
         const container = document.getElementById(this.containerId);
-        container.innerHTML = '<video id="barcode-video" playsinline autoplay muted style="width:100%;border-radius:8px;"></video>';
+        container.innerHTML = '<div class="barcode-viewport" style="position:relative;overflow:hidden;border-radius:8px;">' +
+            '<video id="barcode-video" playsinline autoplay muted style="width:100%;display:block;"></video></div>';
         
         this.videoElement = document.getElementById('barcode-video');
         
@@ -86,43 +109,211 @@ class BarcodeScanner {
             };
         });
         
-        // Barcode Detector inicializálása
-        this.barcodeDetector = new BarcodeDetector({
-            formats: ['ean_13', 'ean_8', 'code_128', 'code_39', 'code_93', 'upc_a', 'upc_e', 'itf', 'qr_code']
+        // Dekódolás workerben (ROI + kicsinyítés), ha nem megy: a fő szálon a teljes képen
+        this.worker = await this.startWorker();
+        if (this.worker) {
+            this.showRoi();
+        } else {
+            this.barcodeDetector = new BarcodeDetector({ formats: BARCODE_FORMATS });
+        }
+        
+        // Folyamatos szkennelés: a következő képkocka csak az előző feldolgozása után
+        this.scanActive = true;
+        this.scheduleScan(0);
+    }
+    
+    /**
+     * Dekódoló worker indítása; null, ha a böngésző nem támogatja
+     * (Worker, createImageBitmap, a workerben BarcodeDetector és OffscreenCanvas kell)
+     */
+    async startWorker() {
+        if (!WORKER_URL || !('Worker' in window) || !('createImageBitmap' in window)) return null;
+        
+        let worker;
+        try {
+            worker = new Worker(WORKER_URL);
+        } catch (err) {
+            return null;
+        }
+        
+        const supported = await new Promise((resolve) => {
+            const timer = setTimeout(() => resolve(false), 3000);
+            worker.onmessage = (event) => {
+                if (event.data.type !== 'ready') return;
+                clearTimeout(timer);
+                resolve(event.data.supported);
+            };
+            worker.onerror = () => {
+                clearTimeout(timer);
+                resolve(false);
+            };
+            worker.postMessage({ type: 'init', formats: BARCODE_FORMATS });
         });
         
-        // Folyamatos szkennelés
-        this.scanInterval = setInterval(() => this.detectFrame(), 1000 / this.options.fps);
+        if (!supported) {
+            worker.terminate();
+            return null;
+        }
+        
+        worker.onmessage = (event) => {
+            const pending = this.pendingFrame;
+            if (event.data.type === 'result' && pending && pending.id === event.data.id) {
+                this.pendingFrame = null;
+                pending.resolve(event.data.barcodes);
+            }
+        };
+        // Worker hiba futás közben: tovább a fő szálon
+        worker.onerror = () => {
+            worker.terminate();
+            this.worker = null;
+            this.barcodeDetector = new BarcodeDetector({ formats: BARCODE_FORMATS });
+            this.resolvePendingFrame();
+        };
+        return worker;
     }
     
-    async detectFrame() {
-        if (!this.videoElement || !this.barcodeDetector) return;
+    // Az olvasási terület (ROI) jelölése a videón
+    showRoi() {
+        const roi = this.options.roi;
+        const frame = document.createElement('div');
+        frame.style.cssText = 'position:absolute;pointer-events:none;border:2px solid rgba(255,255,255,.85);' +
+            'border-radius:8px;box-shadow:0 0 0 9999px rgba(0,0,0,.3);' +
+            `left:${(1 - roi.width) * 50}%;top:${(1 - roi.height) * 50}%;` +
+            `width:${roi.width * 100}%;height:${roi.height * 100}%;`;
+        this.videoElement.parentElement.appendChild(frame);
+    }
+    
+    scheduleScan(delay) {
+        this.scanTimer = setTimeout(() => this.scanLoop(), delay);
+    }
+    
+    async scanLoop() {
+        this.scanTimer = null;
+        if (!this.scanActive || this.paused) return;
+        
+        // Háttérbe tett oldal, vagy még nincs képkocka: nem dekódolunk
+        if (document.hidden || this.videoElement.readyState < 2) {
+            this.scheduleScan(500);
+            return;
+        }
         
+        this.scanBusy = true;
         try {
-            const barcodes = await this.barcodeDetector.detect(this.videoElement);
+            const started = performance.now();
+            const barcodes = await this.detectFrame();
+            const elapsed = performance.now() - started;
+            this.decodeMs = this.decodeMs ? this.decodeMs * 0.8 + elapsed * 0.2 : elapsed;
             
             if (barcodes.length > 0) {
-                const barcode = barcodes[0];
-                const now = Date.now();
-                
-                // Debounce - ne olvassa újra ugyanazt a kódot
-                if (barcode.rawValue !== this.lastDetected || 
-                    now - this.lastDetectedTime > this.debounceMs) {
-                    
-                    this.lastDetected = barcode.rawValue;
-                    this.lastDetectedTime = now;
-                    
-                    // Vibráció visszajelzés (ha támogatott)
-                    if ('vibrate' in navigator) {
-                        navigator.vibrate(100);
-                    }
-                    
-                    console.log('Barcode detected:', barcode.rawValue, barcode.format);
-                    this.onDetected(barcode.rawValue, barcode.format);
-                }
+                await this.handleDetected(barcodes[0].rawValue, barcodes[0].format);
+            }
+        } finally {
+            this.scanBusy = false;
+        }
+        
+        if (this.scanActive && !this.paused && !this.scanTimer) {
+            this.scheduleScan(this.nextScanDelay());
+        }
+    }
+    
+    /**
+     * Adaptív képkocka ütem: legfeljebb options.fps, és a dekódolás az idő
+     * legfeljebb felét foglalja (lassú telefonon ritkábban, kevesebb melegedés)
+     */
+    nextScanDelay() {
+        return Math.max(1000 / this.options.fps - this.decodeMs, this.decodeMs);
+    }
+    
+    // Egy képkocka dekódolása: [{rawValue, format}]
+    async detectFrame() {
+        if (!this.videoElement) return [];
+        
+        try {
+            if (this.worker) {
+                return await this.detectInWorker();
             }
+            return await this.barcodeDetector.detect(this.videoElement);
         } catch (err) {
             // Csendben hagyjuk, a következő frame-en újra próbálkozunk
+            return [];
+        }
+    }
+    
+    async detectInWorker() {
+        const video = this.videoElement;
+        const roi = this.options.roi;
+        const width = Math.round(video.videoWidth * roi.width);
+        const height = Math.round(video.videoHeight * roi.height);
+        const x = Math.round((video.videoWidth - width) / 2);
+        const y = Math.round((video.videoHeight - height) / 2);
+        
+        // Csak a kivágott rész kerül át (a bitmap átadásra kerül, nem másolódik)
+        const frame = await createImageBitmap(video, x, y, width, height);
+        if (!this.worker) {
+            frame.close();
+            return [];
+        }
+        
+        const id = ++this.frameId;
+        return new Promise((resolve) => {
+            this.pendingFrame = { id, resolve };
+            this.worker.postMessage({ type: 'detect', id, frame, width: this.options.decodeWidth }, [frame]);
+        });
+    }
+    
+    resolvePendingFrame() {
+        if (this.pendingFrame) {
+            this.pendingFrame.resolve([]);
+            this.pendingFrame = null;
+        }
+    }
+    
+    /**
+     * Beolvasott kód továbbítása (debounce után). Ha az onDetected Promise-t ad
+     * vissza (pl. termék keresés), addig nem dekódolunk újabb képkockát.
+     */
+    async handleDetected(rawValue, format) {
+        const now = Date.now();
+        
+        // Debounce - ne olvassa újra ugyanazt a kódot
+        if (rawValue === this.lastDetected && now - this.lastDetectedTime <= this.debounceMs) return;
+        
+        this.lastDetected = rawValue;
+        this.lastDetectedTime = now;
+        
+        // Vibráció visszajelzés (ha támogatott)
+        if ('vibrate' in navigator) {
+            navigator.vibrate(100);
+        }
+        
+        console.log('Barcode detected:', rawValue, format);
+        this.lookupPending = true;
+        try {
+            await this.onDetected(rawValue, format);
+        } catch (err) {
+            console.error('Beolvasás feldolgozási hiba:', err);
+        } finally {
+            this.lookupPending = false;
+            // A feldolgozás ideje nem számít bele a debounce-ba
+            this.lastDetectedTime = Date.now();
+        }
+    }
+    
+    // Szkennelés szüneteltetése (a kamera megy tovább), pl. amíg egy párbeszédablak nyitva van
+    pause() {
+        this.paused = true;
+        if (this.scanTimer) {
+            clearTimeout(this.scanTimer);
+            this.scanTimer = null;
+        }
+    }
+    
+    resume() {
+        if (!this.paused) return;
+        this.paused = false;
+        // Ha épp dekódol, a futó kör maga ütemezi a következőt
+        if (this.scanActive && !this.scanTimer && !this.scanBusy) {
+            this.scheduleScan(0);
         }
     }
     
@@ -153,21 +344,9 @@ class BarcodeScanner {
             { facingMode: "environment" },
             config,
             (decodedText, decodedResult) => {
-                const now = Date.now();
-                
-                // Debounce
-                if (decodedText !== this.lastDetected || 
-                    now - this.lastDetectedTime > this.debounceMs) {
-                    
-                    this.lastDetected = decodedText;
-                    this.lastDetectedTime = now;
-                    
-                    if ('vibrate' in navigator) {
-                        navigator.vibrate(100);
-                    }
-                    
-                    this.onDetected(decodedText, decodedResult?.result?.format?.formatName);
-                }
+                // Szüneteltetve, vagy az előző kód feldolgozása még tart
+                if (this.paused || this.lookupPending) return;
+                this.handleDetected(decodedText, decodedResult?.result?.format?.formatName);
             },
             (errorMessage) => {
                 // Csendben hagyjuk a sikertelen olvasásokat
@@ -180,10 +359,17 @@ class BarcodeScanner {
         
         try {
             if (this.useNativeAPI) {
-                if (this.scanInterval) {
-                    clearInterval(this.scanInterval);
-                    this.scanInterval = null;
+                this.scanActive = false;
+                if (this.scanTimer) {
+                    clearTimeout(this.scanTimer);
+                    this.scanTimer = null;
+                }
+                this.resolvePendingFrame();
+                if (this.worker) {
+                    this.worker.terminate();
+                    this.worker = null;
                 }
+                this.barcodeDetector = null;
                 if (this.stream) {
                     this.stream.getTracks().forEach(track => track.stop());
                     this.stream = null;
@@ -199,6 +385,7 @@ class BarcodeScanner {
         }
         
         this.isScanning = false;
+        this.paused = false;
         this.lastDetected = null;
         this.lastDetectedTime = 0;
     }
@@ -0,0 +1,69 @@
+/**
+ * Vonalkód dekódolás Web Workerben (lásd barcode-scanner.js)
+ * A fő szál a kamera képének kivágott részét (ROI) küldi ImageBitmap-ként;
+ * itt egy OffscreenCanvas-ra kicsinyítjük, és a BarcodeDetector ezen fut.
+ * Így a dekódolás nem akasztja meg az oldalt, és kevesebb pixelt kell feldolgozni.
+ *
+ * Üzenetek:
+ *   -> {type: 'init', formats}            <- {type: 'ready', supported}
+ *   -> {type: 'detect', id, frame, width} <- {type: 'result', id, barcodes, ms}
+ */
+let detector = null;
+let canvas = null;
+let context = null;
+
+async function init(formats) {
+    if (typeof BarcodeDetector === 'undefined' || typeof OffscreenCanvas === 'undefined') {
+        return false;
+    }
+    try {
+        const supported = await BarcodeDetector.getSupportedFormats();
+        const usable = formats.filter(format => supported.includes(format));
+        if (!usable.length) return false;
+        detector = new BarcodeDetector({ formats: usable });
+        return true;
+    } catch (err) {
+        return false;
+    }
+}
+
+// Kicsinyítés a megadott szélességre (nagyításra nincs szükség)
+function scaled(frame, width) {
+    const scale = Math.min(1, width / frame.width);
+    const w = Math.round(frame.width * scale);
+    const h = Math.round(frame.height * scale);
+
+    if (!canvas) {
+        canvas = new OffscreenCanvas(w, h);
+        context = canvas.getContext('2d', { alpha: false, willReadFrequently: true });
+    } else if (canvas.width !== w || canvas.height !== h) {
+        canvas.width = w;
+        canvas.height = h;
+    }
+    context.drawImage(frame, 0, 0, w, h);
+    return canvas;
+}
+
+async function detect(frame, width) {
+    try {
+        const barcodes = await detector.detect(scaled(frame, width));
+        return barcodes.map(barcode => ({ rawValue: barcode.rawValue, format: barcode.format }));
+    } catch (err) {
+        // Sikertelen képkocka: a következővel újra próbálkozunk
+        return [];
+    } finally {
+        frame.close();
+    }
+}
+
+self.onmessage = async (event) => {
+    const message = event.data;
+
+    if (message.type === 'init') {
+        self.postMessage({ type: 'ready', supported: await init(message.formats) });
+    } else if (message.type === 'detect') {
+        const started = performance.now();
+        const barcodes = await detect(message.frame, message.width);
+        self.postMessage({ type: 'result', id: message.id, barcodes, ms: performance.now() - started });
+    }
+};
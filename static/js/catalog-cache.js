@@ -0,0 +1,88 @@
+/**
+ * Helyi katalógus cache (localStorage)
+ * A törzsadatokat (termékek, helyszínek, ...) egyszer töltjük le teljesen,
+ * utána csak a változásokat kérjük: /api/catalog/<kind>?since=<verzió>.
+ * Változatlan katalógus esetén a szerver 304-et ad (pár száz bájt).
+ * Térerő nélkül a legutóbb letöltött példány használható.
+ */
+
+const CatalogCache = {
+    STORAGE_PREFIX: 'edibes-catalog-',
+
+    _read(kind) {
+        try {
+            return JSON.parse(localStorage.getItem(this.STORAGE_PREFIX + kind));
+        } catch (e) {
+            return null;
+        }
+    },
+
+    _write(kind, entry) {
+        try {
+            localStorage.setItem(this.STORAGE_PREFIX + kind, JSON.stringify(entry));
+        } catch (e) {
+            // Betelt a tárhely: a következő betöltés teljes listát kér
+            localStorage.removeItem(this.STORAGE_PREFIX + kind);
+        }
+    },
+
+    /**
+     * Katalógus frissítése és lekérése
+     * @param {string} kind - products | locations | categories | units
+     * @returns {Promise<Object[]>} - aktív (nem törölt) sorok
+     */
+    get(kind) {
+        const cached = this._read(kind);
+        const headers = {};
+        let url = `/api/catalog/${kind}`;
+        if (cached) {
+            url += `?since=${cached.version}`;
+            if (cached.etag) headers['If-None-Match'] = cached.etag;
+        }
+
+        return fetch(url, { headers, cache: 'no-store', credentials: 'same-origin' })
+            .then(response => {
+                if (response.status === 304) return cached.items;
+
+                const contentType = response.headers.get('Content-Type') || '';
+                if (!response.ok || !contentType.includes('application/json')) {
+                    throw new Error(`Katalógus hiba (HTTP ${response.status})`);
+                }
+
+                return response.json().then(data => {
+                    const byId = new Map(data.full || !cached ? [] : cached.items.map(item => [item.id, item]));
+                    data.items.forEach(item => {
+                        if (item.is_deleted) {
+                            byId.delete(item.id);
+                        } else {
+                            byId.set(item.id, item);
+                        }
+                    });
+                    const items = Array.from(byId.values());
+                    this._write(kind, { version: data.version, etag: response.headers.get('ETag'), items });
+                    return items;
+                });
+            })
+            .catch(err => {
+                // Offline vagy lejárt munkamenet: a legutóbbi helyi példány
+                if (cached) return cached.items;
+                throw err;
+            });
+    },
+
+    /**
+     * Termékek vonalkód szerinti indexe
+     * @returns {Promise<Map<string, Object>>}
+     */
+    productsByBarcode() {
+        return this.get('products').then(items => {
+            const index = new Map();
+            items.forEach(item => {
+                if (item.barcode) index.set(item.barcode, item);
+            });
+            return index;
+        });
+    }
+};
+
+window.CatalogCache = CatalogCache;
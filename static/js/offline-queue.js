@@ -0,0 +1,241 @@
+/**
+ * Offline mozgás sor (IndexedDB)
+ * Terepen (pl. pincében lévő automatánál) nincs térerő: a mozgások először
+ * a böngésző IndexedDB-jébe kerülnek, és visszakapcsolódáskor egyetlen
+ * kéréssel szinkronizálódnak a /transfer/api/sync végponton keresztül.
+ *
+ * Az oldal és a service worker (sw.js) is ezt a fájlt használja, ezért
+ * nem hivatkozhat a window objektumra.
+ */
+
+(function (scope) {
+    const DB_NAME = 'edibes-offline';
+    const DB_VERSION = 1;
+    const PENDING_STORE = 'pending';     // Szinkronra váró mozgások
+    const REJECTED_STORE = 'rejected';   // Szerver által elutasított tételek (megjelenítésre vár)
+    const SYNC_URL = '/transfer/api/sync';
+    const SYNC_TAG = 'edibes-sync';
+    // A szerver SYNC_MAX_BATCH értékénél nem lehet nagyobb
+    const BATCH_SIZE = 200;
+
+    let flushing = null;
+
+    function openDb() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, DB_VERSION);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                if (!db.objectStoreNames.contains(PENDING_STORE)) {
+                    db.createObjectStore(PENDING_STORE, { keyPath: 'client_id' });
+                }
+                if (!db.objectStoreNames.contains(REJECTED_STORE)) {
+                    db.createObjectStore(REJECTED_STORE, { keyPath: 'client_id' });
+                }
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    /**
+     * Tranzakció futtatása; a callback visszatérési értéke (IDBRequest esetén
+     * annak eredménye) a tranzakció lezárulásakor kerül feloldásra
+     */
+    function withStores(storeNames, mode, callback) {
+        return openDb().then(db => new Promise((resolve, reject) => {
+            const tx = db.transaction(storeNames, mode);
+            const result = callback(tx);
+            tx.oncomplete = () => {
+                db.close();
+                resolve(result instanceof IDBRequest ? result.result : result);
+            };
+            tx.onerror = () => {
+                db.close();
+                reject(tx.error);
+            };
+        }));
+    }
+
+    function newClientId() {
+        if (scope.crypto && scope.crypto.randomUUID) {
+            return scope.crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+    }
+
+    function getAll(storeName) {
+        return withStores([storeName], 'readonly', tx => tx.objectStore(storeName).getAll());
+    }
+
+    /**
+     * Mozgás felvétele a sorba
+     * @param {Object} movement - {type, product_id, source_location_id, target_location_id, quantity, note, label}
+     */
+    function add(movement) {
+        const item = Object.assign({}, movement, {
+            client_id: newClientId(),
+            client_ts: new Date().toISOString()
+        });
+        return withStores([PENDING_STORE], 'readwrite', tx => {
+            tx.objectStore(PENDING_STORE).put(item);
+        }).then(() => {
+            requestBackgroundSync();
+            return item;
+        });
+    }
+
+    function pending() {
+        return getAll(PENDING_STORE).then(items =>
+            items.sort((a, b) => a.client_ts.localeCompare(b.client_ts)));
+    }
+
+    function count() {
+        return withStores([PENDING_STORE], 'readonly', tx => tx.objectStore(PENDING_STORE).count());
+    }
+
+    /**
+     * Az elutasított tételek kiolvasása és törlése (egyszer jelenítjük meg őket)
+     */
+    function takeRejected() {
+        return withStores([REJECTED_STORE], 'readwrite', tx => {
+            const store = tx.objectStore(REJECTED_STORE);
+            const request = store.getAll();
+            store.clear();
+            return request;
+        });
+    }
+
+    /**
+     * Feldolgozott tételek eltávolítása; az ütköző / hibás tételek az elutasított tárba kerülnek
+     */
+    function settle(items, results) {
+        const byId = new Map(items.map(item => [item.client_id, item]));
+        return withStores([PENDING_STORE, REJECTED_STORE], 'readwrite', tx => {
+            const pendingStore = tx.objectStore(PENDING_STORE);
+            const rejectedStore = tx.objectStore(REJECTED_STORE);
+            results.forEach(result => {
+                const item = byId.get(result.client_id);
+                if (!item) return;
+                pendingStore.delete(result.client_id);
+                const status = result.status === 'duplicate' ? result.original_status : result.status;
+                if (status === 'conflict' || status === 'invalid') {
+                    rejectedStore.put(Object.assign({}, item, { error: result.error }));
+                }
+            });
+        });
+    }
+
+    function postBatch(items) {
+        return fetch(SYNC_URL, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ movements: items })
+        }).then(response => {
+            // Lejárt munkamenet esetén a bejelentkező oldalra irányít (HTML) - a sor megmarad
+            const contentType = response.headers.get('Content-Type') || '';
+            if (!response.ok || !contentType.includes('application/json')) {
+                throw new Error(`Szinkron hiba (HTTP ${response.status})`);
+            }
+            return response.json();
+        }).then(data => {
+            if (!data.success) throw new Error(data.error || 'Szinkron hiba');
+            return data.results;
+        });
+    }
+
+    /**
+     * A teljes sor elküldése BATCH_SIZE méretű kötegekben
+     * Visszatér: a szerver tételenkénti eredményei, a sor tételeivel kiegészítve
+     */
+    function flush() {
+        if (flushing) return flushing;
+
+        flushing = pending().then(async items => {
+            const results = [];
+            for (let i = 0; i < items.length; i += BATCH_SIZE) {
+                const batch = items.slice(i, i + BATCH_SIZE);
+                const batchResults = await postBatch(batch);
+                await settle(batch, batchResults);
+                const byId = new Map(batch.map(item => [item.client_id, item]));
+                batchResults.forEach(result => {
+                    results.push(Object.assign({ item: byId.get(result.client_id) }, result));
+                });
+            }
+            return results;
+        }).finally(() => {
+            flushing = null;
+        });
+        return flushing;
+    }
+
+    /**
+     * Háttér szinkron kérése a service workertől (ha a böngésző támogatja)
+     * Így a sor akkor is kiürül, ha a sofőr már bezárta az oldalt
+     */
+    function requestBackgroundSync() {
+        if (!scope.navigator || !('serviceWorker' in scope.navigator) || scope.registration) return;
+        scope.navigator.serviceWorker.ready
+            .then(registration => registration.sync && registration.sync.register(SYNC_TAG))
+            .catch(() => {});
+    }
+
+    function registerServiceWorker() {
+        if (!('serviceWorker' in scope.navigator)) return;
+        scope.navigator.serviceWorker.register('/transfer/sw.js').catch(err => {
+            console.warn('Service worker regisztráció sikertelen:', err);
+        });
+    }
+
+    /**
+     * Oldal bekötése: állapotjelző, szinkron visszakapcsolódáskor és a service worker üzeneteire
+     * @param {Object} options - {statusElement, onResults(results), onRejected(items)}
+     * Visszatér: {sync, refreshStatus}
+     */
+    function bindPage(options) {
+        const refreshStatus = () => count().then(n => {
+            const el = options.statusElement;
+            if (!el) return;
+            el.classList.toggle('d-none', n === 0);
+            el.querySelector('.offline-count').textContent = n;
+        });
+
+        const reportRejected = () => takeRejected().then(items => {
+            if (items.length && options.onRejected) options.onRejected(items);
+        });
+
+        const sync = () => flush()
+            .then(results => {
+                if (results.length && options.onResults) options.onResults(results);
+            })
+            .catch(() => {
+                // Nincs hálózat vagy lejárt a munkamenet: a tételek a sorban maradnak
+            })
+            .then(() => Promise.all([refreshStatus(), reportRejected()]));
+
+        scope.addEventListener('online', sync);
+        if ('serviceWorker' in scope.navigator) {
+            scope.navigator.serviceWorker.addEventListener('message', event => {
+                if (!event.data || event.data.type !== 'offline-sync') return;
+                if (event.data.results.length && options.onResults) options.onResults(event.data.results);
+                refreshStatus();
+                reportRejected();
+            });
+        }
+
+        registerServiceWorker();
+        sync();
+        return { sync, refreshStatus };
+    }
+
+    scope.OfflineQueue = {
+        SYNC_TAG,
+        add,
+        pending,
+        count,
+        flush,
+        takeRejected,
+        registerServiceWorker,
+        bindPage
+    };
+})(self);
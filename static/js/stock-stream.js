@@ -0,0 +1,50 @@
+/**
+ * Élő készletfrissítés (Server-Sent Events)
+ * A szerver minden készletváltozásról kompakt eseményt küld:
+ * {p: termék ID, l: helyszín ID, q: új mennyiség}
+ * Így a nyitott mobil képernyők újratöltés nélkül frissülnek.
+ */
+
+class StockStream {
+    /**
+     * @param {number[]} locationIds - Figyelt helyszínek
+     * @param {number} lastEventId - Az oldal renderelésekori utolsó esemény (kimaradt események visszajátszása)
+     * @param {Function} onUpdate - Hívás minden eseménynél: (productId, locationId, quantity)
+     */
+    constructor(locationIds, lastEventId, onUpdate) {
+        this.locationIds = locationIds.filter(id => id);
+        this.lastEventId = lastEventId || 0;
+        this.onUpdate = onUpdate;
+        this.source = null;
+    }
+
+    start() {
+        if (!('EventSource' in window) || this.locationIds.length === 0) return;
+
+        // A böngésző újracsatlakozáskor magától küldi a Last-Event-ID fejlécet,
+        // a last_id paraméter csak az első kapcsolatnál számít
+        const url = `/transfer/api/stock-stream?locations=${this.locationIds.join(',')}&last_id=${this.lastEventId}`;
+        this.source = new EventSource(url);
+
+        this.source.addEventListener('stock', (e) => {
+            const data = JSON.parse(e.data);
+            this.lastEventId = parseInt(e.lastEventId) || this.lastEventId;
+            this.onUpdate(data.p, data.l, data.q);
+        });
+
+        // A szerver már nem tudja visszajátszani a kimaradt eseményeket: teljes frissítés
+        this.source.addEventListener('reset', () => {
+            this.stop();
+            window.location.reload();
+        });
+    }
+
+    stop() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+    }
+}
+
+window.StockStream = StockStream;
@@ -0,0 +1,166 @@
+/**
+ * Service worker - terepi (mobil) oldalak
+ * - App shell: a bundle-ök, az ikon font és a terepi scriptek telepítéskor előre
+ *   cache-be kerülnek; a hash-es (dist) fájlok cache-first (nem kell újraellenőrizni),
+ *   build nélkül a forrásfájlok stale-while-revalidate
+ * - Terepi oldalak (HTML): hálózat-először rövid időkorláttal, utána a cache-elt példány
+ *   (a szerver ETag-et ad, így a hálózati kérés változatlan oldalnál csak 304)
+ * - Katalógus JSON: stale-while-revalidate
+ * - A szinkronra váró mozgásokat háttérben küldi el (Background Sync)
+ *
+ * A konfigurációt (SW_CONFIG) a /transfer/sw.js route fűzi a fájl elé: verzió
+ * (APP_VERSION + statikus build) és az előre cache-elendő URL-ek. Új verziónál a
+ * böngésző eltérő workert kap, az új cache-be tölt, aktiváláskor a régieket törli.
+ */
+const CONFIG = self.SW_CONFIG || { version: 'dev', offlineQueue: '/static/js/offline-queue.js', precache: [] };
+
+importScripts(CONFIG.offlineQueue);
+
+const SHELL_CACHE = `edibes-shell-${CONFIG.version}`;
+const RUNTIME_CACHE = `edibes-runtime-${CONFIG.version}`;
+
+// Terepi oldalak: pontos útvonal, vagy '/'-re végződő előtag
+const FIELD_PAGES = ['/transfer/car-to-vending', '/transfer/car-consumption', '/transfer/quick/'];
+
+// Ezeket telepítéskor is letöltjük (ha be van jelentkezve), hogy az első offline megnyitás is működjön
+const PRECACHE_PAGES = ['/transfer/car-to-vending', '/transfer/car-consumption'];
+
+// Katalógus adatok (ritkán változnak, a kliens delta protokollal frissít)
+const CATALOG_PATHS = ['/api/catalog/', '/locations/api/list'];
+
+// Ennyi ideig várunk a hálózatra, mielőtt a cache-elt oldalt adjuk (gyenge térerő)
+const NETWORK_TIMEOUT_MS = 3000;
+
+function isFieldPage(pathname) {
+    return FIELD_PAGES.some(page => page.endsWith('/') ? pathname.startsWith(page) : pathname === page);
+}
+
+// Átirányítást (pl. lejárt munkamenet -> bejelentkezés) nem cache-elünk
+function cacheable(response) {
+    return response.ok && !response.redirected;
+}
+
+function precachePages() {
+    return caches.open(RUNTIME_CACHE).then(cache => Promise.all(PRECACHE_PAGES.map(url =>
+        fetch(url, { credentials: 'same-origin' })
+            .then(response => cacheable(response) ? cache.put(url, response) : null)
+            .catch(() => {})
+    )));
+}
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then(cache => cache.addAll(CONFIG.precache))
+            .then(precachePages)
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    const current = [SHELL_CACHE, RUNTIME_CACHE];
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys
+                .filter(key => key.startsWith('edibes-') && !current.includes(key))
+                .map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+function notifyClients(message) {
+    return self.clients.matchAll({ includeUncontrolled: true }).then(clients => {
+        clients.forEach(client => client.postMessage(message));
+    });
+}
+
+self.addEventListener('sync', event => {
+    if (event.tag !== OfflineQueue.SYNC_TAG) return;
+    // Hiba esetén a böngésző később újrapróbálja
+    event.waitUntil(
+        OfflineQueue.flush().then(results => notifyClients({ type: 'offline-sync', results }))
+    );
+});
+
+function putRuntime(request, response) {
+    const copy = response.clone();
+    caches.open(RUNTIME_CACHE).then(cache => cache.put(request, copy));
+}
+
+function networkFirst(request) {
+    const fromCache = () => caches.open(RUNTIME_CACHE).then(cache =>
+        cache.match(request).then(cached => cached || cache.match(request, { ignoreSearch: true })));
+
+    const network = fetch(request).then(response => {
+        if (cacheable(response)) putRuntime(request, response);
+        return response;
+    });
+
+    return new Promise(resolve => {
+        let settled = false;
+        const finish = response => {
+            if (!settled && response) {
+                settled = true;
+                resolve(response);
+            }
+        };
+        // Lassú hálózat: a cache-elt oldal azonnal, a hálózati válasz a következő megnyitásra frissít
+        const timer = setTimeout(() => fromCache().then(finish), NETWORK_TIMEOUT_MS);
+        network
+            .then(response => {
+                clearTimeout(timer);
+                finish(response);
+            })
+            .catch(() => {
+                clearTimeout(timer);
+                fromCache().then(cached => finish(cached || Response.error()));
+            });
+    });
+}
+
+function cacheFirst(request) {
+    return caches.match(request).then(cached => cached || fetch(request).then(response => {
+        if (response.ok) putRuntime(request, response);
+        return response;
+    }));
+}
+
+// A cache-elt példány (shell vagy runtime) azonnal, a hálózati válasz a runtime cache-be
+function staleWhileRevalidate(request) {
+    return caches.match(request).then(cached => {
+        const network = fetch(request).then(response => {
+            if (cacheable(response) || response.type === 'opaque') putRuntime(request, response);
+            return response;
+        });
+        if (cached) {
+            network.catch(() => {});
+            return cached;
+        }
+        return network;
+    });
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    if (url.origin === self.location.origin) {
+        if (request.mode === 'navigate') {
+            if (isFieldPage(url.pathname)) event.respondWith(networkFirst(request));
+        } else if (url.pathname.startsWith('/static/dist/')) {
+            // Hash-es név: a tartalom sosem változik ezen az URL-en
+            event.respondWith(cacheFirst(request));
+        } else if (url.pathname.startsWith('/static/')) {
+            event.respondWith(staleWhileRevalidate(request));
+        } else if (CATALOG_PATHS.some(path => url.pathname.startsWith(path))) {
+            event.respondWith(staleWhileRevalidate(request));
+        }
+        return;
+    }
+
+    // CDN (build nélküli fejlesztői mód) - offline is kell az oldal megjelenítéséhez
+    if (request.destination === 'style' || request.destination === 'script' || request.destination === 'font') {
+        event.respondWith(staleWhileRevalidate(request));
+    }
+});